@@ -0,0 +1,113 @@
+import os
+import json
+import uuid
+import threading
+
+class CheckpointStore(object):
+    """
+    In-memory store of crawl checkpoints, keyed by string
+
+    Checkpoints are plain dicts which could be serialized to JSON.
+    Ids of records already returned grow with the crawl, so they are appended to the key instead of saved in the checkpoint.
+    Subclass it and override load(), save(), delete(), loadIds() and appendIds() to keep checkpoints elsewhere.
+    """
+    def __init__(self, *args, **kwargs):
+        self._lock = threading.Lock()
+        self._checkpoints = {}
+        self._ids = {}
+
+    def load(self, key):
+        """
+        Out:
+            the saved checkpoint, None if there is no checkpoint of key
+        """
+        with self._lock:
+            checkpoint = self._checkpoints.get(key, None)
+            return json.loads(checkpoint) if checkpoint else None
+
+    def save(self, key, checkpoint):
+        with self._lock:
+            self._checkpoints[key] = json.dumps(checkpoint)
+
+    def delete(self, key):
+        """
+        Delete the checkpoint of key and its ids
+        """
+        with self._lock:
+            self._checkpoints.pop(key, None)
+            self._ids.pop(key, None)
+
+    def loadIds(self, key):
+        """
+        Out:
+            list of ids appended to key, empty if there is none
+        """
+        with self._lock:
+            return list(self._ids.get(key, []))
+
+    def appendIds(self, key, ids):
+        with self._lock:
+            self._ids.setdefault(key, []).extend(ids)
+
+class FileCheckpointStore(CheckpointStore):
+    """
+    Store every checkpoint as a JSON file in a folder, so that a crawl could be resumed by another process
+    """
+    def __init__(self, *args, **kwargs):
+        """
+        Constructor of FileCheckpointStore
+
+        In:
+            folder              --  folder to store checkpoint files
+
+        """
+        super(FileCheckpointStore, self).__init__(*args, **kwargs)
+        if 'folder' not in kwargs:
+            raise ValueError('Invalid parameters.')
+        self._folder = kwargs['folder']
+        if not os.path.isdir(self._folder):
+            os.makedirs(self._folder)
+
+    def _filePath(self, key):
+        return os.path.join(self._folder, '{0}.json'.format(key.replace(os.sep, '_')))
+
+    def _idsPath(self, key):
+        return os.path.join(self._folder, '{0}.ids'.format(key.replace(os.sep, '_')))
+
+    def load(self, key):
+        try:
+            with open(self._filePath(key), 'r') as fp:
+                return json.load(fp)
+        except IOError:
+            return None
+        except ValueError:
+            # Broken checkpoint is regarded as no checkpoint
+            return None
+
+    def save(self, key, checkpoint):
+        # Write to another file then rename, so that a crash never leaves a truncated checkpoint
+        filePath = self._filePath(key)
+        tmpPath = '{0}.{1}.tmp'.format(filePath, uuid.uuid1())
+        with open(tmpPath, 'w') as fp:
+            json.dump(checkpoint, fp)
+        os.rename(tmpPath, filePath)
+
+    def delete(self, key):
+        for path in (self._filePath(key), self._idsPath(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def loadIds(self, key):
+        try:
+            with open(self._idsPath(key), 'r') as fp:
+                # A line cut by a crash is not a complete id
+                return [line[:-1] for line in fp if line.endswith('\n')]
+        except IOError:
+            return []
+
+    def appendIds(self, key, ids):
+        # One id a line, so that every page only writes its own ids
+        with open(self._idsPath(key), 'a') as fp:
+            fp.write(''.join('{0}\n'.format(_id) for _id in ids))
@@ -0,0 +1,176 @@
+import time
+import sqlite3
+import threading
+
+class DiskCache(object):
+    """
+    HTTP response cache in a sqlite file, which survives across runs and processes
+
+    Every entry belongs to an endpoint, e.g. 'photo' or 'album', whose TTL decides how long the entry is fresh.
+    Stale entries are kept with their ETag, so that callers can revalidate them with a conditional request
+    and call revalidated() on 304 Not Modified instead of storing the body again.
+    The total size of bodies is bounded, the least recently used entries are evicted first.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            endpoint TEXT NOT NULL,
+            body BLOB NOT NULL,
+            etag TEXT,
+            storedTime REAL NOT NULL,
+            accessTime REAL NOT NULL,
+            size INTEGER NOT NULL
+        )
+    """
+    # Eviction frees space down to this fraction of maxSize, so that it does not run on every store
+    EVICTION_RATIO = 0.9
+
+    def __init__(self, *args, **kwargs):
+        """
+        Constructor of DiskCache
+
+        In:
+            path                --  path of the sqlite file, created if not exists
+            maxSize             --  maximum total bytes of cached bodies *optional* default is 64MB
+            ttls                --  dict of endpoint to seconds an entry stays fresh *optional*
+            defaultTtl          --  seconds for endpoints not in ttls *optional* default is 3600
+
+        """
+        if 'path' not in kwargs:
+            raise ValueError('Invalid parameters.')
+        self._path = kwargs['path']
+        self._maxSize = kwargs.get('maxSize', 64 * 1024 * 1024)
+        self._ttls = dict(kwargs.get('ttls', None) or {})
+        self._defaultTtl = kwargs.get('defaultTtl', 3600)
+        self._lock = threading.Lock()
+        # Handlers look up from several threads, so one connection is shared under the lock
+        self._conn = sqlite3.connect(self._path, check_same_thread=False)
+        self._conn.text_factory = str
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(self.SCHEMA)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entriesAccessTime ON entries (accessTime)')
+        self._conn.commit()
+        self._size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        self.hits = 0
+        self.stales = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    def getTtl(self, endpoint):
+        return self._ttls.get(endpoint, self._defaultTtl)
+
+    def setTtl(self, endpoint, ttl):
+        self._ttls[endpoint] = ttl
+
+    def lookup(self, key):
+        """
+        Cached entry of key
+
+        Out:
+            None if not cached, otherwise
+            {
+                'body': '...',
+                'etag': '"abc"',        # None if the response had no ETag
+                'endpoint': 'photo',
+                'fresh': True,          # False if older than the TTL of its endpoint, revalidate it before use
+            }
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT endpoint, body, etag, storedTime FROM entries WHERE key = ?', (key,)).fetchone()
+            if not row:
+                self.misses += 1
+                return None
+            endpoint, body, etag, storedTime = row
+            fresh = now - storedTime <= self.getTtl(endpoint)
+            if fresh:
+                self.hits += 1
+                self._conn.execute('UPDATE entries SET accessTime = ? WHERE key = ?', (now, key))
+                self._conn.commit()
+            else:
+                self.stales += 1
+        return {
+            'body': str(body),
+            'etag': etag,
+            'endpoint': endpoint,
+            'fresh': fresh,
+        }
+
+    def store(self, key, endpoint, body, etag=None):
+        """
+        Cache body of key, replacing the existing entry
+        """
+        now = time.time()
+        body = str(body)
+        with self._lock:
+            row = self._conn.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            if row:
+                self._size -= row[0]
+            self._conn.execute(
+                'INSERT OR REPLACE INTO entries (key, endpoint, body, etag, storedTime, accessTime, size) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, endpoint, sqlite3.Binary(body), etag, now, now, len(body)))
+            self._size += len(body)
+            if self._size > self._maxSize:
+                self._evict()
+            self._conn.commit()
+
+    def revalidated(self, key):
+        """
+        Mark the entry of key fresh again, call it when the server answered 304 Not Modified
+        """
+        now = time.time()
+        with self._lock:
+            self.revalidations += 1
+            self._conn.execute('UPDATE entries SET storedTime = ?, accessTime = ? WHERE key = ?', (now, now, key))
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            if row:
+                self._size -= row[0]
+                self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self._conn.commit()
+
+    def _evict(self):
+        """
+        Delete least recently used entries until the total size is down to EVICTION_RATIO of maxSize, lock is held by caller
+        """
+        target = self._maxSize * self.EVICTION_RATIO
+        rows = self._conn.execute('SELECT key, size FROM entries ORDER BY accessTime').fetchall()
+        for key, size in rows:
+            if self._size <= target:
+                break
+            self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._size -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM entries')
+            self._conn.commit()
+            self._size = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def stats(self):
+        """
+        hits are fresh entries, stales are entries which need revalidation, revalidations are the ones answered 304
+        """
+        return {
+            'hits': self.hits,
+            'stales': self.stales,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'evictions': self.evictions,
+            'size': self._size,
+            'maxSize': self._maxSize,
+        }
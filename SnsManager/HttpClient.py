@@ -0,0 +1,178 @@
+import urlparse
+import threading
+
+class HttpClient(object):
+    """
+    Keep-alive HTTP client with a connection pool per host
+
+    It has urlopen() and request() of urllib3.PoolManager.
+    Pool size, which is the number of idle connections kept for a host, could be set per host,
+    e.g. a large pool for the API host and small pools for CDN hosts which are limited by downloadPerHostLimit.
+
+    HttpClient.shared() is a process-wide client, exporter instances which opt in borrow warm connections from it.
+    Its pool sizes are client-level settings, exporters borrowing it do not change them.
+    """
+    _shared = None
+    _sharedKwargs = None
+    _sharedLock = threading.Lock()
+
+    class Response(object):
+        """
+        Response of a request with preload_content=False, its connection slot is given back by release_conn() or close()
+        """
+        def __init__(self, resp, release):
+            self._resp = resp
+            self._release = release
+
+        def release_conn(self):
+            self._resp.release_conn()
+            self._releaseSlot()
+
+        def close(self):
+            self._resp.close()
+            self._releaseSlot()
+
+        def _releaseSlot(self):
+            release, self._release = self._release, None
+            if release:
+                release()
+
+        def __getattr__(self, key):
+            return getattr(self._resp, key)
+
+    @classmethod
+    def shared(cls, **kwargs):
+        """
+        The process-wide HttpClient, kwargs are the same as the constructor's and create it on the first call
+
+        Later calls borrow it without kwargs, or with the same kwargs, other kwargs raise ValueError
+        since they could not be applied to the existing client.
+        """
+        with cls._sharedLock:
+            if not cls._shared:
+                cls._shared = cls(**kwargs)
+                cls._sharedKwargs = kwargs
+            elif kwargs and kwargs != cls._sharedKwargs:
+                raise ValueError('HttpClient.shared() was created with other arguments. kwargs[{0}]'.format(cls._sharedKwargs))
+            return cls._shared
+
+    def __init__(self, poolSize=4, hostPoolSizes=None, maxConnections=None, **poolKwargs):
+        """
+        Constructor of HttpClient
+
+        In:
+            poolSize            --  pool size of hosts not in hostPoolSizes
+            hostPoolSizes       --  dict of host to pool size *optional*
+                                    host starts with '.' matches its subdomains, e.g. '.fbcdn.net'
+            maxConnections      --  maximum requests in progress of all hosts, more requests wait *optional* default is no limit
+            poolKwargs          --  other arguments of urllib3.PoolManager *optional*
+
+        """
+        self._poolSize = poolSize
+        self._hostPoolSizes = dict(hostPoolSizes or {})
+        self._poolKwargs = poolKwargs
+        self._lock = threading.Lock()
+        # urllib3.PoolManager of every pool size, each keeps pools of its hosts
+        self._poolManagers = {}
+        self._maxConnections = maxConnections
+        self._slots = threading.BoundedSemaphore(maxConnections) if maxConnections else None
+        self._inUse = 0
+
+    def setHostPoolSize(self, host, poolSize):
+        with self._lock:
+            self._hostPoolSizes[host] = poolSize
+
+    def getPoolSize(self, host):
+        if host in self._hostPoolSizes:
+            return self._hostPoolSizes[host]
+        for pattern, poolSize in self._hostPoolSizes.iteritems():
+            if pattern.startswith('.') and host.endswith(pattern):
+                return poolSize
+        return self._poolSize
+
+    def _poolManager(self, url):
+        poolSize = self.getPoolSize(urlparse.urlsplit(url).hostname or '')
+        if poolSize not in self._poolManagers:
+            with self._lock:
+                if poolSize not in self._poolManagers:
+                    # Providers using their own SDKs may never send a request through here
+                    import urllib3
+                    self._poolManagers[poolSize] = urllib3.PoolManager(maxsize=poolSize, **self._poolKwargs)
+        return self._poolManagers[poolSize]
+
+    def _acquireSlot(self):
+        if self._slots:
+            self._slots.acquire()
+        with self._lock:
+            self._inUse += 1
+
+    def _releaseSlot(self):
+        with self._lock:
+            self._inUse -= 1
+        if self._slots:
+            self._slots.release()
+
+    def _send(self, func, method, url, **kwargs):
+        self._acquireSlot()
+        try:
+            resp = func(method, url, **kwargs)
+        except:
+            self._releaseSlot()
+            raise
+        if kwargs.get('preload_content', True):
+            self._releaseSlot()
+            return resp
+        # The connection is in use until the caller released the response
+        return self.Response(resp, self._releaseSlot)
+
+    def urlopen(self, method, url, **kwargs):
+        return self._send(self._poolManager(url).urlopen, method, url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        return self._send(self._poolManager(url).request, method, url, **kwargs)
+
+    def stats(self):
+        """
+        Occupancy of pools
+
+        Out:
+            {
+                'inUse': 1,                     # requests in progress
+                'maxConnections': None,
+                'hosts': {
+                    'graph.facebook.com:443': {
+                        'poolSize': 10,
+                        'idle': 3,              # kept-alive connections ready for reuse
+                        'connections': 4,       # connections ever opened
+                        'requests': 120,
+                    }, ...
+                },
+            }
+        """
+        hosts = {}
+        with self._lock:
+            poolManagers = self._poolManagers.values()
+        for poolManager in poolManagers:
+            for key in poolManager.pools.keys():
+                pool = poolManager.pools.get(key, None)
+                if not pool:
+                    continue
+                hosts['{0}:{1}'.format(pool.host, pool.port)] = {
+                    'poolSize': pool.pool.maxsize if pool.pool else 0,
+                    'idle': len([conn for conn in list(pool.pool.queue) if conn]) if pool.pool else 0,
+                    'connections': pool.num_connections,
+                    'requests': pool.num_requests,
+                }
+        return {
+            'inUse': self._inUse,
+            'maxConnections': self._maxConnections,
+            'hosts': hosts,
+        }
+
+    def clear(self):
+        """
+        Close all pooled connections
+        """
+        with self._lock:
+            for poolManager in self._poolManagers.itervalues():
+                poolManager.clear()
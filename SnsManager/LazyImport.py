@@ -0,0 +1,47 @@
+import sys
+import types
+import importlib
+
+def lazyModule(name, exports):
+    """
+    Replace package in sys.modules with a module which imports its exports on first access
+
+    Call it at the end of a package's __init__ instead of importing from submodules,
+    so that importing the package does not load submodules and their dependencies.
+
+    In:
+        name                --  name of the package, i.e. __name__
+        exports             --  dict of exported attribute name to the submodule defining it
+
+    Out:
+        the lazy module
+    """
+    module = sys.modules[name]
+    properties = {}
+    for attr, submoduleName in exports.iteritems():
+        properties[attr] = _exportProperty(attr, submoduleName)
+    # Properties are class attributes, so every lazy module gets its own class
+    LazyModule = type('LazyModule', (types.ModuleType,), properties)
+
+    lazy = LazyModule(name, module.__doc__)
+    lazy.__dict__.update(module.__dict__)
+    lazy.__dict__['__all__'] = sorted(exports)
+    lazy.__dict__['_lazyValues'] = {}
+    # Python 2 clears globals of a deallocated module, keep the original one alive
+    lazy.__dict__['_originalModule'] = module
+    sys.modules[name] = lazy
+    return lazy
+
+def _exportProperty(attr, submoduleName):
+    def getter(self):
+        if attr not in self._lazyValues:
+            submodule = importlib.import_module('{0}.{1}'.format(self.__name__, submoduleName))
+            self._lazyValues[attr] = getattr(submodule, attr)
+        return self._lazyValues[attr]
+
+    def setter(self, value):
+        # Importing a submodule sets it as an attribute of the package, which must not hide the export
+        if not isinstance(value, types.ModuleType):
+            self._lazyValues[attr] = value
+
+    return property(getter, setter)
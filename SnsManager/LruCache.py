@@ -0,0 +1,66 @@
+import time
+import threading
+from collections import OrderedDict
+
+class LruCache(object):
+    """
+    Thread-safe LRU cache with an optional time-to-live for every entry
+    """
+    def __init__(self, maxSize=256, ttl=None):
+        """
+        Constructor of LruCache
+
+        In:
+            maxSize             --  maximum number of entries, the least recently used one is evicted first
+            ttl                 --  seconds an entry stays valid *optional* default is None which means forever
+
+        """
+        self._maxSize = maxSize
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _isExpired(self, storedTime):
+        return self._ttl is not None and time.time() - storedTime > self._ttl
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                storedTime, value = self._entries.pop(key)
+                if not self._isExpired(storedTime):
+                    self._entries[key] = (storedTime, value)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time(), value)
+            while len(self._entries) > self._maxSize:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        """
+        Check a valid entry exists without touching hit/miss counts or LRU order
+        """
+        with self._lock:
+            return key in self._entries and not self._isExpired(self._entries[key][0])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxSize': self._maxSize,
+        }
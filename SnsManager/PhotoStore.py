@@ -0,0 +1,143 @@
+import os
+import uuid
+import errno
+import hashlib
+import urlparse
+import threading
+
+class PhotoStore(object):
+    """
+    Content-addressed photo files in a folder
+
+    Photos are named by the SHA-1 of their content in sharded folders, e.g. <folder>/ab/cd/abcd....jpg,
+    so the same photo is stored once however many times it was downloaded.
+    Source URLs are indexed in <folder>/urls in the same layout, so a photo already stored,
+    in this run or a previous one, is not downloaded again.
+    A URL is downloaded by one thread at a time, fetches of it meanwhile wait for that download.
+    """
+    CHUNK_SIZE = 65536
+
+    def __init__(self, *args, **kwargs):
+        """
+        Constructor of PhotoStore
+
+        In:
+            folder              --  folder to store photo files
+
+        """
+        if 'folder' not in kwargs:
+            raise ValueError('Invalid parameters.')
+        self._folder = kwargs['folder']
+        # URL key to threading.Event of its download in progress, set when the download finished
+        self._downloading = {}
+        self._downloadingLock = threading.Lock()
+        self._statsLock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.duplicates = 0
+
+    def _urlKey(self, fileUri):
+        # http and https links of the same photo are regarded as the same
+        parsed = urlparse.urlsplit(fileUri)
+        return hashlib.sha1(urlparse.urlunsplit(('', parsed.netloc, parsed.path, parsed.query, ''))).hexdigest()
+
+    def _shardedPath(self, folder, digest, fileExtName=''):
+        return os.path.join(folder, digest[0:2], digest[2:4], digest + fileExtName)
+
+    def _makeDirs(self, filePath):
+        try:
+            os.makedirs(os.path.dirname(filePath))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def lookup(self, fileUri):
+        """
+        Path of the stored photo of fileUri, None if it is not stored
+        """
+        indexPath = self._shardedPath(os.path.join(self._folder, 'urls'), self._urlKey(fileUri))
+        try:
+            with open(indexPath, 'r') as fp:
+                filePath = os.path.join(self._folder, fp.read().strip())
+        except IOError:
+            return None
+        return filePath if os.path.isfile(filePath) else None
+
+    def fetch(self, fileUri, download):
+        """
+        Path of the photo of fileUri, download it only if it is not stored yet
+
+        In:
+            fileUri             --  source URL of the photo
+            download            --  function(fileUri, filePath) to download fileUri to filePath,
+                                    returns False if the download failed
+
+        Out:
+            path of the stored photo, None if the download failed
+        """
+        urlKey = self._urlKey(fileUri)
+        while True:
+            with self._downloadingLock:
+                downloaded = self._downloading.get(urlKey, None)
+                if not downloaded:
+                    downloaded = self._downloading[urlKey] = threading.Event()
+                    break
+            # Another thread is fetching the same URL, it is looked up again once that finished
+            downloaded.wait()
+
+        # No lock is held while looking up and downloading, only fetches of the same URL wait for them
+        try:
+            filePath = self.lookup(fileUri)
+            if filePath:
+                with self._statsLock:
+                    self.hits += 1
+                return filePath
+            with self._statsLock:
+                self.misses += 1
+
+            tmpPath = os.path.join(self._folder, '{0}.tmp'.format(uuid.uuid1()))
+            try:
+                if not download(fileUri, tmpPath):
+                    return None
+                return self._add(urlKey, self._fileExtName(fileUri), tmpPath)
+            finally:
+                if os.path.exists(tmpPath):
+                    os.remove(tmpPath)
+        finally:
+            with self._downloadingLock:
+                del self._downloading[urlKey]
+            downloaded.set()
+
+    def _fileExtName(self, fileUri):
+        return os.path.splitext(urlparse.urlsplit(fileUri).path)[1]
+
+    def _add(self, urlKey, fileExtName, tmpPath):
+        contentHash = hashlib.sha1()
+        with open(tmpPath, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(self.CHUNK_SIZE), ''):
+                contentHash.update(chunk)
+        filePath = self._shardedPath(self._folder, contentHash.hexdigest(), fileExtName)
+        if os.path.isfile(filePath):
+            with self._statsLock:
+                self.duplicates += 1
+        else:
+            self._makeDirs(filePath)
+            os.rename(tmpPath, filePath)
+
+        indexPath = self._shardedPath(os.path.join(self._folder, 'urls'), urlKey)
+        self._makeDirs(indexPath)
+        indexTmpPath = '{0}.{1}.tmp'.format(indexPath, uuid.uuid1())
+        with open(indexTmpPath, 'w') as fp:
+            fp.write(os.path.relpath(filePath, self._folder))
+        os.rename(indexTmpPath, indexPath)
+        return filePath
+
+    def stats(self):
+        """
+        hits are photos found by URL, duplicates are downloaded photos which were already stored under another URL
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'duplicates': self.duplicates,
+        }
@@ -0,0 +1,118 @@
+import json
+import time
+import random
+import calendar
+from email.utils import parsedate
+from SnsBase import ErrorCode
+
+class RetryPolicy(object):
+    """
+    Decide whether and how long to wait before retrying a failed request
+
+    Delays grow exponentially with jitter, quota errors start from a longer delay,
+    and a Retry-After or Facebook usage header from the failed response takes precedence.
+    Waiting could be done on the caller's cancel event, so a cancelled run stops waiting at once.
+    Waits of one request are bounded by maxTotalDelay in total, so a failing request gives up within about a minute.
+    """
+    # Errors which will not recover by retrying
+    NON_RETRIABLE_ERRORS = (
+        ErrorCode.E_NO_DATA,
+        ErrorCode.E_INVALID_TOKEN,
+        ErrorCode.E_INVALID_PARAMETERS,
+    )
+    # Facebook reports its rate limit usage in percentage through these headers
+    USAGE_HEADERS = ('X-App-Usage', 'X-Business-Use-Case-Usage', 'X-Page-Usage')
+
+    def __init__(self, maxRetries=3, baseDelay=1.0, quotaDelay=5.0, maxDelay=30.0, maxTotalDelay=60.0, jitter=0.5):
+        """
+        Constructor of RetryPolicy
+
+        In:
+            maxRetries          --  maximum retries of one request
+            baseDelay           --  seconds to wait before the first retry of transient errors
+            quotaDelay          --  seconds to wait before the first retry of E_REQUESTS_EXCEED_QUOTA
+            maxDelay            --  upper bound of a single wait
+            maxTotalDelay       --  upper bound of all waits of one request, None means no bound
+            jitter              --  fraction of the delay which is randomized, 0 means no jitter
+
+        """
+        self.maxRetries = maxRetries
+        self.baseDelay = baseDelay
+        self.quotaDelay = quotaDelay
+        self.maxDelay = maxDelay
+        self.maxTotalDelay = maxTotalDelay
+        self.jitter = jitter
+
+    def shouldRetry(self, errorCode, retryCount):
+        """
+        retryCount is the number of the coming retry, starts from 1
+        """
+        if errorCode in self.NON_RETRIABLE_ERRORS:
+            return False
+        return retryCount <= self.maxRetries
+
+    def getDelay(self, errorCode, retryCount, retryAfter=None):
+        if retryAfter is not None:
+            return min(max(retryAfter, 0), self.maxDelay)
+        baseDelay = self.quotaDelay if errorCode == ErrorCode.E_REQUESTS_EXCEED_QUOTA else self.baseDelay
+        delay = min(baseDelay * (2 ** (retryCount - 1)), self.maxDelay)
+        return delay * (1 - self.jitter * random.random())
+
+    def deadline(self):
+        """
+        Time after which a request failed from now is not retried any more, None if there is no bound
+        """
+        if self.maxTotalDelay is None:
+            return None
+        return time.time() + self.maxTotalDelay
+
+    def wait(self, errorCode, retryCount, retryAfter=None, cancelled=None, deadline=None):
+        """
+        Wait before the coming retry, return False if cancelled, a threading.Event of the caller's run, was set,
+        or without waiting if the retry could not start before deadline, which comes from deadline() at the first failure
+
+        The policy is shared by every run of an exporter, so cancelling one run does not stop retries of others.
+        """
+        delay = self.getDelay(errorCode, retryCount, retryAfter)
+        if deadline is not None and time.time() + delay > deadline:
+            return False
+        if not cancelled:
+            time.sleep(delay)
+            return True
+        cancelled.wait(delay)
+        return not cancelled.is_set()
+
+    def retryAfter(self, headers):
+        """
+        Seconds to wait suggested by response headers, None if there is no suggestion
+        """
+        if not headers:
+            return None
+        value = headers.get('Retry-After', None)
+        if value:
+            if value.strip().isdigit():
+                return int(value)
+            dateTuple = parsedate(value)
+            if dateTuple:
+                return max(calendar.timegm(dateTuple) - time.time(), 0)
+
+        for name in self.USAGE_HEADERS:
+            value = headers.get(name, None)
+            if not value:
+                continue
+            try:
+                usage = json.loads(value)
+            except ValueError:
+                continue
+            # X-Business-Use-Case-Usage is a dict of lists of usage dicts
+            usages = []
+            for item in (usage.values() if name == 'X-Business-Use-Case-Usage' else [usage]):
+                usages += item if type(item) == list else [item]
+            for item in usages:
+                if type(item) != dict:
+                    continue
+                if item.get('estimated_time_to_regain_access', 0) > 0:
+                    return item['estimated_time_to_regain_access'] * 60
+                if max([v for v in item.values() if type(v) in (int, float)] or [0]) >= 100:
+                    return self.quotaDelay
+        return None
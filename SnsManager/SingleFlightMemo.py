@@ -0,0 +1,141 @@
+import sys
+import threading
+
+class SingleFlightMemo(object):
+    """
+    Thread-safe memo table with single-flight loading, meant to live for one run, e.g. one getData() call
+
+    get() of a key being loaded by another thread waits for that load instead of loading it again.
+    Loads returning None are regarded as failed and are not memoized, so a later get() tries again.
+    """
+    class _Call(object):
+        def __init__(self):
+            self.done = threading.Event()
+            self.value = None
+            self.excInfo = None
+
+        def result(self):
+            self.done.wait()
+            if self.excInfo:
+                raise self.excInfo[0], self.excInfo[1], self.excInfo[2]
+            return self.value
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._calls = {}
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+
+    def get(self, key, load):
+        """
+        Value of key, load it by load(key) if it is neither memoized nor being loaded
+
+        In:
+            key                 --  key of the value, e.g. Graph ID
+            load                --  function(key) returns the value, None if failed
+
+        Out:
+            the value, None if the load failed
+        """
+        with self._lock:
+            if key in self._values:
+                self.hits += 1
+                return self._values[key]
+            call = self._calls.get(key, None)
+            isLoader = call is None
+            if isLoader:
+                self.misses += 1
+                call = self._calls[key] = self._Call()
+            else:
+                self.waits += 1
+        if not isLoader:
+            return call.result()
+
+        try:
+            value = load(key)
+        except:
+            self._finish({key: call}, excInfo=sys.exc_info())
+            raise
+        self._finish({key: call}, {key: value})
+        return value
+
+    def getMany(self, keys, loadMany):
+        """
+        Values of keys, the keys neither memoized nor being loaded are loaded together by loadMany(keys)
+
+        In:
+            keys                --  list of keys
+            loadMany            --  function(keys) returns a list of values in the same order, None for failed ones
+
+        Out:
+            dict of key to value, None for failed ones
+        """
+        values = {}
+        waiting = {}
+        loading = {}
+        with self._lock:
+            for key in set(keys):
+                if key in self._values:
+                    self.hits += 1
+                    values[key] = self._values[key]
+                elif key in self._calls:
+                    self.waits += 1
+                    waiting[key] = self._calls[key]
+                else:
+                    self.misses += 1
+                    loading[key] = self._calls[key] = self._Call()
+
+        if loading:
+            loadKeys = loading.keys()
+            try:
+                loaded = dict(zip(loadKeys, loadMany(loadKeys)))
+            except:
+                self._finish(loading, excInfo=sys.exc_info())
+                raise
+            self._finish(loading, loaded)
+            values.update(loaded)
+        for key, call in waiting.iteritems():
+            values[key] = call.result()
+        return values
+
+    def _finish(self, calls, values=None, excInfo=None):
+        with self._lock:
+            for key, call in calls.iteritems():
+                del self._calls[key]
+                call.value = (values or {}).get(key, None)
+                call.excInfo = excInfo
+                if call.value is not None:
+                    self._values[key] = call.value
+        for call in calls.itervalues():
+            call.done.set()
+
+    def peek(self, key, default=None):
+        """
+        Memoized value of key without loading or waiting
+        """
+        with self._lock:
+            return self._values.get(key, default)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._values
+
+    def __len__(self):
+        return len(self._values)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def stats(self):
+        """
+        hits are memoized values, waits are gets which joined a load in progress of another thread
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'waits': self.waits,
+            'size': len(self._values),
+        }
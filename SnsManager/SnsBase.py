@@ -1,9 +1,26 @@
-import urllib3
+import os
+import time
+import threading
+import urlparse
 from abc import ABCMeta, abstractmethod
+from WorkerPool import WorkerPool
+from HttpClient import HttpClient
+from PhotoStore import PhotoStore
+from Tracer import NullTracer
 
 class SnsBase(object):
     __metaclass__ = ABCMeta
 
+    IDENTITY_FIELDS = ('myId', 'myName', 'myEmail')
+
+    # Bytes read at once while downloading files
+    DOWNLOAD_CHUNK_SIZE = 65536
+    # Seconds close() waits for each worker thread to finish its task
+    CLOSE_TIMEOUT = 5
+
+    # Fields of records which getData(fields=[...]) could leave out, along with the requests to compute them
+    OPTIONAL_FIELDS = ('people', 'place', 'photos')
+
     class MockLogger(object):
         def __init__(self, *args, **kwargs):
             return None
@@ -12,6 +29,12 @@ class SnsBase(object):
         def __getattr__(self, key):
             return self
 
+    class OversizedError(Exception):
+        """
+        Raised while downloading a file larger than maxDownloadSize
+        """
+        pass
+
     def __init__(self, *args, **kwargs):
         """
         Constructor of SnsBase
@@ -19,6 +42,22 @@ class SnsBase(object):
         In:
             accessToken         --  accessToken
             logger              --  logger *optional*
+            downloadPoolSize    --  number of concurrent photo downloads *optional* default is 4, 0 means serial
+            downloadPerHostLimit    --  maximum concurrent downloads from one host *optional* default is 2
+            tokenValidTtl       --  seconds to trust a successful token validation *optional* default is 300, 0 means always check
+            retryPolicy         --  RetryPolicy for failed requests *optional* default is RetryPolicy()
+            httpPoolSize        --  kept-alive connections per host, e.g. CDN hosts *optional* default is downloadPerHostLimit
+            httpHostPoolSizes   --  dict of host to kept-alive connections, see HttpClient *optional*
+            sharedHttpPool      --  borrow connections from process-wide HttpClient.shared() *optional* default is False
+                                    Call HttpClient.shared(maxConnections=..., hostPoolSizes=...) before creating exporters
+                                    to set its limits, httpPoolSize and httpHostPoolSizes could not be given with it.
+            maxDownloadSize     --  maximum bytes of a downloaded file, larger ones are dropped *optional* default is None which means no limit
+            tmpFolder           --  folder of downloaded files *optional* default is /tmp
+            photoStore          --  PhotoStore to store photo files, could be shared by exporters *optional* default is a PhotoStore in tmpFolder
+            myId, myName, myEmail   --  known identity, e.g. cached from a previous run *optional*
+                                    Identity not given is retrieved on first access of the attribute.
+            tracer              --  tracer of timed spans with request counts, bytes and status codes, e.g. MemoryTracer *optional*
+                                    default is NullTracer which records nothing
 
         """
         if 'accessToken' not in kwargs:
@@ -26,14 +65,335 @@ class SnsBase(object):
         self._accessToken = kwargs['accessToken']
         self._logger = kwargs.get('logger', SnsBase.MockLogger())
 
-        self._httpConn = urllib3.PoolManager()
+        self._identityLock = threading.Lock()
+        self._identityResolved = False
+        self._identity = {}
+        for name in self.IDENTITY_FIELDS:
+            if kwargs.get(name, None):
+                self._identity[name] = kwargs[name]
+
         self._timeout = 60
         self._timeout = kwargs.get('timeout', 60)
 
+        self._downloadPool = WorkerPool(
+            size=kwargs.get('downloadPoolSize', 4),
+            perKeyLimit=kwargs.get('downloadPerHostLimit', 2),
+        )
+        # One client for API calls and media, connections are kept alive and reused per host
+        self._sharedHttpPool = kwargs.get('sharedHttpPool', False)
+        if self._sharedHttpPool:
+            # Pool sizes of the shared client are set by the caller creating it, for every exporter borrowing it
+            if 'httpPoolSize' in kwargs or 'httpHostPoolSizes' in kwargs:
+                raise ValueError('Invalid parameters.')
+            self._httpConn = HttpClient.shared()
+        else:
+            self._httpConn = HttpClient(
+                poolSize=kwargs.get('httpPoolSize', kwargs.get('downloadPerHostLimit', 2)),
+                hostPoolSizes=kwargs.get('httpHostPoolSizes', None),
+                num_pools=32,
+            )
+        self._maxDownloadSize = kwargs.get('maxDownloadSize', None)
+        self._photoStore = kwargs.get('photoStore', None) or PhotoStore(folder=kwargs.get('tmpFolder', '/tmp'))
+        self._downloadStatsLock = threading.Lock()
+        self._downloadStats = {
+            'files': 0,
+            'bytes': 0,
+            'failed': 0,
+            'oversized': 0,
+        }
+        # Set by getData() of exporters, photos are left as descriptors of _photoDescriptor() for materialize()
+        self._metadataOnly = False
+        # Set by getData() of exporters, see _setFields()
+        self._fields = None
+
+        self._tokenValidTtl = kwargs.get('tokenValidTtl', 300)
+        self._tokenValidTime = None
+
+        # RetryPolicy depends on ErrorCode below, so it is imported here
+        from RetryPolicy import RetryPolicy
+        self._retryPolicy = kwargs.get('retryPolicy', None) or RetryPolicy()
+
+        self._tracer = kwargs.get('tracer', None) or NullTracer()
+
+    def _request(self, name, method, url, **kwargs):
+        """
+        HTTP request through the pooled client in a 'request:<name>' span
+
+        In:
+            name                --  kind of the request in traces, e.g. 'object'
+            others              --  the same as HttpClient.urlopen()
+
+        Out:
+            the response of HttpClient.urlopen()
+        """
+        with self._tracer.span('request:{0}'.format(name)) as span:
+            try:
+                conn = self._httpConn.urlopen(method, url, **kwargs)
+            except:
+                span.record(error=True)
+                raise
+            span.record(conn.status, len(conn.data or '') if kwargs.get('preload_content', True) else 0)
+            return conn
+
+    def _validateToken(self):
+        """
+        isTokenValid() with result cache for exporters' getData()
+
+        A successful validation is trusted for tokenValidTtl seconds, failures are never cached.
+        """
+        if self._tokenValidTime is not None and time.time() - self._tokenValidTime < self._tokenValidTtl:
+            return ErrorCode.S_OK
+        ret = self.isTokenValid()
+        if ret == ErrorCode.S_OK:
+            self._tokenValidTime = time.time()
+        else:
+            self._tokenValidTime = None
+        return ret
+
+    def _invalidateTokenValidation(self):
+        """
+        Drop cached token validation, call it when an API call returned an authentication error
+        """
+        if self._tokenValidTime is not None:
+            self._logger.info('Authentication error from API call, token validation cache invalidated.')
+        self._tokenValidTime = None
+
+    def _submitDownload(self, fileUri, func, *args, **kwargs):
+        """
+        Run a download function in the download pool, limited by the host of fileUri
+
+        Out:
+            WorkerPool.Task, which could be put into a record's photos and resolved by _resolvePhotos()
+        """
+        host = urlparse.urlsplit(fileUri).netloc
+        # The download is traced under the span which submitted it
+        return self._downloadPool.submitKeyed(host, self._tracer.wrap(func), *args, **kwargs)
+
+    def _downloadFile(self, fileUri, filePath):
+        """
+        Download fileUri to filePath, return False if failed
+
+        The file is streamed in chunks to a partial file which is renamed to filePath after completed,
+        so memory usage does not grow with file size and filePath never holds a partial file.
+        """
+        with self._tracer.span('download') as span:
+            partPath = '{0}.part'.format(filePath)
+            size = 0
+            status = None
+            try:
+                conn = self._httpConn.urlopen('GET', fileUri, preload_content=False, timeout=self._timeout)
+                status = conn.status
+                try:
+                    if conn.status != 200:
+                        raise IOError('Unexpected status {0}'.format(conn.status))
+                    contentLength = conn.getheader('Content-Length', None)
+                    if self._maxDownloadSize and contentLength and int(contentLength) > self._maxDownloadSize:
+                        raise self.OversizedError(contentLength)
+                    with open(partPath, 'wb') as fileObj:
+                        for chunk in iter(lambda: conn.read(self.DOWNLOAD_CHUNK_SIZE), ''):
+                            size += len(chunk)
+                            if self._maxDownloadSize and size > self._maxDownloadSize:
+                                raise self.OversizedError(size)
+                            fileObj.write(chunk)
+                except:
+                    # Connection with unread data could not be reused
+                    conn.close()
+                    raise
+                finally:
+                    conn.release_conn()
+                os.rename(partPath, filePath)
+            except self.OversizedError as e:
+                self._logger.info('File exceeds maxDownloadSize. uri[{0}] size[{1}]'.format(fileUri, e))
+                self._countDownload('oversized', size)
+                span.record(status, size, error=True)
+                return False
+            except:
+                self._countDownload('failed', size)
+                span.record(status, size, error=True)
+                return False
+            finally:
+                if os.path.exists(partPath):
+                    os.remove(partPath)
+            self._countDownload('files', size)
+            span.record(status, size)
+            return True
+
+    def _countDownload(self, result, size):
+        with self._downloadStatsLock:
+            self._downloadStats[result] += 1
+            self._downloadStats['bytes'] += size
+
+    def getDownloadStats(self):
+        """
+        Download counts of files, failed and oversized files, and bytes received including the dropped ones
+        """
+        with self._downloadStatsLock:
+            return dict(self._downloadStats)
+
+    def getHttpStats(self):
+        """
+        Occupancy of HTTP connection pools, see HttpClient.stats()
+        """
+        return self._httpConn.stats()
+
+    def close(self):
+        """
+        Stop worker threads and close connections the exporter owns, call it when the exporter is no longer used
+
+        Connections of the process-wide HttpClient.shared() are left open for other exporters.
+        The exporter could also be used in a with statement, which closes it at the end.
+        Without close(), worker threads still exit once their pool was idle for WorkerPool.IDLE_TIMEOUT.
+        """
+        self._downloadPool.close(timeout=self.CLOSE_TIMEOUT)
+        if not self._sharedHttpPool:
+            self._httpConn.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+    def _resolvePhotos(self, records):
+        """
+        Wait for pending downloads and replace them with file paths in records' photos, failed downloads are dropped
+        """
+        for record in records:
+            if 'photos' not in record:
+                continue
+            photos = []
+            for photo in record['photos']:
+                if isinstance(photo, WorkerPool.Task):
+                    try:
+                        photo = photo.result()
+                    except:
+                        self._logger.exception('Unable to download photo.')
+                        photo = None
+                if photo:
+                    photos.append(photo)
+            record['photos'] = photos
+
+    def _setFields(self, fields):
+        """
+        Optional fields of records to compute in this getData() call, None means all of OPTIONAL_FIELDS
+
+        Names other than OPTIONAL_FIELDS are ignored, those fields are always computed.
+        """
+        self._fields = frozenset(fields) if fields is not None else None
+
+    def _wantField(self, name):
+        return self._fields is None or name in self._fields
+
+    def _projectRecord(self, record):
+        """
+        Drop optional fields not asked for from record, which parsers could have left empty
+        """
+        for name in self.OPTIONAL_FIELDS:
+            if not self._wantField(name):
+                record.pop(name, None)
+        return record
+
+    def _photoDescriptor(self, source, objectId=None, sizeType=None):
+        """
+        Photo left undownloaded in a record's photos by getData(metadataOnly=True)
+
+        Out:
+            {
+                'source': 'https://...',        # uri to download
+                'sizeType': 'maximum',          # size of source named by the exporter, None if unknown
+                'objectId': '12345',            # id of the object owning the photo, None if unknown
+            }
+        """
+        return {
+            'source': source,
+            'sizeType': sizeType,
+            'objectId': objectId,
+        }
+
+    def _isPhotoDescriptor(self, photo):
+        return type(photo) == dict and 'source' in photo
+
+    def materialize(self, records):
+        """
+        Download photos of records returned by getData(metadataOnly=True), on demand and in the download pool
+
+        In:
+            records             --  list of records, or the 'data' dict of getData()
+                                    Records could be filtered and their photos trimmed before,
+                                    only the photo descriptors left in them are downloaded.
+
+        Out:
+            records, whose photo descriptors are replaced with file paths in place, failed downloads are dropped
+        """
+        recordList = records.values() if type(records) == dict else records
+        with self._tracer.span('materialize'):
+            # Records could share photos, e.g. ones of the same album
+            tasks = {}
+            for record in recordList:
+                if 'photos' not in record:
+                    continue
+                photos = []
+                for photo in record['photos']:
+                    if self._isPhotoDescriptor(photo):
+                        if photo['source'] not in tasks:
+                            tasks[photo['source']] = self._submitDownload(photo['source'], self._materializePhoto, photo)
+                        photo = tasks[photo['source']]
+                    photos.append(photo)
+                record['photos'] = photos
+            self._resolvePhotos(recordList)
+        return records
+
+    def _materializePhoto(self, descriptor):
+        """
+        Download the photo of descriptor into the PhotoStore, return its file path or None if failed
+        """
+        return self._photoStore.fetch(descriptor['source'], self._downloadFile)
+
+    def _getIdentity(self, name):
+        """
+        Identity field, resolved by _resolveIdentity() on first access
+
+        A failed resolution is not cached and will be tried again on next access.
+        """
+        if name in self._identity or self._identityResolved:
+            return self._identity.get(name, None)
+        with self._identityLock:
+            if name not in self._identity and not self._identityResolved:
+                identity = self._resolveIdentity()
+                if identity:
+                    self._seedIdentity(identity)
+                    self._identityResolved = True
+        return self._identity.get(name, None)
+
+    def _seedIdentity(self, identity):
+        """
+        Keep identity fields retrieved along with other calls, e.g. isTokenValid()
+        """
+        for name in self.IDENTITY_FIELDS:
+            if identity.get(name, None):
+                self._identity[name] = identity[name]
+
+    def _setIdentity(self, name, value):
+        self._identity[name] = value
+
+    myId = property(lambda self: self._getIdentity('myId'), lambda self, value: self._setIdentity('myId', value))
+    myName = property(lambda self: self._getIdentity('myName'), lambda self, value: self._setIdentity('myName', value))
+    myEmail = property(lambda self: self._getIdentity('myEmail'), lambda self, value: self._setIdentity('myEmail', value))
+
     @abstractmethod
-    def getMyId(self):
+    def _resolveIdentity(self):
+        """
+        Retrieve identity from the provider
+
+        Out:
+            dict with some of myId, myName and myEmail, None if failed
+        """
         pass
 
+    def getMyId(self):
+        return self.myId
+
     @abstractmethod
     def isTokenValid(self):
         pass
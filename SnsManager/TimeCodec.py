@@ -0,0 +1,45 @@
+import re
+import time
+from datetime import datetime
+
+# Fixed format used by Graph API and Instagram, e.g. 2012-08-21T09:03:44+0000
+_RE_ISO8601 = re.compile(r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6})\d*)?(Z|[+-]\d{2}:?\d{2})?$')
+
+# tzinfo of every offset in seconds, dateutil is imported when the first one is created
+_tzOffsets = {}
+
+def _tzinfo(tzString):
+    if tzString == 'Z':
+        offset = 0
+    else:
+        offset = (int(tzString[1:3]) * 60 + int(tzString[-2:])) * 60
+        if tzString[0] == '-':
+            offset = -offset
+    if offset not in _tzOffsets:
+        from dateutil import tz
+        _tzOffsets[offset] = tz.tzutc() if offset == 0 else tz.tzoffset(None, offset)
+    return _tzOffsets[offset]
+
+def parseTime(timeString):
+    """
+    Parse time string to datetime, the same result as dateutil.parser.parse()
+
+    ISO-8601 strings in fixed format are parsed with a regular expression,
+    others fall back to dateutil.
+    """
+    matchResult = _RE_ISO8601.match(timeString)
+    if not matchResult:
+        from dateutil import parser as dateParser
+        return dateParser.parse(timeString)
+    year, month, day, hour, minute, second, fraction, tzString = matchResult.groups()
+    return datetime(
+        int(year), int(month), int(day), int(hour), int(minute), int(second),
+        int(fraction.ljust(6, '0')) if fraction else 0,
+        _tzinfo(tzString) if tzString else None,
+    )
+
+def datetime2Timestamp(datetimeObj):
+    """
+    Convert datetime to unix timestamp in seconds, the datetime is regarded as local time
+    """
+    return int(time.mktime(datetimeObj.timetuple()))
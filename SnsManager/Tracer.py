@@ -0,0 +1,267 @@
+import time
+import threading
+
+class NullTracer(object):
+    """
+    Tracer which records nothing, the default of exporters
+
+    A tracer records nested timed spans, e.g. getData > api:feed > page > parser:_dataParserStatus > request:object,
+    with request counts, response bytes and status codes.
+    Code with a straight flow uses span() as a context manager.
+    Generators and worker threads use start(), activate() and finish() with explicit parents,
+    so that a suspended generator does not leave its span current in the thread.
+    """
+    class NullSpan(object):
+        def record(self, status=None, size=0, error=False):
+            pass
+
+        def tag(self, **tags):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, excType, excValue, traceback):
+            return False
+
+    _nullSpan = NullSpan()
+
+    def span(self, name, **tags):
+        """
+        Context manager of a child span of the current span, the span is current inside it
+        """
+        return self._nullSpan
+
+    def start(self, name, parent=None, **tags):
+        """
+        Start a span under parent, default is the current span, without making it current
+        """
+        return None
+
+    def activate(self, span):
+        """
+        Context manager which makes span current in this thread
+        """
+        return self._nullSpan
+
+    def finish(self, span):
+        pass
+
+    def current(self):
+        return None
+
+    def wrap(self, func):
+        """
+        Function which runs func under the current span, for tasks submitted to worker threads
+        """
+        return func
+
+    def record(self, status=None, size=0, error=False):
+        """
+        Count a request of the current span
+        """
+        pass
+
+    def report(self):
+        return {}
+
+    def reset(self):
+        pass
+
+class MemoryTracer(NullTracer):
+    """
+    Tracer which keeps spans in memory and reports them per span path
+
+    Usage:
+        tracer = MemoryTracer()
+        exporter = FbExporter(accessToken=token, tracer=tracer)
+        exporter.getData(since=None, until=until)
+        print tracer.formatReport()
+    """
+    class Span(object):
+        def __init__(self, tracer, name, parent, tags):
+            self._tracer = tracer
+            self.name = name
+            self.parent = parent
+            self.tags = tags
+            self.children = []
+            self.startTime = time.time()
+            self.endTime = None
+            self.requests = 0
+            self.bytes = 0
+            self.errors = 0
+            self.statuses = {}
+
+        def record(self, status=None, size=0, error=False):
+            with self._tracer._lock:
+                self.requests += 1
+                self.bytes += size
+                if error:
+                    self.errors += 1
+                if status is not None:
+                    self.statuses[status] = self.statuses.get(status, 0) + 1
+
+        def tag(self, **tags):
+            self.tags.update(tags)
+
+        def path(self):
+            names = []
+            span = self
+            while span:
+                names.append(span.name)
+                span = span.parent
+            return ' > '.join(reversed(names))
+
+        def duration(self):
+            return (self.endTime or time.time()) - self.startTime
+
+        def toDict(self):
+            return {
+                'name': self.name,
+                'tags': dict(self.tags),
+                'duration': self.duration(),
+                'requests': self.requests,
+                'bytes': self.bytes,
+                'errors': self.errors,
+                'statuses': dict(self.statuses),
+                'children': [child.toDict() for child in list(self.children)],
+            }
+
+    class _Activation(object):
+        def __init__(self, tracer, span, finish=False):
+            self._tracer = tracer
+            self._span = span
+            self._finish = finish
+
+        def __enter__(self):
+            self._tracer._stack().append(self._span)
+            return self._span
+
+        def __exit__(self, excType, excValue, traceback):
+            self._tracer._stack().pop()
+            if self._finish:
+                self._tracer.finish(self._span)
+            return False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._roots = []
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def start(self, name, parent=None, **tags):
+        parent = parent or self.current()
+        span = self.Span(self, name, parent, tags)
+        with self._lock:
+            if parent:
+                parent.children.append(span)
+            else:
+                self._roots.append(span)
+        return span
+
+    def finish(self, span):
+        if span and span.endTime is None:
+            span.endTime = time.time()
+
+    def activate(self, span):
+        if not span:
+            return self._nullSpan
+        return self._Activation(self, span)
+
+    def span(self, name, **tags):
+        return self._Activation(self, self.start(name, **tags), finish=True)
+
+    def wrap(self, func):
+        parent = self.current()
+        if not parent:
+            return func
+        def wrapped(*args, **kwargs):
+            with self.activate(parent):
+                return func(*args, **kwargs)
+        return wrapped
+
+    def record(self, status=None, size=0, error=False):
+        span = self.current()
+        if span:
+            span.record(status, size, error)
+
+    def spans(self):
+        """
+        Recorded span trees, one per root span, e.g. one per getData() call
+        """
+        with self._lock:
+            roots = list(self._roots)
+        return [root.toDict() for root in roots]
+
+    def report(self):
+        """
+        Spans aggregated by path
+
+        Out:
+            {
+                'getData > api:feed > page > request:api': {
+                    'count': 12,                # spans of this path
+                    'totalTime': 1.52,          # seconds, spans of worker threads overlap
+                    'maxTime': 0.31,
+                    'requests': 12,
+                    'bytes': 145320,
+                    'errors': 0,
+                    'statuses': { 200: 11, 500: 1 },
+                }, ...
+            }
+        """
+        with self._lock:
+            pending = list(self._roots)
+        report = {}
+        while pending:
+            span = pending.pop()
+            pending.extend(list(span.children))
+            entry = report.setdefault(span.path(), {
+                'count': 0,
+                'totalTime': 0.0,
+                'maxTime': 0.0,
+                'requests': 0,
+                'bytes': 0,
+                'errors': 0,
+                'statuses': {},
+            })
+            duration = span.duration()
+            entry['count'] += 1
+            entry['totalTime'] += duration
+            entry['maxTime'] = max(entry['maxTime'], duration)
+            entry['requests'] += span.requests
+            entry['bytes'] += span.bytes
+            entry['errors'] += span.errors
+            for status, count in span.statuses.iteritems():
+                entry['statuses'][status] = entry['statuses'].get(status, 0) + count
+        return report
+
+    def formatReport(self):
+        """
+        report() as a text table in path order
+        """
+        lines = ['%-72s %7s %9s %9s %8s %10s  %s' % ('span', 'count', 'total s', 'max s', 'requests', 'bytes', 'statuses')]
+        for path, entry in sorted(self.report().iteritems()):
+            depth = path.count(' > ')
+            lines.append('%-72s %7d %9.3f %9.3f %8d %10d  %s' % (
+                '  ' * depth + path.rsplit(' > ', 1)[-1],
+                entry['count'],
+                entry['totalTime'],
+                entry['maxTime'],
+                entry['requests'],
+                entry['bytes'],
+                ' '.join('{0}:{1}'.format(status, count) for status, count in sorted(entry['statuses'].iteritems())),
+            ))
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._roots = []
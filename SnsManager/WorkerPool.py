@@ -0,0 +1,193 @@
+import sys
+import time
+import Queue
+import atexit
+import weakref
+import threading
+
+# Live pools, closed at exit so that idle daemon workers do not wake up during interpreter shutdown
+_pools = weakref.WeakSet()
+
+class WorkerPool(object):
+    """
+    Bounded pool of daemon worker threads
+
+    Tasks may carry a key (e.g. a host name), and at most perKeyLimit tasks with the same key run at once.
+    A pool created with size 0 runs every task synchronously in submit().
+    Workers are released after the pool had no task for idleTimeout seconds and are started again by the next submit(),
+    so a pool nobody closed does not keep its threads for the life of the process.
+    """
+    # Seconds the pool stays without tasks before its workers are released
+    IDLE_TIMEOUT = 2.0
+
+    class Task(object):
+        def __init__(self, func, args, kwargs, key=None):
+            self.key = key
+            self._func = func
+            self._args = args
+            self._kwargs = kwargs
+            self._result = None
+            self._excInfo = None
+            self._done = threading.Event()
+
+        def run(self):
+            try:
+                self._result = self._func(*self._args, **self._kwargs)
+            except:
+                self._excInfo = sys.exc_info()
+            finally:
+                self._done.set()
+
+        def done(self):
+            return self._done.is_set()
+
+        def result(self, timeout=None):
+            """
+            Wait for the task and return its result, exceptions raised by the task are re-raised here
+            """
+            self._done.wait(timeout)
+            if not self._done.is_set():
+                raise RuntimeError('Task did not finish in time.')
+            if self._excInfo:
+                raise self._excInfo[0], self._excInfo[1], self._excInfo[2]
+            return self._result
+
+    def __init__(self, size=4, perKeyLimit=None, idleTimeout=None):
+        """
+        Constructor of WorkerPool
+
+        In:
+            size                --  number of worker threads, 0 means running tasks synchronously
+            perKeyLimit         --  maximum running tasks with the same key *optional*
+            idleTimeout         --  seconds without tasks before workers are released *optional* default is IDLE_TIMEOUT
+
+        """
+        self._size = size
+        self._perKeyLimit = perKeyLimit
+        self._idleTimeout = idleTimeout if idleTimeout is not None else self.IDLE_TIMEOUT
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._keySemaphores = {}
+        # Tasks queued or running, workers are released by a reaper timer after it stayed 0 for idleTimeout
+        self._pending = 0
+        self._idleSince = None
+        self._reaper = None
+        # Cancelled reapers exit on their next poll of Python 2's timed wait, close() with timeout waits for them
+        self._cancelledReapers = []
+        _pools.add(self)
+
+    def submit(self, func, *args, **kwargs):
+        return self.submitKeyed(None, func, *args, **kwargs)
+
+    def submitKeyed(self, key, func, *args, **kwargs):
+        task = self.Task(func, args, kwargs, key=key)
+        if self._size <= 0:
+            self._runTask(task)
+            return task
+        with self._lock:
+            self._pending += 1
+        self._startWorkers()
+        self._queue.put(task)
+        return task
+
+    def _startWorkers(self):
+        if len(self._threads) >= self._size:
+            return
+        with self._lock:
+            while len(self._threads) < self._size:
+                thread = threading.Thread(target=self._worker, name='WorkerPool-{0}'.format(len(self._threads)))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _keySemaphore(self, key):
+        if key is None or not self._perKeyLimit:
+            return None
+        with self._lock:
+            if key not in self._keySemaphores:
+                self._keySemaphores[key] = threading.Semaphore(self._perKeyLimit)
+            return self._keySemaphores[key]
+
+    def _runTask(self, task):
+        semaphore = self._keySemaphore(task.key)
+        if semaphore:
+            semaphore.acquire()
+        try:
+            task.run()
+        finally:
+            if semaphore:
+                semaphore.release()
+
+    def close(self, timeout=None):
+        """
+        Stop worker threads after queued tasks are done, the pool can start new workers if submitted again
+
+        In:
+            timeout             --  seconds to wait for each worker to stop *optional* default is not waiting
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+            if self._reaper:
+                self._reaper.cancel()
+                self._cancelledReapers.append(self._reaper)
+                self._reaper = None
+            self._cancelledReapers = [reaper for reaper in self._cancelledReapers if reaper.is_alive()]
+            reapers = list(self._cancelledReapers)
+        for thread in threads:
+            self._queue.put(None)
+        if timeout is not None:
+            for thread in threads + reapers:
+                thread.join(timeout)
+
+    def _taskDone(self):
+        with self._lock:
+            self._pending -= 1
+            if self._pending:
+                return
+            self._idleSince = time.time()
+            # One reaper at a time, it waits again if tasks came and went meanwhile, none if close() released workers
+            if self._threads and not self._reaper:
+                self._startReaper(self._idleTimeout)
+
+    def _startReaper(self, delay):
+        """
+        Release workers after delay if the pool is still idle, lock is held by caller
+        """
+        self._reaper = threading.Timer(delay, self._reap)
+        self._reaper.name = 'WorkerPool-reaper'
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def _reap(self):
+        with self._lock:
+            # close() took the reaper over while it was waiting for the lock
+            if self._reaper is not threading.current_thread():
+                return
+            self._reaper = None
+            if self._pending:
+                return
+            idleTime = time.time() - self._idleSince
+            if idleTime < self._idleTimeout:
+                self._startReaper(self._idleTimeout - idleTime)
+                return
+            # Released under the lock, so a task submitted right after starts new workers
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            self._queue.put(None)
+
+    def _worker(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                self._runTask(task)
+                self._taskDone()
+            finally:
+                self._queue.task_done()
+
+@atexit.register
+def _closePools():
+    for pool in list(_pools):
+        pool.close(timeout=1)
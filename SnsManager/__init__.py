@@ -1,2 +1,7 @@
-from SnsBase import ErrorCode
-from IExporter import IExporter
+from LazyImport import lazyModule
+
+# Exports are imported on first access, so that importing a provider does not load the others
+lazyModule(__name__, {
+    'ErrorCode': 'SnsBase',
+    'IExporter': 'IExporter',
+})
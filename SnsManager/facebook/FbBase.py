@@ -1,35 +1,60 @@
-import urllib, urllib2
+import urllib
+import urlparse
 import urllib3, urllib3.exceptions
 import json
 from SnsManager.SnsBase import SnsBase, ErrorCode
 
 class FbBase(SnsBase):
+    # Graph API accepts at most 50 sub-requests in one batch request
+    FB_BATCH_LIMIT = 50
+    # Graph API error codes of application, user and page level rate limiting
+    FB_QUOTA_ERROR_CODES = (4, 17, 32, 341, 613)
+    # Kept-alive connections to Graph API, which is called by crawlers and lookups concurrently
+    FB_GRAPH_POOL_SIZE = 10
+
     def __init__(self, *args, **kwargs):
         """
         Constructor of FbBase
+
+        In:
+            graphPoolSize       --  kept-alive connections to Graph API *optional* default is FB_GRAPH_POOL_SIZE
+                                    Not used with sharedHttpPool, whose hostPoolSizes are set by HttpClient.shared().
+            graphUri            --  base uri of Graph API, e.g. a local fake server for tests *optional* default is https://graph.facebook.com/
+
         """
         super(FbBase, self).__init__(*args, **kwargs)
-        self._graphUri = 'https://graph.facebook.com/'
-        self.myName, self.myEmail, self.myId = self._cacheMyInfo()
+        self._graphUri = kwargs.get('graphUri', 'https://graph.facebook.com/')
+        if self._sharedHttpPool:
+            if 'graphPoolSize' in kwargs:
+                raise ValueError('Invalid parameters.')
+        else:
+            self._httpConn.setHostPoolSize(urlparse.urlsplit(self._graphUri).hostname, kwargs.get('graphPoolSize', self.FB_GRAPH_POOL_SIZE))
 
-    def _cacheMyInfo(self):
+    def _resolveIdentity(self):
         uri = urllib.basejoin(self._graphUri, '/me')
         uri += '?{0}'.format(urllib.urlencode({
             'access_token': self._accessToken,
         }))
         try:
-            conn = self._httpConn.urlopen('GET', uri, timeout=self._timeout)
+            conn = self._request('me', 'GET', uri, timeout=self._timeout)
             resp = json.loads(conn.data)
         except urllib3.exceptions.HTTPError as e:
             self._logger.error('Unable to get data from Facebook. uri[{0}] e[{1}]'.format(uri, e))
-            return None, None, None
+            return None
         except ValueError as e:
             self._logger.error('Unable to parse returned data. data[{0}] e[{1}]'.format(conn.data, e))
-            return None, None, None
+            return None
+        return self._identityFromMe(resp)
+
+    def _identityFromMe(self, resp):
         if not resp or 'name' not in resp or 'email' not in resp or 'id' not in resp:
             self._logger.error('Unable to get name or email attribute from returned data. resp[{0}]'.format(json.dumps(resp)))
-            return None, None, None
-        return resp['name'], resp['email'], resp['id']
+            return None
+        return {
+            'myId': resp['id'],
+            'myName': resp['name'],
+            'myEmail': resp['email'],
+        }
 
     def getMyName(self):
         return self.myName
@@ -37,9 +62,6 @@ class FbBase(SnsBase):
     def getMyEmail(self):
         return self.myEmail
 
-    def getMyId(self):
-        return self.myId
-
     def getMyAvatar(self, type='square'):
         """
             Get Avatar link
@@ -56,25 +78,140 @@ class FbBase(SnsBase):
             'type': type,
         }))
         try:
-            conn = urllib2.urlopen(uri, timeout=self._timeout)
-            imgUri = conn.geturl() # Facebook will trigger redirect and we need the uri not the data
+            # Facebook will trigger redirect and we need the uri not the data
+            conn = self._request('picture', 'GET', uri, redirect=False, timeout=self._timeout)
+            imgUri = conn.get_redirect_location() or uri
         except urllib3.exceptions.HTTPError as e:
             self._logger.error('Unable to get data from Facebook. e[{0}]'.format(e))
             return None
         return imgUri
 
+    def _graphBatch(self, relativeUrls):
+        """
+            Issue GET requests through Graph API batch request
+
+            In:
+                relativeUrls    --  list of relative urls, e.g. [ '12345', '67890/photos?limit=25' ]
+
+            Out:
+                list of decoded response bodies in the same order as relativeUrls,
+                None for the sub-requests which could not be retrieved
+        """
+        return [self._decodeBatchBody(subResp) for subResp in self._graphBatchResponses(relativeUrls)]
+
+    def _graphBatchResponses(self, relativeUrls, etags=None):
+        """
+            Issue GET requests through Graph API batch request, conditionally for the ones with an ETag
+
+            In:
+                relativeUrls    --  list of relative urls, e.g. [ '12345', '67890/photos?limit=25' ]
+                etags           --  list of ETags sent as If-None-Match in the same order as relativeUrls,
+                                    None for unconditional sub-requests *optional*
+
+            Out:
+                list of sub-responses in the same order as relativeUrls,
+                None for the sub-requests which could not be retrieved
+                {
+                    'code': 200,                # 304 if the ETag still matches, without body
+                    'headers': [ { 'name': 'ETag', 'value': '"abc"' } ],
+                    'body': '{"id": "12345"}',
+                }
+        """
+        etags = etags or [None] * len(relativeUrls)
+        results = []
+        for offset in xrange(0, len(relativeUrls), self.FB_BATCH_LIMIT):
+            chunk = relativeUrls[offset:offset + self.FB_BATCH_LIMIT]
+            subRequests = []
+            for url, etag in zip(chunk, etags[offset:offset + self.FB_BATCH_LIMIT]):
+                subRequest = {'method': 'GET', 'relative_url': url}
+                if etag:
+                    subRequest['headers'] = [{'name': 'If-None-Match', 'value': etag}]
+                subRequests.append(subRequest)
+            body = urllib.urlencode({
+                'access_token': self._accessToken,
+                'batch': json.dumps(subRequests),
+            })
+            self._logger.debug('Batch request to retrieve. count[{0}]'.format(len(chunk)))
+            try:
+                conn = self._request('batch', 'POST', self._graphUri, body=body, headers={
+                    'Content-Type': 'application/x-www-form-urlencoded',
+                }, timeout=self._timeout)
+                resp = json.loads(conn.data)
+            except urllib3.exceptions.HTTPError as e:
+                self._logger.error('Unable to get batch data from Facebook. e[{0}]'.format(e))
+                results += [None] * len(chunk)
+                continue
+            except ValueError as e:
+                self._logger.error('Unable to parse returned data. data[{0}] e[{1}]'.format(conn.data, e))
+                results += [None] * len(chunk)
+                continue
+            if type(resp) != list or len(resp) != len(chunk):
+                if self._isAuthError(resp):
+                    self._invalidateTokenValidation()
+                self._logger.error('Unexpected batch response. data[{0}]'.format(conn.data))
+                results += [None] * len(chunk)
+                continue
+
+            # Facebook returns null for sub-requests which did not complete in time
+            results += [subResp if type(subResp) == dict else None for subResp in resp]
+        return results
+
+    def _decodeBatchBody(self, subResp):
+        """
+            Decoded body of a sub-response of _graphBatchResponses(), None if it has no valid body
+        """
+        if type(subResp) != dict or not subResp.get('body'):
+            return None
+        try:
+            return json.loads(subResp['body'])
+        except ValueError:
+            return None
+
+    def _batchHeader(self, subResp, name, default=None):
+        """
+            Header of a sub-response of _graphBatchResponses()
+        """
+        for header in subResp.get('headers', None) or []:
+            if type(header) == dict and header.get('name', '').lower() == name.lower():
+                return header.get('value', default)
+        return default
+
+    def _isAuthError(self, resp):
+        """
+            Check whether Graph API returned error is about invalid token or missing permission
+        """
+        if type(resp) != dict or type(resp.get('error', None)) != dict:
+            return False
+        code = resp['error'].get('code', None)
+        return code in (10, 102, 190) or (type(code) == int and 200 <= code < 300)
+
+    def _isQuotaError(self, resp):
+        """
+            Check whether Graph API returned error is about rate limiting
+        """
+        if type(resp) != dict or type(resp.get('error', None)) != dict:
+            return False
+        return resp['error'].get('code', None) in self.FB_QUOTA_ERROR_CODES
+
     def isTokenValid(self):
         uri = urllib.basejoin(self._graphUri, '/me')
         uri += '?{0}'.format(urllib.urlencode({
             'access_token': self._accessToken,
         }))
         try:
-            conn = self._httpConn.urlopen('GET', uri, timeout=self._timeout)
+            conn = self._request('me', 'GET', uri, timeout=self._timeout)
             respCode = conn.status
         except urllib3.exceptions.HTTPError as e:
             self._logger.error('Unable to get data from Facebook. uri[{0}] e[{0}]'.format(uri, e))
             return ErrorCode.E_FAILED
         if respCode == 200:
+            # /me is the identity as well, keep it for lazy myId/myName/myEmail
+            try:
+                identity = self._identityFromMe(json.loads(conn.data))
+            except ValueError:
+                identity = None
+            if identity:
+                self._seedIdentity(identity)
             return ErrorCode.S_OK
 
         try:
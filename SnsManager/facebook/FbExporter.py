@@ -1,21 +1,54 @@
-import os
 import re
-import time
+import bisect
+import threading
 import json
-import uuid
-import dateutil
-import urllib, urllib2
+import urllib
 import urllib3, urllib3.exceptions
 import urlparse
-import lxml.html
 from datetime import datetime, timedelta
-from dateutil import parser as dateParser
 from FbBase import FbBase
 from SnsManager import ErrorCode, IExporter
+from SnsManager.TimeCodec import parseTime, datetime2Timestamp
+from SnsManager.LruCache import LruCache
+from SnsManager.SingleFlightMemo import SingleFlightMemo
+from SnsManager.DiskCache import DiskCache
+from SnsManager.WorkerPool import WorkerPool
 
 class FbExporter(FbBase, IExporter):
     FB_PHOTO_SIZE_TYPE_MAXIMUM = 0
     FB_PHOTO_SIZE_TYPE_MEDIUM = 1
+    # sizeType of photo descriptors, see getData(metadataOnly=True)
+    FB_PHOTO_SIZE_NAMES = {
+        FB_PHOTO_SIZE_TYPE_MAXIMUM: 'maximum',
+        FB_PHOTO_SIZE_TYPE_MEDIUM: 'medium',
+    }
+    # sizeType of photos from 'picture' fields, which are thumbnails tried to be upgraded to originals while downloading
+    FB_PHOTO_SIZE_PICTURE = 'picture'
+
+    # Please make sure feed placed in first api call, since we are now havve more confident for feed API data
+    # Do not handle video currently
+    #FB_API_LIST = ['feed', 'statuses', 'checkins', 'videos', 'links', 'notes']
+    FB_API_LIST = ['feed', 'statuses', 'checkins', 'links', 'notes']
+
+    # Fields requested for each API, parsers use embedded data and fall back to object lookups when it is missing.
+    # None means Facebook's default fields.
+    FB_GRAPH_FIELDS = {
+        'feed': 'id,from,type,status_type,message,story,caption,description,name,link,picture,object_id,application,created_time,updated_time,place,with_tags',
+        'statuses': None,
+        'checkins': None,
+        'videos': None,
+        'links': None,
+        'notes': None,
+        'albumPhotos': 'id,from,created_time,link,picture,images,tags,place',
+    }
+
+    # Seconds Graph API responses stay fresh in diskCache by endpoint, stale ones are revalidated with their ETag
+    FB_DISK_CACHE_TTLS = {
+        'photo': 7 * 86400,
+        'album': 86400,
+        'object': 86400,
+        'tags': 7 * 86400,
+    }
 
     def __init__(self, *args, **kwargs):
         """
@@ -23,13 +56,47 @@ class FbExporter(FbBase, IExporter):
 
         In:
             tmpFolder           --  tmp folder to store photo files *optional* default is /tmp 
+            graphFields         --  dict of api to 'fields' parameter, overrides FB_GRAPH_FIELDS *optional*
+            albumCacheSize      --  maximum albums in album metadata cache *optional* default is 256
+            albumCacheTtl       --  seconds an album metadata stays in cache *optional* default is 3600
+            keepAlbumCache      --  keep album metadata cache across getData() calls *optional* default is False
+            parallelCrawl       --  crawl APIs concurrently by default, see getData() *optional* default is False
+            lookupPoolSize      --  number of concurrent lookups, e.g. album pages, while preparing a page *optional* default is 4
+            checkpointStore     --  CheckpointStore to save crawl progress for resuming, see getData() *optional*
+            diskCache           --  DiskCache of Graph objects and tagged people pages across runs and processes *optional*
+            diskCachePath       --  path of a sqlite file to create diskCache in, if diskCache is not given *optional*
+            diskCacheSize       --  maximum bytes of diskCache created by diskCachePath *optional* default is 64MB
+            diskCacheTtls       --  dict of endpoint to seconds, overrides FB_DISK_CACHE_TTLS *optional*
 
         """
         super(FbExporter, self).__init__(*args, **kwargs)
 
         self._tmpFolder = kwargs['tmpFolder'] if 'tmpFolder' in kwargs else '/tmp'
-        self._multiApiCrawlerSince = kwargs['multiApiCrawlerSince'] if 'multiApiCrawlerSince' in kwargs else dateParser.parse('2010-12-31')
+        self._multiApiCrawlerSince = kwargs['multiApiCrawlerSince'] if 'multiApiCrawlerSince' in kwargs else datetime(2010, 12, 31)
         self.verbose = kwargs['verbose'] if 'verbose' in kwargs else False
+        self._graphFields = dict(self.FB_GRAPH_FIELDS)
+        self._graphFields.update(kwargs.get('graphFields', {}))
+        # Graph objects retrieved during one getData() call, keyed by Graph ID and shared by all handlers
+        self._graphObjects = SingleFlightMemo()
+        # FbAlbumFeedsHandler instances of one getData() call, keyed by album ID
+        self._albumFeedsHandlers = SingleFlightMemo()
+        # Album metadata for photo post classification, keyed by album ID
+        self._albumCache = LruCache(maxSize=kwargs.get('albumCacheSize', 256), ttl=kwargs.get('albumCacheTtl', 3600))
+        self._keepAlbumCache = kwargs.get('keepAlbumCache', False)
+        self._parallelCrawl = kwargs.get('parallelCrawl', False)
+        # Created on the first parallel crawl, see _getCrawlPool()
+        self._crawlPool = None
+        self._crawlPoolLock = threading.Lock()
+        self._lookupPool = WorkerPool(size=kwargs.get('lookupPoolSize', 4))
+        self._checkpointStore = kwargs.get('checkpointStore', None)
+        self._diskCache = kwargs.get('diskCache', None)
+        # diskCache given by the caller could be shared, only the one created here is closed by close()
+        self._ownDiskCache = self._diskCache is None and bool(kwargs.get('diskCachePath', None))
+        if self._ownDiskCache:
+            self._diskCache = DiskCache(path=kwargs['diskCachePath'], maxSize=kwargs.get('diskCacheSize', 64 * 1024 * 1024), ttls=self.FB_DISK_CACHE_TTLS)
+        if self._diskCache is not None:
+            for endpoint, ttl in kwargs.get('diskCacheTtls', {}).iteritems():
+                self._diskCache.setTtl(endpoint, ttl)
 
     def getData(self, **kwargs):
         """
@@ -42,6 +109,19 @@ class FbExporter(FbBase, IExporter):
             until           --  The end time to get date
                                 given None means yesterday
                                 or given python's datetime instance as input
+            parallelCrawl   --  Crawl feed, statuses, checkins, links and notes APIs concurrently *optional*
+                                default is the parallelCrawl given to constructor
+                                The result is the same as crawling one by one, feed data wins conflicts.
+            checkpoint      --  checkpoint returned by a failed getData() with the same since/until to resume from *optional*
+            checkpointKey   --  key of the checkpoint in checkpointStore *optional* default is 'FbExporter-<myId>'
+                                Progress is saved to checkpointStore after every page and a saved checkpoint is resumed,
+                                the checkpoint is deleted after crawling finished successfully.
+                                Records returned before the checkpoint was taken are not returned again.
+            metadataOnly    --  Do not download photos, leave descriptors of them in records' photos *optional* default is False
+                                Pass records, or the ones picked out of them, to materialize() to download photos later.
+            fields          --  list of optional fields of OPTIONAL_FIELDS to compute, e.g. [ 'place' ] *optional*
+                                default is None which means all of them
+                                Fields not listed are left out of records, and lookups, pages and downloads only they need are skipped.
 
             Example: (Please note that the direction to retrieve data is backward)
                 Now   --->   2012/04/01   --->   2012/01/01
@@ -57,14 +137,16 @@ class FbExporter(FbBase, IExporter):
                         'message': 'Text',                      # None if no message from Facebook
                         'caption': 'quoted text'                # None if no caption from Facebook
                         'links': [ 'uri' ],
-                        'photos': [ '/path/to/file' ],
+                        'photos': [ '/path/to/file' ],         # descriptors of SnsBase._photoDescriptor() if metadataOnly
                         'createdTime': <datetime object>,
                         'updatedTime': <datetime object>,
+                        'place': { 'name': 'placeName', 'latitude': nnn.nnn, 'longitude': mmm.mmm },  # *optional*
+                        'people': [ { 'id': 'userId', 'name': 'userName', 'avatar': 'uri' } ],        # *optional*
                     }, ...
                 },
                 'count': 30,                    # count in data dic
                 'retCode': ErrorCode.S_OK,    # returned code which is instance of ErrorCode
-
+                'checkpoint': { ... },          # only if failed after crawling started, pass it to getData() to resume
             }
         """
         retDict = {
@@ -72,25 +154,189 @@ class FbExporter(FbBase, IExporter):
             'count': 0,
             'data': {},
         }
+        state = {'retCode': ErrorCode.E_FAILED}
+        for parsedData in self._crawlPages(state, **kwargs):
+            self._mergeData(retDict['data'], parsedData)
+
+        retDict['retCode'] = state['retCode']
+        # Records crawled before a failure are returned as well, so they are counted either way
+        retDict['count'] = len(retDict['data'])
+        if ErrorCode.IS_FAILED(state['retCode']) and state.get('checkpoint', None):
+            retDict['checkpoint'] = state['checkpoint']
+        return retDict
+
+    def iterData(self, **kwargs):
+        """
+        Get data from Facebook feed as a stream of records
+
+        In:
+            The same as getData()
+
+        Out:
+            Return a FbDataIterator object which yields the record dicts of getData() one by one,
+            records are crawled page by page while iterating and duplicated ids are skipped.
+            After the iteration finished, its retCode, count and checkpoint attributes have the same meaning as getData()'s.
+        """
+        return self.FbDataIterator(outerObj=self, **kwargs)
+
+    def _crawlPages(self, state, **kwargs):
+        """
+        Generator of parsed records page by page, state['retCode'] and state['checkpoint'] are set when crawling finished
+        """
         since = kwargs.get('since', None)
         until = kwargs.get('until', None)
         self._setFbPhotoSizeType(kwargs.get('fbPhotoSizeType', self.FB_PHOTO_SIZE_TYPE_MAXIMUM))
+        self._metadataOnly = kwargs.get('metadataOnly', False)
+        self._setFields(kwargs.get('fields', None))
 
         if not until:
             until = datetime.now() - timedelta(1)
 
-        tokenValidRet = self.isTokenValid()
-        if ErrorCode.IS_FAILED(tokenValidRet):
-            retDict['retCode'] = tokenValidRet
-            return retDict
+        # Spans of this run are children of runSpan, which is not made current across yields
+        runSpan = self._tracer.start('getData')
+        crawlers = None
+        try:
+            with self._tracer.activate(runSpan):
+                tokenValidRet = self._validateToken()
+                if ErrorCode.IS_FAILED(tokenValidRet):
+                    state['retCode'] = tokenValidRet
+                    return
+
+                if not self.myId:
+                    return
+
+            self._graphObjects = SingleFlightMemo()
+            self._albumFeedsHandlers = SingleFlightMemo()
+            if not self._keepAlbumCache:
+                self._albumCache.clear()
+
+            checkpointKey = kwargs.get('checkpointKey', 'FbExporter-{0}'.format(self.myId))
+            # The caller's since/until, until defaults to a time which moves on every run
+            checkpoint = self._loadCheckpoint(kwargs.get('checkpoint', None), checkpointKey, kwargs.get('since', None), kwargs.get('until', None))
+            state['checkpoint'] = checkpoint
+            emittedIds = set(checkpoint.pop('emittedIds', []))
+            if self._checkpointStore:
+                emittedIds.update(self._checkpointStore.loadIds(checkpointKey))
+
+            plan = self._resumeCrawlPlan(self._apiCrawlPlan(since, until), checkpoint)
+            crawlers = self._apiCrawlers(plan, kwargs.get('parallelCrawl', self._parallelCrawl), runSpan)
+            for api, apiState, pages in crawlers:
+                for parsedData, cursor in pages:
+                    # Records are handed out once, the first of the same id is kept as _mergeData() does
+                    pageData = []
+                    for data in parsedData:
+                        if data['id'] in emittedIds:
+                            self._logger.debug("Conflict data. data[%s]" % (data))
+                            continue
+                        emittedIds.add(data['id'])
+                        pageData.append(data)
+                    yield pageData
+                    # The page was handed out, so the next crawl starts from the next page
+                    checkpoint['apis'][api] = cursor
+                    self._saveCheckpoint(checkpointKey, checkpoint, [data['id'] for data in pageData])
+                if apiState['retCode'] != ErrorCode.S_OK:
+                    # Crawling stops here, crawled data and the checkpoint to resume from are kept,
+                    # ids are put into the returned checkpoint once, since it could be resumed without checkpointStore
+                    checkpoint['emittedIds'] = list(emittedIds)
+                    state['retCode'] = apiState['retCode']
+                    return
+                checkpoint['apis'][api] = self._apiCursor(done=True)
+                self._saveCheckpoint(checkpointKey, checkpoint)
+
+            if self._checkpointStore:
+                self._checkpointStore.delete(checkpointKey)
+            state['retCode'] = ErrorCode.S_OK
+        finally:
+            if crawlers:
+                # Stop crawls of the APIs not read yet, e.g. after an API failed
+                crawlers.close()
+            # Crawls and lookups belong to this call, their workers are not kept until the next one
+            self._releaseWorkers()
+            self._tracer.finish(runSpan)
+
+    def _loadCheckpoint(self, checkpoint, checkpointKey, since, until):
+        """
+        Checkpoint to resume from, a new one if there is no checkpoint of the same since/until
+
+        A checkpoint is a JSON serializable dict
+        {
+            'since': 1345539824,        # timestamps of getData()'s since/until arguments, None if not given
+            'until': 1333238400,
+            'apis': {                   # cursor of every started API, see _apiCursor()
+                'feed': { 'until': 1343798400, 'after': None, 'done': False }, ...
+            },
+            'emittedIds': [ 'postId', ... ],    # only in the checkpoint returned by getData()
+        }
+        Ids of returned records are appended to checkpointStore page by page, see CheckpointStore.appendIds().
+        """
+        sinceTs = self._datetime2Timestamp(since) if since else None
+        untilTs = self._datetime2Timestamp(until) if until else None
+        if not checkpoint and self._checkpointStore:
+            checkpoint = self._checkpointStore.load(checkpointKey)
+        if checkpoint:
+            if checkpoint.get('since', None) == sinceTs and checkpoint.get('until', None) == untilTs:
+                self._logger.info('Resume crawling from checkpoint. apis[{0}]'.format(checkpoint['apis']))
+                # Cursors are updated while crawling, the caller's checkpoint is left as it is
+                return dict(checkpoint, apis=dict(checkpoint['apis']))
+            self._logger.info('Checkpoint is for another time range, ignored.')
+        if self._checkpointStore:
+            # Ids of another time range must not skip records of this crawl
+            self._checkpointStore.delete(checkpointKey)
+        return {
+            'since': sinceTs,
+            'until': untilTs,
+            'apis': {},
+        }
 
-        if not self.myId:
-            return retDict
+    def _saveCheckpoint(self, checkpointKey, checkpoint, emittedIds=None):
+        """
+        Save checkpoint, then append emittedIds of the page it is taken after
+
+        Ids are appended after the cursor was saved, so a crash between them could only return a record of
+        another API again, while appending first could skip records of the page which is crawled again.
+        """
+        if not self._checkpointStore:
+            return
+        try:
+            self._checkpointStore.save(checkpointKey, checkpoint)
+            if emittedIds:
+                self._checkpointStore.appendIds(checkpointKey, emittedIds)
+        except:
+            self._logger.exception('Unable to save checkpoint. key[{0}]'.format(checkpointKey))
+
+    def _apiCursor(self, _since=None, _after=None, done=False):
+        """
+        Paging parameters of the next page of an API, 'until' is Graph API's until timestamp
+        """
+        return {
+            'until': self._datetime2Timestamp(_since) if _since and not _after else None,
+            'after': _after,
+            'done': done,
+        }
 
-        # Please make sure feed placed in first api call, since we are now havve more confident for feed API data
-        # Do not handle video currently
-        #for api in ['feed', 'statuses', 'checkins', 'videos', 'links', 'notes']:
-        for api in ['feed', 'statuses', 'checkins', 'links', 'notes']:
+    def _resumeCrawlPlan(self, plan, checkpoint):
+        """
+        Skip finished APIs and continue started APIs from their cursors
+        """
+        resumedPlan = []
+        for api, _since, _until, _after in plan:
+            cursor = checkpoint['apis'].get(api, None)
+            if cursor:
+                if cursor['done']:
+                    continue
+                if cursor['after']:
+                    _after = cursor['after']
+                elif cursor['until']:
+                    _since = datetime.fromtimestamp(cursor['until'])
+            resumedPlan.append((api, _since, _until, _after))
+        return resumedPlan
+
+    def _apiCrawlPlan(self, since, until):
+        """
+        List APIs to crawl with their (api, since, until, after) parameters
+        """
+        plan = []
+        for api in self.FB_API_LIST:
             if api != 'feed' and self._multiApiCrawlerSince and (not since or since > self._multiApiCrawlerSince):
                 _since = self._multiApiCrawlerSince
                 if _since < until:
@@ -104,37 +350,98 @@ class FbExporter(FbBase, IExporter):
                 _after = True
             else:
                 _after = None
-            errorCode, data = self._apiCrawler(api, _since, _until, after=_after)
-            failoverCount = 0
-            failoverThreshold = 3
+            plan.append((api, _since, _until, _after))
+        return plan
+
+    def _apiCrawlers(self, plan, parallel=False, span=None):
+        """
+        Generator of (api, apiState, pages) in plan order, see _crawlApi() for apiState and pages
+
+        In parallel mode, every API is crawled in crawl pool and its parsed pages are handed out after it finished.
+        If the caller stops reading, e.g. after an API failed, crawls still running stop before their next request
+        and are waited for when the generator is closed.
+        """
+        if not parallel:
+            for api, _since, _until, _after in plan:
+                apiState = {'retCode': ErrorCode.E_FAILED}
+                yield api, apiState, self._crawlApi(api, _since, _until, _after, apiState, span)
+            return
+
+        cancelled = threading.Event()
+        crawlPool = self._getCrawlPool()
+        tasks = []
+        try:
+            for api, _since, _until, _after in plan:
+                apiState = {'retCode': ErrorCode.E_FAILED}
+                tasks.append((api, apiState, crawlPool.submit(list, self._crawlApi(api, _since, _until, _after, apiState, span, cancelled))))
+            for api, apiState, task in tasks:
+                yield api, apiState, task.result()
+        finally:
+            cancelled.set()
+            for api, apiState, task in tasks:
+                try:
+                    task.result()
+                except:
+                    self._logger.exception('Crawling failed after cancelled. api[{0}]'.format(api))
+
+    def _getCrawlPool(self):
+        with self._crawlPoolLock:
+            if not self._crawlPool:
+                self._crawlPool = WorkerPool(size=len(self.FB_API_LIST))
+            return self._crawlPool
+
+    def _crawlApi(self, api, _since, _until, _after, state, span=None, cancelled=None):
+        """
+        Generator of (parsed records, cursor of the next page) of one API page by page,
+        state['retCode'] is set when crawling finished, it stays E_FAILED if cancelled, a threading.Event, was set
+
+        Every page is traced in a 'page' span under an 'api:<api>' span under span,
+        it covers the page request, its retries and parsing.
+        """
+        apiSpan = self._tracer.start('api:{0}'.format(api), parent=span)
+        pageSpan = self._tracer.start('page', parent=apiSpan)
+        try:
+            if cancelled and cancelled.is_set():
+                return
+            with self._tracer.activate(pageSpan):
+                errorCode, data = self._apiCrawler(api, _since, _until, after=_after)
+            retryCount = 0
             while errorCode != ErrorCode.E_NO_DATA:
                 if ErrorCode.IS_FAILED(errorCode):
-                    failoverCount += 1
-                    # If crawling failed (which is not no data), wait and try again
-                    if failoverCount <= failoverThreshold:
-                        time.sleep(2)
-                        errorCode, data = self._apiCrawler(api, _since, _until, after=_after)
+                    retryCount += 1
+                    if retryCount == 1:
+                        deadline = self._retryPolicy.deadline()
+                    # If crawling failed (which is not no data), wait and try the same page again
+                    if not (cancelled and cancelled.is_set()) and \
+                            self._retryPolicy.shouldRetry(errorCode, retryCount) and \
+                            self._retryPolicy.wait(errorCode, retryCount, data.get('retryAfter', None), cancelled, deadline):
+                        self._logger.info('Retry crawling. api[{0}] retryCount[{1}] errorCode[{2}]'.format(api, retryCount, errorCode))
+                        with self._tracer.activate(pageSpan):
+                            errorCode, data = self._apiCrawler(api, _since, _until, after=_after)
                         continue
                     else:
-                        # FIXME: For over threshold case, need to consider how to crawl following data
-                        # Currently return error
-                        retDict['retCode'] = errorCode
-                        return retDict
+                        state['retCode'] = errorCode
+                        return
+                # Retries are counted per page, so a long crawl survives several short outages
+                retryCount = 0
 
                 apiHandler = self._apiHandlerFactory(api)(data=data, outerObj=self)
 
-                if _after:
-                    parsedData, stopCrawling = apiHandler.parse({'since': _since, 'until': _until})
-                    self._mergeData(retDict['data'], parsedData)
-                    if stopCrawling:
-                        errorCode = ErrorCode.E_NO_DATA
-                        continue
-                else:
-                    parsedData, stopCrawling = apiHandler.parse()
-                    self._mergeData(retDict['data'], parsedData)
+                with self._tracer.activate(pageSpan):
+                    if _after:
+                        parsedData, stopCrawling = apiHandler.parse({'since': _since, 'until': _until})
+                    else:
+                        parsedData, stopCrawling = apiHandler.parse()
+                self._tracer.finish(pageSpan)
+
+                if _after and stopCrawling:
+                    yield parsedData, self._apiCursor(done=True)
+                    errorCode = ErrorCode.E_NO_DATA
+                    continue
 
                 if 'next' not in data['paging']:
                     self._logger.debug('Unable to locate next in paging.')
+                    yield parsedData, self._apiCursor(done=True)
                     errorCode = ErrorCode.E_NO_DATA
                     continue
 
@@ -148,17 +455,159 @@ class FbExporter(FbBase, IExporter):
                     _after = pagingNext['after'][0]
 
                 if _after:
-                    errorCode, data = self._apiCrawler(api, _since, _until, after=_after)
+                    yield parsedData, self._apiCursor(_since, _after)
                 elif _since and newSince >= _since:
                     self._logger.info("No more data for next paging's until >= current until")
+                    yield parsedData, self._apiCursor(done=True)
                     errorCode = ErrorCode.E_NO_DATA
+                    continue
                 else:
                     _since = newSince
+                    yield parsedData, self._apiCursor(_since, _after)
+
+                if cancelled and cancelled.is_set():
+                    return
+                pageSpan = self._tracer.start('page', parent=apiSpan)
+                with self._tracer.activate(pageSpan):
                     errorCode, data = self._apiCrawler(api, _since, _until, after=_after)
 
-        retDict['count'] = len(retDict['data'])
-        retDict['retCode'] = ErrorCode.S_OK
-        return retDict
+            state['retCode'] = ErrorCode.S_OK
+        finally:
+            self._tracer.finish(pageSpan)
+            self._tracer.finish(apiSpan)
+
+    def close(self):
+        """
+        Stop worker threads of lookups and downloads and close owned connections and diskCache, see SnsBase.close()
+        """
+        self._releaseWorkers(timeout=self.CLOSE_TIMEOUT)
+        if self._ownDiskCache:
+            self._diskCache.close()
+        super(FbExporter, self).close()
+
+    def _releaseWorkers(self, timeout=None):
+        """
+        Stop workers of crawl and lookup pools after their queued tasks, the next getData() starts them again
+        """
+        with self._crawlPoolLock:
+            crawlPool = self._crawlPool
+        if crawlPool:
+            crawlPool.close(timeout=timeout)
+        self._lookupPool.close(timeout=timeout)
+
+    def getAlbumCacheStats(self):
+        """
+        Statistics of album metadata cache, a dict with hits, misses, size and maxSize
+        """
+        return self._albumCache.stats()
+
+    def getGraphObjectStats(self):
+        """
+        Statistics of Graph object lookups of the last getData() call, a dict with hits, misses, waits and size
+        """
+        return self._graphObjects.stats()
+
+    def getDiskCacheStats(self):
+        """
+        Statistics of diskCache, a dict with hits, stales, misses, revalidations, evictions, size and maxSize, None if it is disabled
+        """
+        return self._diskCache.stats() if self._diskCache is not None else None
+
+    def _diskCacheKey(self, uri):
+        """
+        Key of a Graph API uri in diskCache, e.g. '100001:12345/tags?limit=25'
+
+        Responses depend on who is asking, so keys are per account and access_token is left out.
+        """
+        splitted = urlparse.urlsplit(uri)
+        query = sorted((k, v) for k, v in urlparse.parse_qsl(splitted.query) if k != 'access_token')
+        key = '{0}:{1}'.format(self.myId, splitted.path.strip('/'))
+        return '{0}?{1}'.format(key, urllib.urlencode(query)) if query else key
+
+    def _cachedGraphGet(self, name, uri, endpointOf):
+        """
+        GET a Graph API uri through diskCache
+
+        In:
+            name                --  kind of the request in traces, e.g. 'object'
+            uri                 --  uri with access_token
+            endpointOf          --  function(decoded body) returns the endpoint to cache the response as, None not to cache it
+
+        Out:
+            decoded response body, raises like _request() and json.loads()
+        """
+        if self._diskCache is None:
+            return json.loads(self._request(name, 'GET', uri, timeout=self._timeout).data)
+        key = self._diskCacheKey(uri)
+        entry = self._diskCache.lookup(key)
+        if entry and entry['fresh']:
+            return json.loads(entry['body'])
+        headers = {'If-None-Match': entry['etag']} if entry and entry['etag'] else {}
+        conn = self._request(name, 'GET', uri, headers=headers, timeout=self._timeout)
+        return self._diskCacheResponse(key, entry, conn.status, conn.data, conn.headers.get('ETag', None), endpointOf)
+
+    def _cachedGraphBatch(self, relativeUrls, endpointOf):
+        """
+        _graphBatch() through diskCache, only the sub-requests without a fresh entry are sent
+        """
+        if self._diskCache is None:
+            return self._graphBatch(relativeUrls)
+        results = [None] * len(relativeUrls)
+        pending = []
+        for index, url in enumerate(relativeUrls):
+            key = self._diskCacheKey(url)
+            entry = self._diskCache.lookup(key)
+            if entry and entry['fresh']:
+                results[index] = json.loads(entry['body'])
+            else:
+                pending.append((index, key, entry))
+        if not pending:
+            return results
+
+        subResps = self._graphBatchResponses([relativeUrls[index] for index, key, entry in pending], [entry['etag'] if entry else None for index, key, entry in pending])
+        for (index, key, entry), subResp in zip(pending, subResps):
+            if subResp is None:
+                continue
+            try:
+                results[index] = self._diskCacheResponse(key, entry, subResp.get('code', None), subResp.get('body', None), self._batchHeader(subResp, 'ETag'), endpointOf)
+            except (TypeError, ValueError):
+                results[index] = None
+        return results
+
+    def _diskCacheResponse(self, key, entry, status, body, etag, endpointOf):
+        """
+        Decoded body of a response to a request through diskCache, entry of key is revalidated on 304 or replaced on 200
+        """
+        if status == 304 and entry:
+            self._diskCache.revalidated(key)
+            return json.loads(entry['body'])
+        resp = json.loads(body)
+        endpoint = endpointOf(resp) if status == 200 else None
+        if endpoint:
+            self._diskCache.store(key, endpoint, body, etag)
+        return resp
+
+    @staticmethod
+    def _graphObjectEndpoint(obj):
+        """
+        Endpoint of TTLs a Graph object is cached as, None for errors
+        """
+        if type(obj) != dict or 'error' in obj:
+            return None
+        if 'images' in obj:
+            return 'photo'
+        if 'can_upload' in obj:
+            return 'album'
+        return 'object'
+
+    @staticmethod
+    def _tagPageEndpoint(resp):
+        if type(resp) != dict or 'data' not in resp:
+            return None
+        return 'tags'
+
+    def _materializePhoto(self, descriptor):
+        return self.FbApiHandlerBase(outerObj=self)._downloadImage(descriptor['source'])
 
     def _setFbPhotoSizeType(self, _fbPhotoSizeType):
         if _fbPhotoSizeType == self.FB_PHOTO_SIZE_TYPE_MEDIUM:
@@ -182,6 +631,9 @@ class FbExporter(FbBase, IExporter):
         else:
             return None
 
+    def _getAlbumFeedsHandler(self, albumId):
+        return self._albumFeedsHandlers.get(albumId, lambda albumId: self.FbAlbumFeedsHandler(id=albumId, outerObj=self))
+
     def _mergeData(self, dataDict, anotherDatas):
         for data in anotherDatas:
             objId = data['id']
@@ -192,7 +644,7 @@ class FbExporter(FbBase, IExporter):
                 dataDict[objId] = data
 
     def _datetime2Timestamp(self, datetimeObj):
-        return int(time.mktime(datetimeObj.timetuple()))
+        return datetime2Timestamp(datetimeObj)
 
     def _apiCrawler(self, api, since, until, after=None):
         params = {
@@ -212,19 +664,33 @@ class FbExporter(FbBase, IExporter):
                 params['since'] = self._datetime2Timestamp(until)
             if since and until and since < until:
                 raise ValueError('since cannot older than until')
+        if self._graphFields.get(api, None):
+            params['fields'] = self._graphFields[api]
 
         uri = '{0}me/{1}?{2}'.format(self._graphUri, api, urllib.urlencode(params))
         self._logger.debug('URI to retrieve [%s]' % uri)
         try:
-            conn = self._httpConn.urlopen('GET', uri, timeout=self._timeout)
+            conn = self._request('api', 'GET', uri, timeout=self._timeout)
         except: 
             self._logger.exception('Unable to get data from Facebook')
             return ErrorCode.E_FAILED, {}
+        # Failures carry the delay suggested by response headers for the retry policy
+        failure = {'retryAfter': self._retryPolicy.retryAfter(conn.headers)}
         try:
             retDict = json.loads(conn.data)
         except ValueError:
             self._logger.info('Unable to parse returned data. conn.data[%s]' % conn.data)
-            return ErrorCode.E_FAILED, {}
+            return ErrorCode.E_FAILED, failure
+        if self._isAuthError(retDict):
+            self._logger.info('Token became invalid while crawling. conn.data[%s]' % conn.data)
+            self._invalidateTokenValidation()
+            return ErrorCode.E_INVALID_TOKEN, {}
+        if self._isQuotaError(retDict):
+            self._logger.info('Exceed request quota while crawling. conn.data[%s]' % conn.data)
+            return ErrorCode.E_REQUESTS_EXCEED_QUOTA, failure
+        if conn.status >= 500:
+            self._logger.info('Server error while crawling. status[%s]' % conn.status)
+            return ErrorCode.E_FAILED, failure
         if 'data' not in retDict or 'paging' not in retDict:
             return ErrorCode.E_NO_DATA, {}
         return ErrorCode.S_OK, retDict
@@ -233,10 +699,13 @@ class FbExporter(FbBase, IExporter):
     def isTokenValid(self):
         """
         Check the access token validness as well as the permissions
+
+        Permissions are requested with the identity in one /me request, which is kept for lazy myId/myName/myEmail.
         """
-        uri = urllib.basejoin(self._graphUri, '/me/permissions')
+        uri = urllib.basejoin(self._graphUri, '/me')
         uri += '?{0}'.format(urllib.urlencode({
             'access_token': self._accessToken,
+            'fields': 'id,name,email,permissions',
         }))
         requiredPerms = [
             'read_stream',
@@ -244,16 +713,17 @@ class FbExporter(FbBase, IExporter):
             'user_status',
         ]
         try:
-            conn = self._httpConn.urlopen('GET', uri, timeout=self._timeout)
+            conn = self._request('me', 'GET', uri, timeout=self._timeout)
             respCode = conn.status
             resp = json.loads(conn.data)
+            perms = resp.get('permissions', {}).get('data', [])
         except urllib3.exceptions.HTTPError as e:
             self._logger.error('Unable to get data from Facebook. uri[{0}] e[{1}]'.format(uri, e))
             return ErrorCode.E_FAILED
         except ValueError as e:
             self._logger.error('Unable to parse returned data. data[{0}] e[{1}]'.format(conn.data, e))
             return ErrorCode.E_FAILED
-        if respCode != 200 or len(resp['data']) == 0:
+        if respCode != 200 or len(perms) == 0:
             moreInfoLink = 'https://developers.facebook.com/tools/debug/access_token?q=' + self._accessToken
             if 'error' in resp and 'code' in resp['error'] and resp['error']['code'] == 4:
                 self._logger.error('Exceed app request quota, wait for next round.')
@@ -262,21 +732,69 @@ class FbExporter(FbBase, IExporter):
             self._logger.info('Invalid token. data[{0}] moreInfoLink[{1}]'.format(conn.data, moreInfoLink))
             return ErrorCode.E_INVALID_TOKEN
         for perm in requiredPerms:
-            if perm not in resp['data'][0]:
+            if perm not in perms[0]:
                 moreInfoLink = 'https://developers.facebook.com/tools/debug/access_token?q=' + self._accessToken
                 self._logger.info('Token did not have enough permission. data[{0}] moreInfoLink[{1}]'.format(conn.data, moreInfoLink))
                 return ErrorCode.E_INVALID_TOKEN
+        identity = self._identityFromMe(resp)
+        if identity:
+            self._seedIdentity(identity)
         return ErrorCode.S_OK
 
+    class FbDataIterator(object):
+        def __init__(self, *args, **kwargs):
+            self.outerObj = kwargs.pop('outerObj')
+            self.retCode = None
+            self.count = 0
+            self.checkpoint = None
+            self._state = {'retCode': ErrorCode.E_FAILED}
+            self._pages = self.outerObj._crawlPages(self._state, **kwargs)
+            self._records = []
+
+        def __iter__(self):
+            return self
+
+        def next(self):
+            while not self._records:
+                try:
+                    parsedData = self._pages.next()
+                except StopIteration:
+                    self.retCode = self._state['retCode']
+                    if ErrorCode.IS_FAILED(self.retCode):
+                        self.checkpoint = self._state.get('checkpoint', None)
+                    raise
+                # Duplicated records were skipped by _crawlPages()
+                self._records.extend(parsedData)
+            self.count += 1
+            return self._records.pop(0)
+
     class FbApiHandlerBase(object):
+        _RE_ALBUM_SET_LINK = re.compile('^https?://www\.facebook\.com\/photo\.php\?.+&set=a\.(\d+?)\.')
+        _RE_PCB_SET_LINK = re.compile('^https?://www\.facebook\.com\/photo\.php\?.+&set=pcb\.(\d+?)[.&]')
+        _RE_PHOTO_FBID_LINK = re.compile('^https?://www\.facebook\.com\/photo\.php[?&]fbid=(\d+?)&')
+        _RE_FB_LINK = re.compile('^https?://www\.facebook\.com/.*$')
+        _RE_FB_APPS_LINK = re.compile('^https?://apps\.facebook\.com/.*$')
+        _RE_SHARED_LINK_STORY = re.compile('shared a link.$')
+        _RE_HTML_BR = re.compile('<br\s*?/?>')
+        _RE_PHOTO_SIZE_SUFFIX = re.compile('(_\w)(\.\w+?$)')
+
+        # Album photos within this range of a post's created time are regarded as the post's photos
+        FB_ALBUM_PHOTO_TIMERANGE = timedelta(minutes=20)
+
         def __init__(self, *args, **kwargs):
             self.outerObj = kwargs.get('outerObj')
             self._data = kwargs.get('data', None)
+            # Ids of records kept only for their photo, parse() drops them if the photo failed to download
+            self._photoOnlyIds = set()
 
         def parse(self, filterDateInfo=None):
             if 'data' not in self._data:
                 raise ValueError()
 
+            tracer = self.outerObj._tracer
+            with tracer.span('preparePage'):
+                self._preparePage([data for data in self._data['data'] if data['from'] is not None])
+
             retData = []
             for data in self._data['data']:
                 # In some case, Facebook returned "from": null and we will skip this case.
@@ -286,8 +804,10 @@ class FbExporter(FbBase, IExporter):
                 #if data['from']['id'] != self.outerObj.myId:
                 #    continue
 
-                parsedData = self.parseInner(data)
+                with tracer.span('parser:{0}'.format(self._parserName(data))):
+                    parsedData = self.parseInner(data)
                 if parsedData:
+                    self.outerObj._projectRecord(parsedData)
                     if 'fromMe' not in parsedData:
                         if data['from']['id'] == self.outerObj.myId:
                             parsedData['fromMe'] = True
@@ -303,27 +823,74 @@ class FbExporter(FbBase, IExporter):
                             self._dumpData(parsedData)
                             retData.append(parsedData)
 
+            # Photos are downloaded in background while parsing, wait for them before handing out this page
+            with tracer.span('resolvePhotos'):
+                self.outerObj._resolvePhotos(retData)
+            if self._photoOnlyIds:
+                retData = [data for data in retData if data.get('photos', None) or data['id'] not in self._photoOnlyIds]
             return retData, False
 
         def parseInner(self, data):
             return None
 
+        def _parserName(self, data):
+            """
+            Name of the parser of data in traces
+            """
+            return self.__class__.__name__
+
+        def _preparePage(self, items):
+            """
+            Do the network work of a page together before parsing its items one by one
+            """
+            # Retrieve the Graph objects which parsers would look up for this page in batch
+            prefetchIds = []
+            for data in items:
+                prefetchIds += self._prefetchIds(data)
+            self._prefetchGraphObjects(prefetchIds)
+
+        def _prefetchIds(self, data):
+            """
+            Graph IDs which parseInner() will look up for the data, so that they can be retrieved in batch
+            """
+            return []
+
+        def _prefetchGraphObjects(self, objIds):
+            def loadMany(objIds):
+                # Leave failed sub-requests unmemoized and let _getGraphObject() retry them one by one
+                return [obj if type(obj) == dict else None for obj in self.outerObj._cachedGraphBatch(objIds, self.outerObj._graphObjectEndpoint)]
+
+            if objIds:
+                self.outerObj._graphObjects.getMany(objIds, loadMany)
+
+        def _getGraphObject(self, objId):
+            """
+            Graph object of objId, retrieved once per getData() call however many handlers and threads look it up
+            """
+            return self.outerObj._graphObjects.get(objId, self._loadGraphObject)
+
+        def _loadGraphObject(self, objId):
+            params = {
+                'access_token' : self.outerObj._accessToken,
+            }
+            uri = '{0}{1}/?{2}'.format(self.outerObj._graphUri, objId, urllib.urlencode(params))
+            self.outerObj._logger.debug('object URI to retrieve [%s]' % uri)
+            try:
+                resp = self.outerObj._cachedGraphGet('object', uri, self.outerObj._graphObjectEndpoint)
+            except:
+                self.outerObj._logger.exception('Unable to get object from Facebook. uri[%s]' % (uri))
+                return None
+            if type(resp) != dict:
+                return None
+            return resp
+
         def _convertTimeFormat(self, fbTime):
             if not fbTime:
                 raise ValueError('Unable to find any time info in feed.')
-            return dateParser.parse(fbTime)
+            return parseTime(fbTime)
 
         def _storeFileToTemp(self, fileUri):
-            fileExtName = fileUri[fileUri.rfind('.') + 1:]
-            newFileName = os.path.join(self.outerObj._tmpFolder, "{0}.{1}".format(str(uuid.uuid1()), fileExtName))
-            try:
-                conn = urllib2.urlopen(fileUri)
-                fileObj = file(newFileName, 'w')
-                fileObj.write(conn.read())
-                fileObj.close()
-            except:
-                return None
-            return newFileName
+            return self.outerObj._photoStore.fetch(fileUri, self.outerObj._downloadFile)
 
         def _dumpData(self, data):
             if self.outerObj.verbose:
@@ -344,15 +911,40 @@ class FbExporter(FbBase, IExporter):
                     uri = queryDict['url'][0]
             return uri
 
-        def _imgLinkHandler(self, uri):
-            if not uri:
+        def _imgLinkHandler(self, uri, objectId=None, sizeType=None):
+            """
+            Schedule the photo download in download pool, and return the pending task which parse() resolves to file path,
+            or a photo descriptor if getData() was called with metadataOnly
+            """
+            if not uri or not self.outerObj._wantField('photos'):
                 return None
-            fPath = None
             uri = self._stripSafeImage(uri)
+            if self.outerObj._metadataOnly:
+                return self.outerObj._photoDescriptor(uri, objectId, sizeType or self.outerObj.FB_PHOTO_SIZE_PICTURE)
+            return self.outerObj._submitDownload(uri, self._downloadImage, uri)
+
+        def _photoSizeName(self):
+            return self.outerObj.FB_PHOTO_SIZE_NAMES[self.outerObj.fbPhotoSizeType]
+
+        def _wantAlbumPhotos(self, ret=None):
+            """
+            Whether to look into album photos for a record, which give its photos, and place and people it lacks
+
+            In:
+                ret                 --  the record being parsed, None to tell whether any record of the page could need them
+            """
+            wantField = self.outerObj._wantField
+            if wantField('photos'):
+                return True
+            if ret is None:
+                return wantField('place') or wantField('people')
+            return (wantField('place') and 'place' not in ret) or (wantField('people') and 'people' not in ret)
+
+        def _downloadImage(self, uri):
+            fPath = None
             # Replace subfix to _o, e.g. *_s.jpg to *_o.jpg
-            rePattern = re.compile('(_\w)(\.\w+?$)')
-            if re.search(rePattern, uri):
-                origPic = re.sub(rePattern, '_o\\2', uri)
+            if self._RE_PHOTO_SIZE_SUFFIX.search(uri):
+                origPic = self._RE_PHOTO_SIZE_SUFFIX.sub('_o\\2', uri)
                 fPath = self._storeFileToTemp(origPic)
                 if fPath:
                     return fPath
@@ -368,22 +960,20 @@ class FbExporter(FbBase, IExporter):
                     break
             if not idName:
                 return None
-            params = {
-                'access_token' : self.outerObj._accessToken,
-            }
-            uri = '{0}{1}?{2}'.format(self.outerObj._graphUri, feedData[idName], urllib.urlencode(params))
-            try:
-                conn = self.outerObj._httpConn.urlopen('GET', uri, timeout=self.outerObj._timeout)
-                resp = json.loads(conn.data)
-            except:
-                self.outerObj._logger.exception('Unable to get object from Facebook. uri[%s]' % (uri))
-                return None
-            if type(resp) == dict:
-                return resp
-            return None
+            return self._getGraphObject(feedData[idName])
+
+        def _getPhotoObject(self, feedData):
+            """
+            Get photo object, the embedded one is used if feedData came with images field
+            """
+            if 'images' in feedData:
+                return feedData
+            return self._getObject(feedData)
 
         def _getFbSizePhotoUri(self, feedData):
-            obj = self._getObject(feedData)
+            if not self.outerObj._wantField('photos'):
+                return None
+            obj = self._getPhotoObject(feedData)
             if obj and 'images' in obj:
                 fbPhotoSizeType = self.outerObj.fbPhotoSizeType
                 # FIXME: Current we assume maximum size photo will be first element in images and medium size will be the second.
@@ -392,7 +982,7 @@ class FbExporter(FbBase, IExporter):
             return None
 
         def _getTagPeople(self, data, tagName='with_tags'):
-            if tagName not in data:
+            if tagName not in data or not self.outerObj._wantField('people'):
                 return None
 
             people = [{
@@ -422,8 +1012,7 @@ class FbExporter(FbBase, IExporter):
             while nextUrl:
                 uri = '{0}&{1}'.format(nextUrl, urllib.urlencode(params))
                 try:
-                    conn = self.outerObj._httpConn.urlopen('GET', uri, timeout=self.outerObj._timeout)
-                    resp = json.loads(conn.data)
+                    resp = self.outerObj._cachedGraphGet('tags', uri, self.outerObj._tagPageEndpoint)
                 except:
                     self.outerObj._logger.exception('Unable to get object from Facebook. uri[%s]' % (uri))
                     break
@@ -445,7 +1034,7 @@ class FbExporter(FbBase, IExporter):
 
         def _getGpsInfo(self, data):
             place = None
-            if 'place' in data:
+            if 'place' in data and self.outerObj._wantField('place'):
                 place = { 'name': data['place']['name'] }
                 if 'location' in data['place'] and 'latitude' in data['place']['location'] and 'longitude' in data['place']['location']:
                     place['latitude'] = data['place']['location']['latitude']
@@ -485,28 +1074,17 @@ class FbExporter(FbBase, IExporter):
                     ret['people'] = people
 
                 if 'picture' in data:
-                    imgPath = self._imgLinkHandler(data['picture'])
+                    imgPath = self._imgLinkHandler(data['picture'], ret['id'])
                     if imgPath:
                         ret['photos'].append(imgPath)
             return ret
 
         def _albumIdFromObjectId(self, objectId):
-            params = {
-                'access_token' : self.outerObj._accessToken
-            }
-
-            uri = '{0}{1}/?{2}'.format(self.outerObj._graphUri, objectId, urllib.urlencode(params))
-            self.outerObj._logger.debug('object URI to retrieve [%s]' % uri)
-            try:
-                conn = self.outerObj._httpConn.urlopen('GET', uri, timeout=self.outerObj._timeout)
-            except:
-                self.outerObj._logger.exception('Unable to get data from Facebook')
-                return ErrorCode.E_FAILED, {}
-            retDict = json.loads(conn.data)
-            if 'link' not in retDict:
+            retDict = self._getGraphObject(objectId)
+            if not retDict or 'link' not in retDict:
                 return None
 
-            searchResult = re.search('^https?://www\.facebook\.com\/photo\.php\?.+&set=a\.(\d+?)\.', retDict['link'])
+            searchResult = self._RE_ALBUM_SET_LINK.search(retDict['link'])
             if searchResult is None:
                 self.outerObj._logger.error('Unable to find album set id from link: {0}'.format(retDict['link']))
                 return None
@@ -539,16 +1117,18 @@ class FbExporter(FbBase, IExporter):
                 ret['people'] = people
 
             ret['photos'] = []
+            if not self.outerObj._wantField('photos'):
+                return ret
             # FIXME: Currently Facebook do not have formal way to retrieve album id from news feed, so we parse from link
-            searchResult = re.search('^https?://www\.facebook\.com\/photo\.php\?.+&set=a\.(\d+?)\.', data['link'])
+            searchResult = self._RE_ALBUM_SET_LINK.search(data['link'])
             if searchResult is not None:
                 # this seems a photo link, try to get its albumId
                 albumId = searchResult.group(1)
                 self.outerObj._logger.info("found an albumID from a photo link: {0}".format(albumId))
-                feedHandler = self.outerObj.FbAlbumFeedsHandler(id=albumId, outerObj=self.outerObj)
-                retPhotos = feedHandler.getPhotos(maxLimit=0, basetime=ret['createdTime'], timerange=timedelta(minutes=20))
+                feedHandler = self.outerObj._getAlbumFeedsHandler(albumId)
+                retPhotos = feedHandler.getPhotos(maxLimit=0, basetime=ret['createdTime'], timerange=self.FB_ALBUM_PHOTO_TIMERANGE)
                 if ErrorCode.IS_SUCCEEDED(retPhotos['retCode']):
-                    ret['photos'] = [d['fPath'] for d in retPhotos['data']]
+                    ret['photos'] = [d['fPath'] for d in retPhotos['data'] if d['fPath']]
 
             else:
                 self.outerObj._logger.error('unable to find album set id from link: {0}'.format(data['link']))
@@ -582,32 +1162,28 @@ class FbExporter(FbBase, IExporter):
                 ret['people'] = people
 
             ret['photos'] = []
+            if not self._wantAlbumPhotos(ret):
+                return ret
             # FIXME: Currently Facebook do not have API way to get checkin photos, so we list all photos in the album.
             # Please note that this methodology cannot exactly match the checkin photos.
-            searchResult = re.search('^https?://www\.facebook\.com\/photo\.php[?&]fbid=(\d+?)&', data['link'])
+            searchResult = self._RE_PHOTO_FBID_LINK.search(data['link'])
             if searchResult is not None:
                 # [0] Get album id from photo object
                 photoId = searchResult.group(1)
-                params = {
-                    'access_token' : self.outerObj._accessToken,
-                }
-                uri = '{0}{1}/?{2}'.format(self.outerObj._graphUri, photoId, urllib.urlencode(params))
-                try:
-                    conn = self.outerObj._httpConn.urlopen('GET', uri, timeout=self.outerObj._timeout)
-                except:
+                photoObj = self._getGraphObject(photoId)
+                if not photoObj:
                     self.outerObj._logger.error('Unable to get photo object from link: {0}'.format(data['link']))
                     return ret
-                photoObj = json.loads(conn.data)
-                if type(photoObj) == dict and 'link' in photoObj:
-                    searchResult = re.search('^https?://www\.facebook\.com\/photo\.php\?.+&set=a\.(\d+?)\.', photoObj['link'])
+                if 'link' in photoObj:
+                    searchResult = self._RE_ALBUM_SET_LINK.search(photoObj['link'])
                     if searchResult is not None:
                         albumId = searchResult.group(1)
                         self.outerObj._logger.info("found an albumID from a photo link: {0}".format(albumId))
                         # [1] Retrieve photos in album
-                        feedHandler = self.outerObj.FbAlbumFeedsHandler(id=albumId, outerObj=self.outerObj)
-                        retPhotos = feedHandler.getPhotos(maxLimit=0, basetime=ret['createdTime'], timerange=timedelta(minutes=20))
+                        feedHandler = self.outerObj._getAlbumFeedsHandler(albumId)
+                        retPhotos = feedHandler.getPhotos(maxLimit=0, basetime=ret['createdTime'], timerange=self.FB_ALBUM_PHOTO_TIMERANGE)
                         if ErrorCode.IS_SUCCEEDED(retPhotos['retCode']) and retPhotos['count'] > 0:
-                            ret['photos'] = [d['fPath'] for d in retPhotos['data']]
+                            ret['photos'] = [d['fPath'] for d in retPhotos['data'] if d['fPath']]
 
                             # Handle if there's no gps/tags info outside, we will try first photo's info
                             if 'place' not in ret and 'place' in retPhotos['data'][0]:
@@ -637,8 +1213,8 @@ class FbExporter(FbBase, IExporter):
             ret['links'] = []
             ret['photos'] = []
 
-            obj = self._getObject(data)
-            if 'from' in obj and 'id' in obj['from'] and obj['from']['id'] != self.outerObj.myId:
+            obj = self._getPhotoObject(data)
+            if obj and 'from' in obj and 'id' in obj['from'] and obj['from']['id'] != self.outerObj.myId:
                 ret['fromMe'] = False
 
             infoSrc = obj if obj else data
@@ -650,10 +1226,12 @@ class FbExporter(FbBase, IExporter):
             if people:
                 ret['people'] = people
 
-            imgUri = self._getFbSizePhotoUri(data)
+            imgUri = self._getFbSizePhotoUri(infoSrc)
+            sizeType = self._photoSizeName()
             if not imgUri and 'picture' in data:
                 imgUri = data['picture']
-            imgPath = self._imgLinkHandler(imgUri)
+                sizeType = self.outerObj.FB_PHOTO_SIZE_PICTURE
+            imgPath = self._imgLinkHandler(imgUri, infoSrc.get('id', None) if obj else data.get('object_id', None), sizeType)
             if imgPath:
                 ret['photos'].append(imgPath)
 
@@ -684,9 +1262,11 @@ class FbExporter(FbBase, IExporter):
 
             ret['photos'] = []
             imgUri = self._getFbSizePhotoUri(data)
+            sizeType = self._photoSizeName()
             if not imgUri and 'picture' in data:
                 imgUri = data['picture']
-            imgPath = self._imgLinkHandler(imgUri)
+                sizeType = self.outerObj.FB_PHOTO_SIZE_PICTURE
+            imgPath = self._imgLinkHandler(imgUri, data.get('object_id', None), sizeType)
             if imgPath:
                 ret['photos'].append(imgPath)
             return ret
@@ -694,7 +1274,7 @@ class FbExporter(FbBase, IExporter):
         def _dataParserLink(self, data, isFeedApi=True):
             # For link + story case, it might be event to add friends or join fans page
             # So we filter story field
-            if 'story' in data and not re.search('shared a link.$', data['story']):
+            if 'story' in data and not self._RE_SHARED_LINK_STORY.search(data['story']):
                 return None
 
             ret = {}
@@ -719,10 +1299,10 @@ class FbExporter(FbBase, IExporter):
             if 'link' in data:
                 if data['link'][0] == '/':
                     data['link'] = 'http://www.facebook.com%s' % (data['link'])
-                if re.search('^https?://www\.facebook\.com/.*$', data['link']):
+                if self._RE_FB_LINK.search(data['link']):
                     isFacebookLink = True
                     ret['links'].append(data['link'])
-                elif re.search('^https?://apps\.facebook\.com/.*$', data['link']):
+                elif self._RE_FB_APPS_LINK.search(data['link']):
                     # Skip Facebook apps' link
                     pass
                 else:
@@ -735,13 +1315,20 @@ class FbExporter(FbBase, IExporter):
             ret['photos'] = []
             # If there are links, do not expose photos due to currently photos will overwrite links attributes
             if len(ret['links']) == 0 and 'picture' in data:
-                imgPath = self._imgLinkHandler(data['picture'])
+                imgPath = self._imgLinkHandler(data['picture'], ret['id'])
                 if imgPath:
                     ret['photos'].append(imgPath)
 
-            # If link type data without a link or picture, do not expose this record
-            if len(ret['links']) == 0 and len(ret['photos']) == 0:
-                return None
+            # If link type data without a link or photo, do not expose this record
+            if len(ret['links']) == 0:
+                if not self.outerObj._wantField('photos'):
+                    # Photos are not downloaded, so a picture is as good as its photo
+                    if not data.get('picture', None):
+                        return None
+                elif len(ret['photos']) == 0:
+                    return None
+                else:
+                    self._photoOnlyIds.add(ret['id'])
             return ret
 
         def _dataParserNote(self, data, isFeedApi=True):
@@ -753,8 +1340,9 @@ class FbExporter(FbBase, IExporter):
             ret['message'] = data.get('name', None) or data.get('subject', None)
             content = data.get('description', None) or data.get('message', None)
             if content:
-                content = re.sub('<br\s*?/?>', '\n', content)
+                content = self._RE_HTML_BR.sub('\n', content)
                 try:
+                    import lxml.html
                     content = lxml.html.fromstring(content).text_content()
                 except:
                     self.outerObj._logger.info('Unable to purify html. content[%s]' % content)
@@ -767,11 +1355,11 @@ class FbExporter(FbBase, IExporter):
             if 'link' in data:
                 if data['link'][0] == '/':
                     data['link'] = 'http://www.facebook.com%s' % (data['link'])
-                if not re.search('^https?://www\.facebook\.com/.*$', data['link']):
+                if not self._RE_FB_LINK.search(data['link']):
                     ret['links'].append(data['link'])
             ret['photos'] = []
             if 'picture' in data:
-                imgPath = self._imgLinkHandler(data['picture'])
+                imgPath = self._imgLinkHandler(data['picture'], ret['id'])
                 if imgPath:
                     ret['photos'].append(imgPath)
             return ret
@@ -805,7 +1393,7 @@ class FbExporter(FbBase, IExporter):
                     ret['people'] = people
             ret['photos'] = []
             if 'picture' in data:
-                imgPath = self._imgLinkHandler(data['picture'])
+                imgPath = self._imgLinkHandler(data['picture'], ret['id'])
                 if imgPath:
                     ret['photos'].append(imgPath)
             return ret
@@ -843,15 +1431,15 @@ class FbExporter(FbBase, IExporter):
             ret['links'] = []
 
             ret['photos'] = []
-            if 'object_id' in data:
+            if 'object_id' in data and self._wantAlbumPhotos(ret):
                 albumId = self._albumIdFromObjectId(data['object_id'])
 
                 if albumId:
                     self.outerObj._logger.info("found an albumID from a checkin link: {0}".format(albumId))
-                    dataHandler = self.outerObj.FbAlbumFeedsHandler(id=albumId, outerObj=self.outerObj)
-                    retPhotos = dataHandler.getPhotos(maxLimit=0, basetime=ret['createdTime'], timerange=timedelta(minutes=20))
+                    dataHandler = self.outerObj._getAlbumFeedsHandler(albumId)
+                    retPhotos = dataHandler.getPhotos(maxLimit=0, basetime=ret['createdTime'], timerange=self.FB_ALBUM_PHOTO_TIMERANGE)
                     if ErrorCode.IS_SUCCEEDED(retPhotos['retCode']) and retPhotos['count'] > 0:
-                        ret['photos'] = [d['fPath'] for d in retPhotos['data']]
+                        ret['photos'] = [d['fPath'] for d in retPhotos['data'] if d['fPath']]
 
                         # Handle if there's no gps/tags info outside, we will try first photo's info
                         if 'place' not in ret and 'place' in retPhotos['data'][0]:
@@ -868,13 +1456,103 @@ class FbExporter(FbBase, IExporter):
         FB_PHOTO_SUBTYPE_TAG_PHOTO = 2
         FB_PHOTO_SUBTYPE_PHOTO = 3
 
+        def __init__(self, *args, **kwargs):
+            super(self.__class__, self).__init__(*args, **kwargs)
+            # Parsers decided by _preparePage(), keyed by feed id
+            self._pageParsers = {}
+
         def parseInner(self, data):
-            parser = self._dataParserFactory(data)
+            if data['id'] in self._pageParsers:
+                parser = self._pageParsers[data['id']]
+            else:
+                parser = self._dataParserFactory(data)
             if not parser:
                 return None
             self.outerObj._logger.debug('FbApiHandlerFeed::_dataParserFactory() returned parser: {0}'.format(parser.__name__))
             return parser(data)
 
+        def _parserName(self, data):
+            parser = self._pageParsers.get(data['id'], None)
+            return parser.__name__ if parser else 'None'
+
+        def _preparePage(self, items):
+            """
+            Classify the whole page first, then issue the network work of each parser group together:
+            album metadata in one batch, photo and checkin objects in one batch, and album photo pages concurrently.
+            """
+            # [0] Album metadata decides photo sub types
+            albumIds = []
+            for data in items:
+                if data.get('type', None) != 'photo' or data.get('status_type', None) == 'tagged_in_photo':
+                    continue
+                if self._RE_PCB_SET_LINK.search(data['link']):
+                    continue
+                searchResult = self._RE_ALBUM_SET_LINK.search(data['link'])
+                if searchResult and searchResult.group(1) not in self.outerObj._albumCache:
+                    albumIds.append(searchResult.group(1))
+            self._prefetchGraphObjects(albumIds)
+
+            # [1] Classify and group by parser
+            groups = {}
+            for data in items:
+                parser = self._dataParserFactory(data)
+                self._pageParsers[data['id']] = parser
+                if parser:
+                    groups.setdefault(parser.__name__, []).append(data)
+
+            # [2] Objects looked up by parsers
+            objIds = []
+            photoGroups = list(groups.get('_dataParserTagPhoto', []))
+            if self.outerObj._wantField('photos'):
+                photoGroups += groups.get('_dataParserPhoto', [])
+            wantAlbumPhotos = self._wantAlbumPhotos()
+            for data in photoGroups:
+                if 'images' in data:
+                    continue
+                for name in ('object_id', 'id'):
+                    if name in data:
+                        objIds.append(data[name])
+                        break
+            for data in groups.get('_dataParserMultiPhotoCheckin', []) if wantAlbumPhotos else []:
+                searchResult = self._RE_PHOTO_FBID_LINK.search(data['link'])
+                if searchResult:
+                    objIds.append(searchResult.group(1))
+            for data in groups.get('_dataParserCheckin', []) if wantAlbumPhotos else []:
+                if 'object_id' in data:
+                    objIds.append(data['object_id'])
+            self._prefetchGraphObjects(objIds)
+
+            # [3] Album photo pages which album parsers will look into, as far back as the oldest post needs
+            albumOldestTimes = {}
+            def addAlbum(albumId, data):
+                createdTime = self._convertTimeFormat(data.get('created_time', data.get('updated_time', None)))
+                oldestTime = createdTime - self.FB_ALBUM_PHOTO_TIMERANGE
+                if albumId not in albumOldestTimes or oldestTime < albumOldestTimes[albumId]:
+                    albumOldestTimes[albumId] = oldestTime
+
+            for data in groups.get('_dataParserAlbum', []) if self.outerObj._wantField('photos') else []:
+                searchResult = self._RE_ALBUM_SET_LINK.search(data['link'])
+                if searchResult:
+                    addAlbum(searchResult.group(1), data)
+            for data in groups.get('_dataParserMultiPhotoCheckin', []) if wantAlbumPhotos else []:
+                searchResult = self._RE_PHOTO_FBID_LINK.search(data['link'])
+                photoObj = self._getGraphObject(searchResult.group(1)) if searchResult else None
+                if photoObj and 'link' in photoObj:
+                    searchResult = self._RE_ALBUM_SET_LINK.search(photoObj['link'])
+                    if searchResult:
+                        addAlbum(searchResult.group(1), data)
+            for data in groups.get('_dataParserCheckin', []) if wantAlbumPhotos else []:
+                albumId = self._albumIdFromObjectId(data['object_id']) if 'object_id' in data else None
+                if albumId:
+                    addAlbum(albumId, data)
+
+            tasks = []
+            for albumId, oldestTime in albumOldestTimes.iteritems():
+                albumHandler = self.outerObj._getAlbumFeedsHandler(albumId)
+                tasks.append(self.outerObj._lookupPool.submit(self.outerObj._tracer.wrap(albumHandler.loadPhotos), oldestTime))
+            for task in tasks:
+                task.result()
+
         def _dataParserFactory(self, data):
             # Type filter
             if 'type' not in data:
@@ -916,26 +1594,21 @@ class FbExporter(FbBase, IExporter):
                 return self.FB_PHOTO_SUBTYPE_TAG_PHOTO
 
             # [2] Check multi-photo checkin with pcb parameter
-            searchResult = re.search('^https?://www\.facebook\.com\/photo\.php\?.+&set=pcb\.(\d+?)[.&]', data['link'])
+            searchResult = self._RE_PCB_SET_LINK.search(data['link'])
             if searchResult:
                 return self.FB_PHOTO_SUBTYPE_MULTI_CHECKIN
 
             # [3] Check albums
-            searchResult = re.search('^https?://www\.facebook\.com\/photo\.php\?.+&set=a\.(\d+?)\.', data['link'])
+            searchResult = self._RE_ALBUM_SET_LINK.search(data['link'])
             if searchResult:
                 albumId = searchResult.group(1)
-                params = {
-                    'access_token' : self.outerObj._accessToken,
-                }
-
-                uri = '{0}{1}/?{2}'.format(self.outerObj._graphUri, albumId, urllib.urlencode(params))
-                self.outerObj._logger.debug('Album URI to retrieve [%s]' % uri)
-                try:
-                    conn = self.outerObj._httpConn.urlopen('GET', uri, timeout=self.outerObj._timeout)
-                except:
-                    self.outerObj._logger.exception('Unable to get data from Facebook')
-                    return retType
-                retDict = json.loads(conn.data)
+                retDict = self.outerObj._albumCache.get(albumId)
+                if retDict is None:
+                    retDict = self._getGraphObject(albumId)
+                    if not retDict:
+                        return retType
+                    if 'error' not in retDict:
+                        self.outerObj._albumCache.set(albumId, retDict)
 
                 # Recently some checkins go to as a album, so we do more check here as assuming there are in 'Mobile Uploads'.
                 if 'type' in retDict and retDict['type'] == 'mobile':
@@ -957,6 +1630,11 @@ class FbExporter(FbBase, IExporter):
         def parseInner(self, data):
             return self._dataParserCheckin(data, isFeedApi=False)
 
+        def _prefetchIds(self, data):
+            if 'object_id' in data and self._wantAlbumPhotos():
+                return [data['object_id']]
+            return []
+
     class FbApiHandlerVideos(FbApiHandlerBase):
         def parseInner(self, data):
             return self._dataParserVideo(data, isFeedApi=False)
@@ -971,10 +1649,23 @@ class FbExporter(FbBase, IExporter):
 
 
     class FbAlbumFeedsHandler(FbApiHandlerBase):
+        """
+        Photos of an album, use FbExporter._getAlbumFeedsHandler() to share one instance per album in a getData() run.
+
+        Album pages are retrieved only once and as far back in time as requested,
+        then kept sorted by created_time so that getPhotos() looks up its time range with binary search.
+        """
         def __init__(self, *args, **kwargs):
             super(self.__class__, self).__init__(*args, **kwargs)
             self._limit = kwargs.get('limit', 25)
             self._id = kwargs['id']
+            self._lock = threading.Lock()
+            self._photoTimes = []       # created_time of retrieved photos in ascending order
+            self._photos = []           # retrieved photos in the same order as _photoTimes
+            self._photoEntries = {}     # parsed photos keyed by photo id
+            self._offset = 0
+            self._oldestTime = None
+            self._exhausted = False
 
         def getPhotos(self, maxLimit=0, limit=25, basetime=datetime.now(), timerange=timedelta(minutes=15)):
             retDict = {
@@ -982,64 +1673,99 @@ class FbExporter(FbBase, IExporter):
                 'data': [],
                 'count': 0,
             }
-            offset = 0
-            if maxLimit > 0 and maxLimit < limit:
-                limit = maxLimit
 
-            errorCode, feedData = self._pageCrawler(offset, limit)
-            failoverCount = 0
-            failoverThreshold = 3
-            while errorCode != ErrorCode.E_NO_DATA:
+            with self._lock:
+                errorCode = self._loadPhotos(basetime - timerange, limit)
                 if ErrorCode.IS_FAILED(errorCode):
-                    failoverCount += 1
-                    # If crawling failed (which is not no data), wait and try again
-                    if failoverCount <= failoverThreshold:
-                        time.sleep(2)
-                        errorCode, feedData = self._pageCrawler(offset, limit)
-                        continue
-                    else:
-                        # FIXME: For over threshold case, need to consider how to crawl following data
-                        # Currently return error
-                        retDict['retCode'] = errorCode
-                        return retDict
-
-                parsedData = []
-                for data in feedData['data']:
-                    photoDatetime = self._convertTimeFormat(data['created_time'])
-                    if photoDatetime > basetime + timerange:
-                        continue
-                    if photoDatetime < basetime - timerange:
-                        retDict['data'] += parsedData
-                        retDict['count'] += len(parsedData)
-                        return retDict
-
-                    imgUri = self._getFbSizePhotoUri(data)
-                    imgPath = self._imgLinkHandler(imgUri)
-                    if imgPath:
-                        _dict = {'fPath': imgPath}
-                        place = self._getGpsInfo(data)
-                        if place:
-                            _dict['place'] = place
+                    # FIXME: For over threshold case, need to consider how to crawl following data
+                    # Currently return error
+                    retDict['retCode'] = errorCode
+                    return retDict
+
+                begin = bisect.bisect_left(self._photoTimes, basetime - timerange)
+                end = bisect.bisect_right(self._photoTimes, basetime + timerange)
+                # Keep album order, which is from newer to older
+                photos = self._photos[begin:end][::-1]
+                if maxLimit > 0:
+                    photos = photos[:maxLimit]
 
-                        people = self._getTagPeople(data, tagName='tags')
-                        if people:
-                            _dict['people'] = people
+                # Photo objects in this range would be looked up by _getFbSizePhotoUri(), retrieve them in batch
+                self._prefetchGraphObjects([data['id'] for data in photos if 'id' in data and 'images' not in data])
 
-                        parsedData.append(_dict)
+                for data in photos:
+                    _dict = self._photoEntries.get(data['id'], None) if 'id' in data else None
+                    if not _dict:
+                        _dict = self._parsePhoto(data)
+                        if _dict and 'id' in data:
+                            self._photoEntries[data['id']] = _dict
+                    if _dict:
+                        retDict['data'].append(_dict)
 
-                retDict['data'] += parsedData
-                retDict['count'] += len(parsedData)
+            retDict['count'] = len(retDict['data'])
+            return retDict
 
-                if maxLimit > 0:
-                    if retDict['count'] + limit > maxLimit:
-                        limit = maxLimit - retDict['count']
+        def loadPhotos(self, oldestTime, limit=25):
+            """
+            Retrieve album pages ahead of getPhotos() calls which look back to oldestTime
+            """
+            with self._lock:
+                return self._loadPhotos(oldestTime, limit)
+
+        def _loadPhotos(self, oldestTime, limit):
+            """
+            Retrieve album pages until photos older than oldestTime were seen or the album ends
+
+            The lock is held by caller, it is released while waiting to retry so that other lookups of the album go on.
+            """
+            retryPolicy = self.outerObj._retryPolicy
+            retryCount = 0
+            while not self._exhausted and (self._oldestTime is None or self._oldestTime >= oldestTime):
+                errorCode, feedData = self._pageCrawler(self._offset, limit)
+                if errorCode == ErrorCode.E_NO_DATA:
+                    self._exhausted = True
+                    break
+                if ErrorCode.IS_FAILED(errorCode):
+                    retryCount += 1
+                    if retryCount == 1:
+                        deadline = retryPolicy.deadline()
+                    # If crawling failed (which is not no data), wait and try again
+                    if not retryPolicy.shouldRetry(errorCode, retryCount):
+                        return errorCode
+                    self._lock.release()
+                    try:
+                        waited = retryPolicy.wait(errorCode, retryCount, feedData.get('retryAfter', None), deadline=deadline)
+                    finally:
+                        self._lock.acquire()
+                    if not waited:
+                        return errorCode
+                    continue
+                retryCount = 0
 
-                    if retDict['count'] >= maxLimit:
-                        break
+                for data in feedData['data']:
+                    photoDatetime = self._convertTimeFormat(data['created_time'])
+                    pos = bisect.bisect_right(self._photoTimes, photoDatetime)
+                    self._photoTimes.insert(pos, photoDatetime)
+                    self._photos.insert(pos, data)
+                    if self._oldestTime is None or photoDatetime < self._oldestTime:
+                        self._oldestTime = photoDatetime
+                self._offset += len(feedData['data'])
+            return ErrorCode.S_OK
+
+        def _parsePhoto(self, data):
+            imgUri = self._getFbSizePhotoUri(data)
+            imgPath = self._imgLinkHandler(imgUri, data.get('id', None), self._photoSizeName())
+            # Without photos, album photos are still looked into for their place and people
+            if not imgPath and self.outerObj._wantField('photos'):
+                return None
+            _dict = {'fPath': imgPath}
+            place = self._getGpsInfo(data)
+            if place:
+                _dict['place'] = place
 
-                offset += len(feedData['data'])
-                errorCode, feedData = self._pageCrawler(offset, limit)
-            return retDict
+            people = self._getTagPeople(data, tagName='tags')
+            if people:
+                _dict['people'] = people
+            return _dict
 
         def _pageCrawler(self, offset, limit):
             params = {
@@ -1047,18 +1773,27 @@ class FbExporter(FbBase, IExporter):
                 'offset' : offset,
                 'limit': limit,
             }
+            if self.outerObj._graphFields.get('albumPhotos', None):
+                params['fields'] = self.outerObj._graphFields['albumPhotos']
 
             uri = '{0}{1}/photos?{2}'.format(self.outerObj._graphUri, self._id, urllib.urlencode(params))
             self.outerObj._logger.debug('photos URI to retrieve [%s]' % uri)
             try:
-                conn = self.outerObj._httpConn.urlopen('GET', uri, timeout=self.outerObj._timeout)
+                conn = self.outerObj._request('albumPhotos', 'GET', uri, timeout=self.outerObj._timeout)
                 retDict = json.loads(conn.data)
             except urllib3.exceptions.HTTPError as e:
                 self.outerObj._logger.error('Unable to get data from Facebook - e[{0}]'.format(e))
                 return ErrorCode.E_FAILED, {}
             except ValueError as e:
-                self._logger.error('Unable to parse returned data. data[{0}] e[{1}]'.format(conn.data, e))
-                return ErrorCode.E_FAILED, {}
+                self.outerObj._logger.error('Unable to parse returned data. data[{0}] e[{1}]'.format(conn.data, e))
+                return ErrorCode.E_FAILED, {'retryAfter': self.outerObj._retryPolicy.retryAfter(conn.headers)}
+            if self.outerObj._isAuthError(retDict):
+                self.outerObj._invalidateTokenValidation()
+                return ErrorCode.E_INVALID_TOKEN, {}
+            if self.outerObj._isQuotaError(retDict):
+                return ErrorCode.E_REQUESTS_EXCEED_QUOTA, {'retryAfter': self.outerObj._retryPolicy.retryAfter(conn.headers)}
+            if conn.status >= 500:
+                return ErrorCode.E_FAILED, {'retryAfter': self.outerObj._retryPolicy.retryAfter(conn.headers)}
             if 'data' not in retDict or len(retDict['data']) == 0:
                 return ErrorCode.E_NO_DATA, {}
             return ErrorCode.S_OK, retDict
@@ -1080,7 +1815,7 @@ class FbLikedUrlExporter(FbBase, IExporter):
         uri = '{0}fql?{1}'.format(self._graphUri, urllib.urlencode(params))
         self._logger.debug('FQL URI to retrieve [%s]' % uri)
         try:
-            conn = self._httpConn.urlopen('GET', uri, timeout=self._timeout)
+            conn = self._request('fql', 'GET', uri, timeout=self._timeout)
         except:
             self._logger.exception('Unable to get data from Facebook')
             return ErrorCode.E_FAILED, {}
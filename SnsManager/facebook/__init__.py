@@ -1,2 +1,7 @@
-from FbBase import FbBase
-from FbExporter import FbExporter, FbLikedUrlExporter
+from SnsManager.LazyImport import lazyModule
+
+lazyModule(__name__, {
+    'FbBase': 'FbBase',
+    'FbExporter': 'FbExporter',
+    'FbLikedUrlExporter': 'FbExporter',
+})
@@ -1,27 +1,26 @@
-import foursquare
 from SnsManager.SnsBase import SnsBase
 from SnsManager import ErrorCode
 
 class FourSquareBase(SnsBase):
     def __init__(self, *args, **kwargs):
         super(FourSquareBase, self).__init__(*args, **kwargs)
-        self.myId = self.getMyId()
 
-    def getMyId(self):
+    def _resolveIdentity(self):
         user = self.getUserData()
         if user is None:
             return None
-        self.myId = user['id']
-        return self.myId
+        return {'myId': user['id'], 'myName': user['name']}
 
     def isTokenValid(self):
-        ret = self.getMyId()
-        if ret is None:
+        identity = self._resolveIdentity()
+        if identity is None:
             return ErrorCode.E_INVALID_TOKEN
         else:
+            self._seedIdentity(identity)
             return ErrorCode.S_OK
 
     def getUserData(self, user_id='self'):
+        import foursquare
         try:
             client = foursquare.Foursquare()
             client.set_access_token(self._accessToken)
@@ -1,13 +1,7 @@
-import os
-import time
-import uuid
-import dateutil
-import urllib2
-import foursquare
-from datetime import datetime
-from dateutil import parser as dateParser
+from datetime import datetime, timedelta
 from FourSquareBase import FourSquareBase
 from SnsManager import ErrorCode, IExporter
+from SnsManager.TimeCodec import datetime2Timestamp
 
 class FourSquareExporter(FourSquareBase, IExporter):
     def __init__(self, *args, **kwargs):
@@ -30,6 +24,9 @@ class FourSquareExporter(FourSquareBase, IExporter):
             until           --  The end time to get date
                                 given None means yesterday
                                 or given python's datetime instance as input
+            fields          --  list of optional fields of OPTIONAL_FIELDS to compute, e.g. [ 'place' ] *optional*
+                                default is None which means all of them
+                                Fields not listed are left out of records, people not listed saves a user lookup per tagged friend.
 
             Example: (Please note that the direction to retrieve data is backward)
                 Now   --->   2012/04/01   --->   2012/01/01
@@ -48,7 +45,8 @@ class FourSquareExporter(FourSquareBase, IExporter):
                             'name': 'locationName',
                             'latitude': nnn.nnn,
                             'longitude' mmm.mmm
-                        }
+                        },
+                        'people': [ { ... } ],  # users tagged in the checkin, see getUserData()
                     }, ...
                 },
                 'count': 30,                    # count in data dic
@@ -63,6 +61,7 @@ class FourSquareExporter(FourSquareBase, IExporter):
         }
         since = kwargs.get('since', None)
         until = kwargs.get('until', None)
+        self._setFields(kwargs.get('fields', None))
 
         if not until:
             until = datetime.now() - timedelta(10)
@@ -72,7 +71,7 @@ class FourSquareExporter(FourSquareBase, IExporter):
             retDict['retCode'] = ErrorCode.E_NO_DATA
             return retDict
 
-        tokenValidRet = self.isTokenValid()
+        tokenValidRet = self._validateToken()
         if ErrorCode.IS_FAILED(tokenValidRet):
             retDict['retCode'] = tokenValidRet
             return retDict
@@ -82,10 +81,15 @@ class FourSquareExporter(FourSquareBase, IExporter):
 
         sinceTimestamp = self._datetime2Timestamp(since) + 1 if since else None
         untilTimestamp = self._datetime2Timestamp(until) - 1 if until else None
+        import foursquare
         client = foursquare.Foursquare()
         client.set_access_token(self._accessToken) 
 
-        ret = client.users.checkins(params={'sort':'newestfirst', 'afterTimestamp':untilTimestamp, 'beforeTimestamp':sinceTimestamp})
+        try:
+            ret = client.users.checkins(params={'sort':'newestfirst', 'afterTimestamp':untilTimestamp, 'beforeTimestamp':sinceTimestamp})
+        except foursquare.InvalidAuth:
+            self._invalidateTokenValidation()
+            raise
         if 'checkins' not in ret:
             return retDict
         checkins = ret['checkins']
@@ -106,18 +110,18 @@ class FourSquareExporter(FourSquareBase, IExporter):
                 place['longitude'] = venue['location']['lng'] 
 
             people = []
-            if 'entities' in item:
+            if 'entities' in item and self._wantField('people'):
                 for entity in item['entities']:
                     if entity['type'] != 'user':
                         continue
                     person = self.getUserData(user_id=entity['id'])
                     people.append(person)
-            retDict['data'][theId] = {
+            retDict['data'][theId] = self._projectRecord({
                     'message': shout,
                     'place': place,
                     'createdTime': createdAt,
                     'people': people
-            }
+            })
         retDict['count'] = len(retDict['data'])
         retDict['retCode'] = ErrorCode.S_OK
 
@@ -125,6 +129,6 @@ class FourSquareExporter(FourSquareBase, IExporter):
                     
         
     def _datetime2Timestamp(self, datetimeObj):
-        return int(time.mktime(datetimeObj.timetuple()))
+        return datetime2Timestamp(datetimeObj)
 
 
@@ -1,2 +1,6 @@
-from FourSquareBase import FourSquareBase
-from FourSquareExporter import FourSquareExporter
+from SnsManager.LazyImport import lazyModule
+
+lazyModule(__name__, {
+    'FourSquareBase': 'FourSquareBase',
+    'FourSquareExporter': 'FourSquareExporter',
+})
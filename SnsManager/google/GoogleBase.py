@@ -1,6 +1,3 @@
-import httplib2
-from apiclient.discovery import build
-from oauth2client.client import OAuth2Credentials, AccessTokenRefreshError
 from SnsManager.SnsBase import SnsBase
 from SnsManager import ErrorCode
 
@@ -15,21 +12,23 @@ class GoogleBase(SnsBase):
         self._userAgent = 'Waveface AOStream/1.0'
         self._tokenUri = 'https://accounts.google.com/o/oauth2/token'
 
+        import httplib2
+        from oauth2client.client import OAuth2Credentials
         self._http = httplib2.Http()
         self.credentials = OAuth2Credentials(self._accessToken, self._clientId, self._clientSecret, self._refreshToken, None, self._tokenUri, self._userAgent)
         self._http = self.credentials.authorize(self._http)
 
-        self.myId = self.getMyId()
-
-    def getMyId(self):
+    def _resolveIdentity(self):
+        from apiclient.discovery import build
         try:
             userInfo = build('oauth2', 'v2', http=self._http).userinfo().get().execute()
-            self.myId = userInfo['email']
         except:
             return None
-        return self.myId
+        return {'myId': userInfo['email'], 'myEmail': userInfo['email']}
 
     def isTokenValid(self):
+        from apiclient.discovery import build
+        from oauth2client.client import AccessTokenRefreshError
         try:
             userInfo = build('oauth2', 'v2', http=self._http).userinfo().get().execute()
         except AccessTokenRefreshError as e:
@@ -38,4 +37,6 @@ class GoogleBase(SnsBase):
             self._logger.exception('GoogleBase::isTokenValid() exception')
             return ErrorCode.E_FAILED
         else:
+            if 'email' in userInfo:
+                self._seedIdentity({'myId': userInfo['email'], 'myEmail': userInfo['email']})
             return ErrorCode.S_OK
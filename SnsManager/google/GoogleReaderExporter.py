@@ -1,5 +1,4 @@
 import copy
-import libgreader
 from datetime import datetime
 from GoogleBase import GoogleBase
 from SnsManager import ErrorCode, IExporter
@@ -44,11 +43,13 @@ class GoogleReaderExporter(GoogleBase, IExporter):
         exportDirection = kwargs.get('exportDirection', self.EXPORT_DIRECTION_FORWARD)
         limit = kwargs.get('limit', 300)
 
-        tokenValidRet = self.isTokenValid()
+        tokenValidRet = self._validateToken()
         if ErrorCode.IS_FAILED(tokenValidRet):
             retDict['retCode'] = tokenValidRet
             return retDict
 
+        import libgreader
+        from oauth2client.client import AccessTokenRefreshError
         auth = libgreader.auth.GAPDecoratorAuthMethod(self.credentials)
         gReader = libgreader.GoogleReader(auth)
         gReaderContainer = libgreader.SpecialFeed(gReader, libgreader.ReaderUrl.STARRED_LIST)
@@ -58,35 +59,39 @@ class GoogleReaderExporter(GoogleBase, IExporter):
         if service not in retLastSyncId:
             retLastSyncId[service] = None
 
-        if exportDirection == self.EXPORT_DIRECTION_BACKWARD:
-            params = {
-                'loadLimit': limit,
-            }
-            if type(lastSyncId) == dict and service in lastSyncId:
-                params['until'] = int(lastSyncId[service]) - 1
-
-            gReaderContainer.loadItems(**params)
-            for item in gReaderContainer.items:
-                parsedData = self._parseData(item)
-                retLastSyncId[service] = str(item.time)
-                retDict['data'][parsedData['id']] = parsedData
-        else:
-            if type(lastSyncId) == dict and service in lastSyncId:
-                retLastSyncId[service] = None
+        try:
+            if exportDirection == self.EXPORT_DIRECTION_BACKWARD:
                 params = {
                     'loadLimit': limit,
-                    'since': int(lastSyncId[service]) + 1,
                 }
-            else:
-                # for FORWARD sync with no lastSyncId case, we would only to retrieve latest item's id.
-                params = {'loadLimit': 1}
+                if type(lastSyncId) == dict and service in lastSyncId:
+                    params['until'] = int(lastSyncId[service]) - 1
 
-            gReaderContainer.loadItems(**params)
-            for item in gReaderContainer.items:
-                if not retLastSyncId[service]:
+                gReaderContainer.loadItems(**params)
+                for item in gReaderContainer.items:
+                    parsedData = self._parseData(item)
                     retLastSyncId[service] = str(item.time)
-                parsedData = self._parseData(item)
-                retDict['data'][parsedData['id']] = parsedData
+                    retDict['data'][parsedData['id']] = parsedData
+            else:
+                if type(lastSyncId) == dict and service in lastSyncId:
+                    retLastSyncId[service] = None
+                    params = {
+                        'loadLimit': limit,
+                        'since': int(lastSyncId[service]) + 1,
+                    }
+                else:
+                    # for FORWARD sync with no lastSyncId case, we would only to retrieve latest item's id.
+                    params = {'loadLimit': 1}
+
+                gReaderContainer.loadItems(**params)
+                for item in gReaderContainer.items:
+                    if not retLastSyncId[service]:
+                        retLastSyncId[service] = str(item.time)
+                    parsedData = self._parseData(item)
+                    retDict['data'][parsedData['id']] = parsedData
+        except AccessTokenRefreshError:
+            self._invalidateTokenValidation()
+            raise
 
         if not retLastSyncId[service]:
             del retLastSyncId[service]
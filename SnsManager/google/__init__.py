@@ -1 +1,5 @@
-from GoogleBase import GoogleBase
+from SnsManager.LazyImport import lazyModule
+
+lazyModule(__name__, {
+    'GoogleBase': 'GoogleBase',
+})
@@ -1,28 +1,28 @@
-from instagram import InstagramAPI, InstagramAPIError, InstagramClientError
 from SnsManager.SnsBase import SnsBase
 from SnsManager import ErrorCode
 
 class InstaBase(SnsBase):
     def __init__(self, *args, **kwargs):
         super(InstaBase, self).__init__(*args, **kwargs)
-        self.myId = self.getMyId()
 
-    def getMyId(self):
+    def _resolveIdentity(self):
+        from instagram import InstagramAPI
         try:
             api = InstagramAPI(access_token=self._accessToken)
-            self.myId = api.user().id
+            return {'myId': api.user().id}
         except:
             return None
-        return self.myId
 
     def isTokenValid(self):
+        from instagram import InstagramAPI, InstagramAPIError
         try:
             api = InstagramAPI(access_token=self._accessToken)
-            api.user()
+            user = api.user()
         except InstagramAPIError as e:
             return ErrorCode.E_INVALID_TOKEN
         except:
             self._logger.exception('InstaBase::isTokenValid() exception')
             return ErrorCode.E_FAILED
         else:
+            self._seedIdentity({'myId': user.id})
             return ErrorCode.S_OK
@@ -1,13 +1,7 @@
-import os
-import time
-import uuid
-import dateutil
-import urllib2
-from datetime import datetime
-from dateutil import parser as dateParser
-from instagram import InstagramAPI, InstagramAPIError, InstagramClientError
+from datetime import datetime, timedelta
 from InstaBase import InstaBase
 from SnsManager import ErrorCode, IExporter
+from SnsManager.TimeCodec import datetime2Timestamp
 
 class InstaExporter(InstaBase, IExporter):
     def __init__(self, *args, **kwargs):
@@ -23,7 +17,7 @@ class InstaExporter(InstaBase, IExporter):
         self._tmpFolder = kwargs['tmpFolder'] if 'tmpFolder' in kwargs else '/tmp'
         self.verbose = kwargs['verbose'] if 'verbose' in kwargs else False
 
-    def getData(self, since=None, until=None):
+    def getData(self, since=None, until=None, metadataOnly=False, fields=None):
         """
         Get data from Instagram feed
 
@@ -34,6 +28,10 @@ class InstaExporter(InstaBase, IExporter):
             until           --  The end time to get date
                                 given None means yesterday
                                 or given python's datetime instance as input
+            metadataOnly    --  Do not download photos, leave descriptors of them in records' photos *optional* default is False
+                                Pass records, or the ones picked out of them, to materialize() to download photos later.
+            fields          --  list of optional fields of OPTIONAL_FIELDS to compute, e.g. [ 'place' ] *optional*
+                                default is None which means all of them, fields not listed are left out of records
 
             Example: (Please note that the direction to retrieve data is backward)
                 Now   --->   2012/04/01   --->   2012/01/01
@@ -47,7 +45,7 @@ class InstaExporter(InstaBase, IExporter):
                     'id': {
                         'id': 'postId',
                         'message': 'Text',
-                        'photos': [ '/path/to/file' ],
+                        'photos': [ '/path/to/file' ],         # descriptors of SnsBase._photoDescriptor() if metadataOnly
                         'createdTime': <datetime object>,
                         'place': {      # *optional*
                             'id': 'locationId',
@@ -70,8 +68,10 @@ class InstaExporter(InstaBase, IExporter):
 
         if not until:
             until = datetime.now() - timedelta(1)
+        self._metadataOnly = metadataOnly
+        self._setFields(fields)
 
-        tokenValidRet = self.isTokenValid()
+        tokenValidRet = self._validateToken()
         if ErrorCode.IS_FAILED(tokenValidRet):
             retDict['retCode'] = tokenValidRet
             return retDict
@@ -81,21 +81,29 @@ class InstaExporter(InstaBase, IExporter):
 
         sinceTimestamp = self._datetime2Timestamp(since) + 1 if since else None
         untilTimestamp = self._datetime2Timestamp(until) - 1 if until else None
+        from instagram import InstagramAPI, InstagramAPIError
         api = InstagramAPI(access_token=self._accessToken)
-        for media in api.user_recent_media(max_pages=999, min_timestamp=untilTimestamp, max_timestamp=sinceTimestamp):
-            if not media:
-                break
-            for data in media:
-                data = self._transformFormat(data)
-                self._dumpData(data)
-                retDict['data'][data['id']] = data
+        try:
+            for media in api.user_recent_media(max_pages=999, min_timestamp=untilTimestamp, max_timestamp=sinceTimestamp):
+                if not media:
+                    break
+                records = [self._transformFormat(data) for data in media]
+                # Photos are downloaded in background while transforming, wait for them before handing out this page
+                self._resolvePhotos(records)
+                for data in records:
+                    self._dumpData(data)
+                    retDict['data'][data['id']] = data
+        except InstagramAPIError as e:
+            if e.error_type == 'OAuthAccessTokenException':
+                self._invalidateTokenValidation()
+            raise
 
         retDict['count'] = len(retDict['data'])
         retDict['retCode'] = ErrorCode.S_OK
         return retDict
 
     def _datetime2Timestamp(self, datetimeObj):
-        return int(time.mktime(datetimeObj.timetuple()))
+        return datetime2Timestamp(datetimeObj)
 
     def _transformFormat(self, data):
         retData = {
@@ -105,24 +113,19 @@ class InstaExporter(InstaBase, IExporter):
             'photos': []
         }
 
-        if hasattr(data, 'location'):
+        if hasattr(data, 'location') and self._wantField('place'):
             retData['place'] = data.location
-        fPath = self._storeFileToTemp(data.images['standard_resolution'].url)
-        if fPath:
-            retData['photos'].append(fPath)
+        if not self._wantField('photos'):
+            return self._projectRecord(retData)
+        fileUri = data.images['standard_resolution'].url
+        if self._metadataOnly:
+            retData['photos'].append(self._photoDescriptor(fileUri, data.id, 'standard_resolution'))
+        else:
+            retData['photos'].append(self._submitDownload(fileUri, self._storeFileToTemp, fileUri))
         return retData
 
     def _storeFileToTemp(self, fileUri):
-        fileExtName = fileUri[fileUri.rfind('.') + 1:]
-        newFileName = os.path.join(self._tmpFolder, "{0}.{1}".format(str(uuid.uuid1()), fileExtName))
-        try:
-            conn = urllib2.urlopen(fileUri)
-            fileObj = file(newFileName, 'w')
-            fileObj.write(conn.read())
-            fileObj.close()
-        except:
-            return None
-        return newFileName
+        return self._photoStore.fetch(fileUri, self._downloadFile)
 
     def _dumpData(self, data):
         if self.verbose:
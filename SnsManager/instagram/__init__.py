@@ -1,2 +1,6 @@
-from InstaBase import InstaBase
-from InstaExporter import InstaExporter
+from SnsManager.LazyImport import lazyModule
+
+lazyModule(__name__, {
+    'InstaBase': 'InstaBase',
+    'InstaExporter': 'InstaExporter',
+})
@@ -1,10 +1,10 @@
-import tweepy
 from SnsManager.SnsBase import SnsBase
 from SnsManager import ErrorCode
 
 class TwitterBase(SnsBase):
     def __init__(self, *args, **kwargs):
         super(TwitterBase, self).__init__(*args, **kwargs)
+        import tweepy
         for k in ['accessTokenSecret', 'consumerKey', 'consumerSecret']:
             if k not in kwargs:
                 raise ValueError('Invalid parameters.')
@@ -13,18 +13,19 @@ class TwitterBase(SnsBase):
         _auth.set_access_token(self._accessToken, self._accessTokenSecret)
         self._tweepy = tweepy.API(_auth)
 
-        self.myId = self.getMyId()
-
-    def getMyId(self):
+    def _resolveIdentity(self):
+        import tweepy
         try:
-            self.myId = self._tweepy.me().screen_name
+            me = self._tweepy.me()
         except tweepy.TweepError as e:
             return None
-        return self.myId
+        return {'myId': me.screen_name, 'myName': me.name}
 
     def isTokenValid(self):
+        import tweepy
         try:
-            _myId = self._tweepy.me().name
+            me = self._tweepy.me()
         except tweepy.TweepError as e:
             return ErrorCode.E_INVALID_TOKEN
+        self._seedIdentity({'myId': me.screen_name, 'myName': me.name})
         return ErrorCode.S_OK
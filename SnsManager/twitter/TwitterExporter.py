@@ -1,6 +1,5 @@
 import re
 import copy
-import tweepy
 from TwitterBase import TwitterBase
 from SnsManager import ErrorCode, IExporter
 
@@ -47,7 +46,7 @@ class TwitterExporter(TwitterBase, IExporter):
         exportDirection = kwargs.get('exportDirection', self.EXPORT_DIRECTION_FORWARD)
         limit = kwargs.get('limit', 300)
 
-        tokenValidRet = self.isTokenValid()
+        tokenValidRet = self._validateToken()
         if ErrorCode.IS_FAILED(tokenValidRet):
             retDict['retCode'] = tokenValidRet
             return retDict
@@ -55,41 +54,47 @@ class TwitterExporter(TwitterBase, IExporter):
         if not self.myId:
             return retDict
 
+        import tweepy
         retLastSyncId = copy.copy(lastSyncId) or {}
-        for api in self._API_LIST:
-            if api not in retLastSyncId:
-                retLastSyncId[api] = None
-            if exportDirection == self.EXPORT_DIRECTION_BACKWARD:
-                params = {
-                    'include_entities': True,
-                }
-                if type(lastSyncId) == dict and api in lastSyncId:
-                    params['max_id'] = int(lastSyncId[api]) - 1
-                for status in tweepy.Cursor(getattr(self._tweepy, api), **params).items(limit=limit):
-                    parsedData = self._parseData(api, status)
-                    retLastSyncId[api] = str(status.id)
-                    retDict['data'][parsedData['id']] = parsedData
-            else:
-                if type(lastSyncId) == dict and api in lastSyncId:
+        try:
+            for api in self._API_LIST:
+                if api not in retLastSyncId:
                     retLastSyncId[api] = None
+                if exportDirection == self.EXPORT_DIRECTION_BACKWARD:
                     params = {
                         'include_entities': True,
-                        'since_id': int(lastSyncId[api]),
                     }
-                    itemParams = {}
-                else:
-                    # for FORWARD sync with no lastSyncId case, we would only to retrieve latest item's id.
-                    params = {'include_entities': True}
-                    itemParams = {'limit' : 1}
-
-                for status in tweepy.Cursor(getattr(self._tweepy, api), **params).items(**itemParams):
-                    if not retLastSyncId[api]:
+                    if type(lastSyncId) == dict and api in lastSyncId:
+                        params['max_id'] = int(lastSyncId[api]) - 1
+                    for status in tweepy.Cursor(getattr(self._tweepy, api), **params).items(limit=limit):
+                        parsedData = self._parseData(api, status)
                         retLastSyncId[api] = str(status.id)
-                    parsedData = self._parseData(api, status)
-                    retDict['data'][parsedData['id']] = parsedData
-
-            if not retLastSyncId[api]:
-                del retLastSyncId[api]
+                        retDict['data'][parsedData['id']] = parsedData
+                else:
+                    if type(lastSyncId) == dict and api in lastSyncId:
+                        retLastSyncId[api] = None
+                        params = {
+                            'include_entities': True,
+                            'since_id': int(lastSyncId[api]),
+                        }
+                        itemParams = {}
+                    else:
+                        # for FORWARD sync with no lastSyncId case, we would only to retrieve latest item's id.
+                        params = {'include_entities': True}
+                        itemParams = {'limit' : 1}
+
+                    for status in tweepy.Cursor(getattr(self._tweepy, api), **params).items(**itemParams):
+                        if not retLastSyncId[api]:
+                            retLastSyncId[api] = str(status.id)
+                        parsedData = self._parseData(api, status)
+                        retDict['data'][parsedData['id']] = parsedData
+
+                if not retLastSyncId[api]:
+                    del retLastSyncId[api]
+        except tweepy.TweepError as e:
+            if getattr(getattr(e, 'response', None), 'status', None) == 401:
+                self._invalidateTokenValidation()
+            raise
 
         retDict['lastSyncId'] = retLastSyncId if retLastSyncId else None
         retDict['count'] = len(retDict['data'])
@@ -1,2 +1,6 @@
-from TwitterBase import TwitterBase
-from TwitterExporter import TwitterExporter
+from SnsManager.LazyImport import lazyModule
+
+lazyModule(__name__, {
+    'TwitterBase': 'TwitterBase',
+    'TwitterExporter': 'TwitterExporter',
+})
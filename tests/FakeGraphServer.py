@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    FakeGraphServer.py - Local stand-in of Graph API and Facebook CDN for benchmarks
+
+    It serves a synthetic account through /me, /me/permissions, /me/<api>, /me/picture,
+    Graph objects, album photos, batch requests and CDN images,
+    with configurable latency, page size and error injection.
+    Graph objects carry an ETag and are answered 304 Not Modified to a matching If-None-Match.
+
+    Usage:
+        server = FakeGraphServer(feedSize=200, shape={'status': 1, 'photo': 1})
+        server.start()
+        exporter = FbExporter(accessToken='token', graphUri=server.graphUri)
+        ...
+        print server.stats()
+        server.stop()
+"""
+import json
+import hashlib
+import socket
+import time
+import random
+import calendar
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+MY_ID = '1'
+MY_NAME = 'Fake User'
+MY_EMAIL = 'fake.user@example.com'
+OTHER_ID = '2'
+
+# Own album of normal uploads, own mobile uploads album and an album of someone else
+ALBUM_NORMAL = '900'
+ALBUM_MOBILE = '901'
+ALBUM_OTHER = '902'
+
+# Kinds of feed items, see FakeGraphServer._addItem()
+ITEM_KINDS = ['status', 'link', 'photo', 'taggedPhoto', 'albumPhoto', 'checkin', 'note']
+
+class _HttpServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, clientAddress):
+        # Clients close kept-alive connections at will, e.g. at interpreter shutdown
+        pass
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Keep-alive, so that connection pooling of clients is measured as well
+    protocol_version = 'HTTP/1.1'
+    # Send a response at once instead of a write per header, and do not let Nagle hold back its tail,
+    # either stalls on delayed ACK
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._respond(*self.server.graph.route('GET', self.headers.get('Host', ''), self.path, headers=self.headers))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._respond(*self.server.graph.route('POST', self.headers.get('Host', ''), self.path, body, self.headers))
+
+    def _respond(self, status, headers, body):
+        self.send_response(status)
+        for name, value in headers.iteritems():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.graph.countBytes(len(body))
+
+class FakeGraphServer(object):
+    def __init__(self, feedSize=100, shape=None, pageSize=25, latency=0.0, errorRate=0.0, quotaErrorRate=0.0,
+                 imageSize=20000, seed=0, baseTime=None, failApis=None):
+        """
+        Constructor of FakeGraphServer
+
+        In:
+            feedSize            --  number of feed items
+            shape               --  dict of item kind to weight, see ITEM_KINDS *optional* default is evenly mixed
+            pageSize            --  items in one page of /me/<api>
+            latency             --  seconds to wait before every response
+            errorRate           --  fraction of Graph API requests failing with 500
+            quotaErrorRate      --  fraction of Graph API requests failing with quota error code 4
+            imageSize           --  bytes of every CDN image
+            seed                --  seed of item kinds and error injection
+            baseTime            --  unix timestamp of the newest item *optional* default is 2010-12-01,
+                                    items are one hour apart backward, so statuses, checkins, links and notes APIs,
+                                    which are crawled before FbExporter's multiApiCrawlerSince, have data as well
+            failApis            --  APIs of /me/<api> whose every page fails with 500 *optional*
+
+        """
+        self.feedSize = feedSize
+        self.shape = shape or dict((kind, 1) for kind in ITEM_KINDS)
+        self.pageSize = pageSize
+        self.latency = latency
+        self.errorRate = errorRate
+        self.quotaErrorRate = quotaErrorRate
+        self.failApis = set(failApis or [])
+        self.imageSize = imageSize
+        self.baseTime = baseTime or calendar.timegm((2010, 12, 1, 12, 0, 0))
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # Bound here, since URLs in the synthetic data carry the port
+        self._httpServer = _HttpServer(('127.0.0.1', 0), _Handler)
+        self._httpServer.graph = self
+        self.port = self._httpServer.server_address[1]
+        self.resetStats()
+
+        self.apiItems = dict((api, []) for api in ['feed', 'statuses', 'checkins', 'links', 'notes'])
+        self.objects = {
+            ALBUM_NORMAL: {'id': ALBUM_NORMAL, 'type': 'normal', 'from': self._me(), 'can_upload': True},
+            ALBUM_MOBILE: {'id': ALBUM_MOBILE, 'type': 'mobile', 'from': self._me(), 'can_upload': False},
+            ALBUM_OTHER: {'id': ALBUM_OTHER, 'type': 'normal', 'from': {'id': OTHER_ID, 'name': 'Friend'}, 'can_upload': False},
+        }
+        self.albumPhotos = dict((albumId, []) for albumId in [ALBUM_NORMAL, ALBUM_MOBILE, ALBUM_OTHER])
+
+        kinds = []
+        for kind in ITEM_KINDS:
+            kinds += [kind] * self.shape.get(kind, 0)
+        for i in xrange(feedSize):
+            self._addItem(i, self._random.choice(kinds), self.baseTime - i * 3600)
+        for photos in self.albumPhotos.itervalues():
+            photos.sort(key=lambda photo: photo['created_time'], reverse=True)
+
+    @property
+    def graphUri(self):
+        return 'http://127.0.0.1:{0}/'.format(self.port)
+
+    @property
+    def cdnUri(self):
+        # Another host name of the same server, so that CDN connections are pooled apart from Graph API's
+        return 'http://localhost:{0}/cdn/'.format(self.port)
+
+    def start(self):
+        thread = threading.Thread(target=self._httpServer.serve_forever, name='FakeGraphServer')
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        if self._httpServer:
+            self._httpServer.shutdown()
+            self._httpServer.server_close()
+            self._httpServer = None
+
+    def resetStats(self):
+        with self._lock:
+            self._stats = {
+                'requests': 0,
+                'bytes': 0,
+                'injectedErrors': 0,
+                'endpoints': {},
+            }
+
+    def stats(self):
+        """
+        Requests, bytes sent, injected errors and requests of every endpoint since start or resetStats()
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['endpoints'] = dict(self._stats['endpoints'])
+            return stats
+
+    def countBytes(self, size):
+        with self._lock:
+            self._stats['bytes'] += size
+
+    def _count(self, endpoint, isRequest=True):
+        with self._lock:
+            if isRequest:
+                self._stats['requests'] += 1
+            self._stats['endpoints'][endpoint] = self._stats['endpoints'].get(endpoint, 0) + 1
+
+    def _me(self):
+        return {'id': MY_ID, 'name': MY_NAME}
+
+    def _time(self, timestamp):
+        return time.strftime('%Y-%m-%dT%H:%M:%S+0000', time.gmtime(timestamp))
+
+    def _cdn(self, name):
+        return '{0}{1}'.format(self.cdnUri, name)
+
+    def _addItem(self, i, kind, timestamp):
+        objId = str(10000 + i)
+        createdTime = self._time(timestamp)
+        item = {
+            'id': '{0}_{1}'.format(MY_ID, objId),
+            'from': self._me(),
+            'created_time': createdTime,
+            'updated_time': createdTime,
+        }
+        # Items of statuses, checkins, links and notes APIs are objects without the user id prefix
+        apiItem = dict(item, id=objId)
+        api = None
+        photoLink = 'https://www.facebook.com/photo.php?fbid={0}&set=a.{1}.1.1&type=1'
+
+        if kind == 'status':
+            item.update(type='status', message='status {0}'.format(i))
+            apiItem.update(message=item['message'])
+            api = 'statuses'
+        elif kind == 'link':
+            item.update(type='link', link='http://example.com/{0}'.format(i), message='link {0}'.format(i), picture=self._cdn('{0}_s.jpg'.format(objId)))
+            apiItem.update(link=item['link'], message=item['message'], picture=item['picture'])
+            api = 'links'
+        elif kind == 'photo':
+            item.update(type='photo', object_id=objId, message='photo {0}'.format(i),
+                        link=photoLink.format(objId, ALBUM_MOBILE), picture=self._cdn('{0}_s.jpg'.format(objId)))
+            self.objects[objId] = self._photoObject(objId, createdTime, self._me(), photoLink.format(objId, ALBUM_MOBILE))
+            self.albumPhotos[ALBUM_MOBILE].append(self.objects[objId])
+        elif kind == 'taggedPhoto':
+            item.update(type='photo', object_id=objId, status_type='tagged_in_photo', story='tagged in a photo',
+                        link=photoLink.format(objId, ALBUM_OTHER), picture=self._cdn('{0}_s.jpg'.format(objId)))
+            self.objects[objId] = self._photoObject(objId, createdTime, {'id': OTHER_ID, 'name': 'Friend'}, photoLink.format(objId, ALBUM_OTHER))
+            self.objects[objId]['tags'] = {'data': [{'id': MY_ID, 'name': MY_NAME}, {'id': '3', 'name': 'Another Friend'}]}
+            self.objects[objId]['place'] = {'name': 'Park', 'location': {'latitude': 25.03, 'longitude': 121.56}}
+        elif kind == 'albumPhoto':
+            # Posted photos are looked up from the album around the post's created time
+            item.update(type='photo', message='album {0}'.format(i), link=photoLink.format(objId, ALBUM_NORMAL))
+            for n in xrange(2):
+                photoId = '{0}{1}'.format(objId, n)
+                photo = self._photoObject(photoId, self._time(timestamp + 60 + n), self._me(), photoLink.format(photoId, ALBUM_NORMAL))
+                self.objects[photoId] = photo
+                self.albumPhotos[ALBUM_NORMAL].append(photo)
+        elif kind == 'checkin':
+            place = {'name': 'Cafe {0}'.format(i), 'location': {'latitude': 25.04, 'longitude': 121.53}}
+            item.update(type='checkin', caption='checked in at Cafe {0}'.format(i), message='checkin {0}'.format(i), place=place)
+            apiItem.update(message=item['message'], place=place)
+            api = 'checkins'
+        elif kind == 'note':
+            item.update(type='note', subject='note {0}'.format(i), message='<p>note<br/>body {0}</p>'.format(i))
+            apiItem.update(subject=item['subject'], message=item['message'])
+            api = 'notes'
+
+        self.apiItems['feed'].append((timestamp, item))
+        if api:
+            self.apiItems[api].append((timestamp, apiItem))
+
+    def _photoObject(self, photoId, createdTime, owner, link):
+        return {
+            'id': photoId,
+            'from': owner,
+            'created_time': createdTime,
+            'link': link,
+            'picture': self._cdn('{0}_s.jpg'.format(photoId)),
+            'images': [
+                {'source': self._cdn('{0}_o.jpg'.format(photoId))},
+                {'source': self._cdn('{0}_n.jpg'.format(photoId))},
+            ],
+        }
+
+    def _json(self, status, data, headers=None):
+        headers = dict(headers or {})
+        headers['Content-Type'] = 'application/json'
+        return status, headers, json.dumps(data)
+
+    def _injectedError(self):
+        with self._lock:
+            value = self._random.random()
+            if value < self.errorRate:
+                self._stats['injectedErrors'] += 1
+                return self._json(500, {'error': {'message': 'Injected server error', 'type': 'OAuthException', 'code': 1}})
+            if value < self.errorRate + self.quotaErrorRate:
+                self._stats['injectedErrors'] += 1
+                return self._json(400, {'error': {'message': 'Injected quota error', 'code': 4}},
+                                  {'X-App-Usage': json.dumps({'call_count': 100, 'total_time': 20, 'total_cputime': 20})})
+        return None
+
+    def _conditional(self, response, headers):
+        """
+        response with an ETag of its body, or 304 Not Modified if headers carry a matching If-None-Match
+        """
+        status, responseHeaders, body = response
+        etag = '"{0}"'.format(hashlib.md5(body).hexdigest())
+        if (headers or {}).get('If-None-Match', None) == etag:
+            self._count('notModified', isRequest=False)
+            return 304, {'ETag': etag}, ''
+        responseHeaders['ETag'] = etag
+        return status, responseHeaders, body
+
+    def route(self, method, host, path, body=None, headers=None):
+        """
+        Response of a request, a tuple of (status, headers, body)
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        splitted = urlparse.urlsplit(path)
+        query = dict((k, v[0]) for k, v in urlparse.parse_qs(splitted.query, keep_blank_values=True).iteritems())
+        parts = splitted.path.strip('/').split('/')
+
+        if parts[0] == 'cdn':
+            self._count('cdn')
+            return 200, {'Content-Type': 'image/jpeg'}, ('/'.join(parts[1:]) * self.imageSize)[:self.imageSize]
+
+        if method == 'POST' and parts == ['']:
+            self._count('batch')
+            return self._batch(dict((k, v[0]) for k, v in urlparse.parse_qs(body or '').iteritems()))
+
+        return self._graph(parts, query, headers=headers)
+
+    def _graph(self, parts, query, inBatch=False, headers=None):
+        endpoint = '/'.join(parts) if parts[0] == 'me' else ('albumPhotos' if parts[1:] == ['photos'] else 'object')
+        if not inBatch:
+            self._count(endpoint)
+            if parts != ['me'] and parts != ['me', 'permissions']:
+                error = self._injectedError()
+                if error:
+                    return error
+
+        if parts == ['me']:
+            me = {'id': MY_ID, 'name': MY_NAME, 'email': MY_EMAIL}
+            if 'permissions' in query.get('fields', '').split(','):
+                me['permissions'] = self._permissions()
+            return self._json(200, me)
+        if parts == ['me', 'permissions']:
+            return self._json(200, self._permissions())
+        if parts == ['me', 'picture'] or parts[1:] == ['picture']:
+            return 302, {'Location': self._cdn('avatar.jpg')}, ''
+        if parts[0] == 'me' and len(parts) == 2 and parts[1] in self.failApis:
+            return self._json(500, {'error': {'message': 'Failing API', 'type': 'OAuthException', 'code': 1}})
+        if parts[0] == 'me' and len(parts) == 2 and parts[1] in self.apiItems:
+            return self._apiPage(parts[1], query)
+        if parts[1:] == ['photos']:
+            offset = int(query.get('offset', 0))
+            limit = int(query.get('limit', 25))
+            return self._json(200, {'data': self.albumPhotos.get(parts[0], [])[offset:offset + limit]})
+        if len(parts) == 1 and parts[0] in self.objects:
+            return self._conditional(self._json(200, self.objects[parts[0]]), headers)
+        return self._json(400, {'error': {'message': 'Unknown path', 'type': 'GraphMethodException', 'code': 100}})
+
+    def _permissions(self):
+        return {'data': [{'read_stream': 1, 'user_photos': 1, 'user_status': 1, 'user_checkins': 1, 'user_notes': 1}]}
+
+    def _apiPage(self, api, query):
+        items = self.apiItems[api]
+        uri = '{0}me/{1}'.format(self.graphUri, api)
+        if 'after' in query:
+            offset = int(query['after'] or 0)
+            page = items[offset:offset + self.pageSize]
+            paging = {}
+            if offset + self.pageSize < len(items):
+                paging['next'] = '{0}?after={1}'.format(uri, offset + self.pageSize)
+        else:
+            if 'until' in query:
+                items = [(timestamp, item) for timestamp, item in items if timestamp < int(query['until'])]
+            if 'since' in query:
+                items = [(timestamp, item) for timestamp, item in items if timestamp > int(query['since'])]
+            page = items[:self.pageSize]
+            paging = {}
+            if len(items) > self.pageSize:
+                paging['next'] = '{0}?until={1}'.format(uri, page[-1][0])
+        return self._json(200, {'data': [item for timestamp, item in page], 'paging': paging})
+
+    def _batch(self, params):
+        try:
+            batch = json.loads(params['batch'])
+        except (KeyError, ValueError):
+            return self._json(400, {'error': {'message': 'Invalid batch', 'code': 100}})
+        error = self._injectedError()
+        if error:
+            return error
+        results = []
+        for request in batch:
+            splitted = urlparse.urlsplit(request['relative_url'])
+            query = dict((k, v[0]) for k, v in urlparse.parse_qs(splitted.query, keep_blank_values=True).iteritems())
+            # Sub-requests of a batch are not HTTP requests
+            self._count('batchItems', isRequest=False)
+            requestHeaders = dict((header['name'], header['value']) for header in request.get('headers', []))
+            status, headers, body = self._graph(splitted.path.strip('/').split('/'), query, inBatch=True, headers=requestHeaders)
+            results.append({
+                'code': status,
+                'headers': [{'name': name, 'value': value} for name, value in headers.iteritems()],
+                'body': body,
+            })
+        return self._json(200, results)
@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    bench_FbExporter.py - End-to-end FbExporter.getData against FakeGraphServer for different account shapes
+
+    Every shape runs in a fresh interpreter, so peak memory is not inflated by previous runs.
+    Run it directly to print requests, wall time, bytes and peak memory of every shape.
+"""
+import sys, os.path
+# Hack for import module in grandparent folder
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+import json
+import time
+import shutil
+import resource
+import tempfile
+import threading
+import subprocess
+import unittest
+from datetime import datetime
+from FakeGraphServer import FakeGraphServer, MY_ID
+
+# Account shapes, arguments of FakeGraphServer
+SHAPES = {
+    'statuses': {'feedSize': 1000, 'shape': {'status': 1}},
+    'photos': {'feedSize': 300, 'shape': {'photo': 2, 'taggedPhoto': 1, 'albumPhoto': 1}, 'imageSize': 50000},
+    'mixed': {'feedSize': 500},
+    'mixed-latency': {'feedSize': 200, 'latency': 0.01},
+    'mixed-errors': {'feedSize': 300, 'errorRate': 0.05, 'quotaErrorRate': 0.02},
+}
+# getData() range, non-feed APIs are only crawled before FbExporter's multiApiCrawlerSince
+UNTIL = datetime(2009, 1, 1)
+
+def run(serverArgs, server=None, materialize=False, fields=None, **exporterArgs):
+    """
+    Run getData() against a FakeGraphServer of serverArgs, or against server kept running for further runs, return its measurements
+
+    With materialize, getData() leaves photo descriptors which materialize() downloads afterwards.
+    fields is passed to getData().
+    """
+    from SnsManager import ErrorCode
+    from SnsManager.facebook import FbExporter
+    from SnsManager.RetryPolicy import RetryPolicy
+
+    ownServer = server is None
+    if ownServer:
+        server = FakeGraphServer(**serverArgs).start()
+    server.resetStats()
+    tmpFolder = tempfile.mkdtemp()
+    try:
+        exporter = FbExporter(
+            accessToken='token',
+            graphUri=server.graphUri,
+            tmpFolder=tmpFolder,
+            retryPolicy=RetryPolicy(baseDelay=0.01, quotaDelay=0.01, maxDelay=0.05, jitter=0),
+            **exporterArgs)
+        startTime = time.time()
+        retDict = exporter.getData(since=None, until=UNTIL, metadataOnly=materialize, fields=fields)
+        wallTime = time.time() - startTime
+        metadata = {}
+        if materialize:
+            metadata['descriptors'] = sum(1 for data in retDict['data'].itervalues() for photo in data.get('photos', []) if type(photo) == dict)
+            metadata['cdnBeforeMaterialize'] = server.stats()['endpoints'].get('cdn', 0)
+            metadata['metadataWallTime'] = wallTime
+            exporter.materialize(retDict['data'])
+            wallTime = time.time() - startTime
+        # Stop download workers, and let the server's handler threads see their kept-alive connections closed
+        exporter.close()
+        stats = server.stats()
+        return dict(metadata, **{
+            'retCode': str(retDict['retCode']),
+            'succeeded': ErrorCode.IS_SUCCEEDED(retDict['retCode']),
+            'count': retDict['count'],
+            'expectedCount': server.feedSize,
+            'photos': sum(len(data.get('photos', [])) for data in retDict['data'].itervalues()),
+            'optionalFields': sorted(set(name for data in retDict['data'].itervalues() for name in exporter.OPTIONAL_FIELDS if name in data)),
+            'wallTime': wallTime,
+            'requests': stats['requests'],
+            'endpoints': stats['endpoints'],
+            'bytes': stats['bytes'],
+            'injectedErrors': stats['injectedErrors'],
+            'downloads': exporter.getDownloadStats(),
+            'diskCache': exporter.getDiskCacheStats(),
+            # Kilobytes on Linux
+            'peakRss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        })
+    finally:
+        if ownServer:
+            server.stop()
+        shutil.rmtree(tmpFolder, ignore_errors=True)
+
+def workerThreads():
+    """
+    Number of live WorkerPool threads, the server's connection handler threads are not counted
+    """
+    return sum(1 for thread in threading.enumerate() if thread.name.startswith('WorkerPool-'))
+
+def runIsolated(shape):
+    """
+    Run a shape of SHAPES in a new interpreter
+    """
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--shape', shape])
+    return json.loads(output.strip().splitlines()[-1])
+
+class BenchFbExporter(unittest.TestCase):
+    def test_GetData_GivenMixedShape_AllRecords(self):
+        result = run({'feedSize': 60, 'pageSize': 10})
+        self.assertTrue(result['succeeded'], result['retCode'])
+        self.assertEqual(result['count'], result['expectedCount'])
+        self.assertEqual(result['photos'], result['endpoints'].get('cdn', 0))
+        self.assertGreater(result['photos'], 0)
+
+    def test_GetData_GivenNewExporter_RequestMeOnce(self):
+        result = run({'feedSize': 60, 'pageSize': 10})
+        self.assertTrue(result['succeeded'], result['retCode'])
+        self.assertEqual(result['endpoints'].get('me', 0), 1)
+        self.assertEqual(result['endpoints'].get('me/permissions', 0), 0)
+
+    def test_GetData_GivenInjectedErrors_AllRecords(self):
+        result = run({'feedSize': 60, 'pageSize': 10, 'errorRate': 0.1, 'quotaErrorRate': 0.05, 'seed': 1})
+        self.assertGreater(result['injectedErrors'], 0)
+        self.assertTrue(result['succeeded'], result['retCode'])
+        self.assertEqual(result['count'], result['expectedCount'])
+
+    def test_GetData_GivenMemoryTracer_TraceEveryRequest(self):
+        from SnsManager.Tracer import MemoryTracer
+        tracer = MemoryTracer()
+        result = run({'feedSize': 60, 'pageSize': 10}, tracer=tracer)
+        report = tracer.report()
+        self.assertEqual(sum(entry['requests'] for entry in report.itervalues()), result['requests'])
+        self.assertEqual(report['getData > api:feed > page > request:api']['requests'], result['endpoints']['me/feed'])
+        self.assertEqual(len(tracer.spans()), 1)
+
+    def test_Materialize_GivenMetadataOnly_DownloadAfterwards(self):
+        server = FakeGraphServer(feedSize=60, pageSize=10).start()
+        try:
+            downloaded = run(None, server=server)
+            materialized = run(None, server=server, materialize=True)
+        finally:
+            server.stop()
+        self.assertTrue(materialized['succeeded'], materialized['retCode'])
+        self.assertEqual(materialized['count'], downloaded['count'])
+        self.assertEqual(materialized['cdnBeforeMaterialize'], 0)
+        self.assertEqual(materialized['descriptors'], downloaded['photos'])
+        self.assertEqual(materialized['photos'], downloaded['photos'])
+        self.assertEqual(materialized['endpoints'].get('cdn', 0), downloaded['endpoints'].get('cdn', 0))
+
+    def test_GetData_GivenNoOptionalFields_SkipTheirRequests(self):
+        server = FakeGraphServer(feedSize=60, pageSize=10).start()
+        try:
+            full = run(None, server=server)
+            placeOnly = run(None, server=server, fields=['place'])
+            bare = run(None, server=server, fields=[])
+        finally:
+            server.stop()
+        self.assertEqual(full['optionalFields'], ['people', 'photos', 'place'])
+        self.assertEqual(placeOnly['optionalFields'], ['place'])
+        self.assertEqual(bare['optionalFields'], [])
+        for result in (placeOnly, bare):
+            self.assertTrue(result['succeeded'], result['retCode'])
+            self.assertEqual(result['count'], full['count'])
+            self.assertEqual(result['endpoints'].get('cdn', 0), 0)
+        self.assertLess(placeOnly['requests'], full['requests'])
+        self.assertEqual(bare['endpoints'].get('albumPhotos', 0), 0)
+        self.assertLess(bare['requests'], placeOnly['requests'])
+
+    def test_GetData_GivenDiskCache_NextRunsHitOrRevalidate(self):
+        server = FakeGraphServer(feedSize=60, pageSize=10).start()
+        cacheFolder = tempfile.mkdtemp()
+        cachePath = os.path.join(cacheFolder, 'graph.sqlite')
+        try:
+            first = run(None, server=server, diskCachePath=cachePath)
+            fresh = run(None, server=server, diskCachePath=cachePath)
+            stale = run(None, server=server, diskCachePath=cachePath, diskCacheTtls={'photo': -1, 'album': -1, 'object': -1})
+        finally:
+            server.stop()
+            shutil.rmtree(cacheFolder, ignore_errors=True)
+
+        objectRequests = lambda result: result['endpoints'].get('object', 0) + result['endpoints'].get('batchItems', 0)
+        self.assertGreater(objectRequests(first), 0)
+        for result in (first, fresh, stale):
+            self.assertTrue(result['succeeded'], result['retCode'])
+            self.assertEqual(result['count'], result['expectedCount'])
+            self.assertEqual(result['photos'], first['photos'])
+        self.assertEqual(objectRequests(fresh), 0)
+        self.assertGreater(fresh['diskCache']['hits'], 0)
+        self.assertEqual(stale['endpoints'].get('notModified', 0), objectRequests(stale))
+        self.assertEqual(stale['diskCache']['revalidations'], objectRequests(stale))
+
+    def test_GetData_GivenSharedHttpPool_KeepItsPoolSizes(self):
+        from SnsManager.HttpClient import HttpClient
+
+        server = FakeGraphServer(feedSize=20, pageSize=10).start()
+        shared = HttpClient._shared, HttpClient._sharedKwargs
+        HttpClient._shared = None
+        try:
+            client = HttpClient.shared(hostPoolSizes={'127.0.0.1': 3})
+            self.assertIs(HttpClient.shared(), client)
+            self.assertRaises(ValueError, HttpClient.shared, poolSize=8)
+            result = run(None, server=server, sharedHttpPool=True)
+            self.assertTrue(result['succeeded'], result['retCode'])
+            self.assertEqual(client.getPoolSize('127.0.0.1'), 3)
+            self.assertRaises(ValueError, run, None, server=server, sharedHttpPool=True, graphPoolSize=5)
+        finally:
+            HttpClient._shared, HttpClient._sharedKwargs = shared
+            server.stop()
+
+    def test_GetData_GivenExportersNotClosed_WorkersExit(self):
+        from SnsManager.WorkerPool import WorkerPool
+        from SnsManager.facebook import FbExporter
+
+        server = FakeGraphServer(feedSize=20, pageSize=10).start()
+        tmpFolder = tempfile.mkdtemp()
+        try:
+            for i in xrange(5):
+                exporter = FbExporter(accessToken='token', graphUri=server.graphUri, tmpFolder=tmpFolder)
+                self.assertTrue(exporter.getData(since=None, until=UNTIL)['count'] > 0)
+            deadline = time.time() + WorkerPool.IDLE_TIMEOUT * 3
+            # Pools of the other tests become idle as well
+            while workerThreads() and time.time() < deadline:
+                time.sleep(0.1)
+            self.assertEqual(workerThreads(), 0)
+        finally:
+            server.stop()
+            shutil.rmtree(tmpFolder, ignore_errors=True)
+
+    def test_GetData_GivenExporterNotClosed_ReleaseCrawlAndLookupWorkers(self):
+        from SnsManager.WorkerPool import WorkerPool
+        from SnsManager.facebook import FbExporter
+
+        server = FakeGraphServer(feedSize=60, pageSize=10).start()
+        tmpFolder = tempfile.mkdtemp()
+        try:
+            # Pools of the other tests become idle first
+            deadline = time.time() + WorkerPool.IDLE_TIMEOUT * 3
+            while workerThreads() and time.time() < deadline:
+                time.sleep(0.1)
+            exporter = FbExporter(accessToken='token', graphUri=server.graphUri, tmpFolder=tmpFolder, downloadPoolSize=0)
+            self.assertTrue(exporter.getData(since=None, until=UNTIL, parallelCrawl=True)['count'] > 0)
+            # Well before WorkerPool.IDLE_TIMEOUT
+            deadline = time.time() + WorkerPool.IDLE_TIMEOUT / 2
+            while workerThreads() and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(workerThreads(), 0)
+        finally:
+            server.stop()
+            shutil.rmtree(tmpFolder, ignore_errors=True)
+
+    def test_Parse_GivenLinkPhotoFailedToDownload_DropLinkWithoutUri(self):
+        from SnsManager.facebook import FbExporter
+
+        class FailingPhotoStore(object):
+            def fetch(self, fileUri, download):
+                raise IOError('Unreachable CDN')
+
+        def page():
+            item = {'type': 'link', 'from': {'id': MY_ID, 'name': 'Me'}, 'created_time': '2008-01-01T00:00:00+0000'}
+            return {'data': [
+                dict(item, id='1_1', picture='http://localhost:9/cdn/1_s.jpg'),
+                dict(item, id='1_2', picture='http://localhost:9/cdn/2_s.jpg', link='http://example.com/2'),
+            ], 'paging': {}}
+
+        parsedIds = {}
+        for fields in (None, []):
+            with FbExporter(accessToken='token', myId=MY_ID, myName='Me', photoStore=FailingPhotoStore()) as exporter:
+                exporter._setFields(fields)
+                records, _ = exporter.FbApiHandlerFeed(outerObj=exporter, data=page()).parse()
+                parsedIds[fields is None] = [record['id'] for record in records]
+        self.assertEqual(parsedIds[True], ['1_2'])
+        # Without photos, the picture alone keeps the link
+        self.assertEqual(parsedIds[False], ['1_1', '1_2'])
+
+    def test_GetData_GivenCheckpointStore_ResumeWithoutDuplicates(self):
+        from SnsManager.CheckpointStore import FileCheckpointStore
+
+        server = FakeGraphServer(feedSize=60, pageSize=10, failApis=['statuses']).start()
+        checkpointFolder = tempfile.mkdtemp()
+        try:
+            store = FileCheckpointStore(folder=checkpointFolder)
+            failed = run(None, server=server, checkpointStore=store)
+            emittedIds = store.loadIds('FbExporter-{0}'.format(MY_ID))
+            server.failApis.clear()
+            resumed = run(None, server=server, checkpointStore=store)
+        finally:
+            server.stop()
+            shutil.rmtree(checkpointFolder, ignore_errors=True)
+
+        self.assertFalse(failed['succeeded'])
+        self.assertGreater(len(emittedIds), 0)
+        self.assertEqual(failed['count'], len(emittedIds))
+        self.assertTrue(resumed['succeeded'], resumed['retCode'])
+        self.assertEqual(resumed['endpoints'].get('me/feed', 0), 0)
+        self.assertEqual(len(emittedIds) + resumed['count'], resumed['expectedCount'])
+
+    def test_GetData_GivenPageKeepsFailing_GiveUpWithinMaxTotalDelay(self):
+        from SnsManager import ErrorCode
+        from SnsManager.facebook import FbExporter
+        from SnsManager.RetryPolicy import RetryPolicy
+
+        server = FakeGraphServer(feedSize=50, failApis=['feed']).start()
+        tmpFolder = tempfile.mkdtemp()
+        retryPolicy = RetryPolicy(maxRetries=100, baseDelay=0.1, maxDelay=0.1, maxTotalDelay=0.5, jitter=0)
+        try:
+            with FbExporter(accessToken='token', graphUri=server.graphUri, tmpFolder=tmpFolder, retryPolicy=retryPolicy) as exporter:
+                startTime = time.time()
+                retDict = exporter.getData(since=None, until=UNTIL)
+                wallTime = time.time() - startTime
+            self.assertTrue(ErrorCode.IS_FAILED(retDict['retCode']))
+            self.assertLess(wallTime, 2.0)
+            self.assertLessEqual(server.stats()['endpoints'].get('me/feed', 0), 6)
+        finally:
+            server.stop()
+            shutil.rmtree(tmpFolder, ignore_errors=True)
+
+    def test_GetData_GivenParallelCrawlFailed_StopOtherCrawls(self):
+        from SnsManager import ErrorCode
+        from SnsManager.facebook import FbExporter
+        from SnsManager.RetryPolicy import RetryPolicy
+
+        server = FakeGraphServer(feedSize=500, pageSize=10, latency=0.01, failApis=['feed']).start()
+        tmpFolder = tempfile.mkdtemp()
+        threadCount = workerThreads()
+        try:
+            with FbExporter(accessToken='token', graphUri=server.graphUri, tmpFolder=tmpFolder, retryPolicy=RetryPolicy(maxRetries=0)) as exporter:
+                retDict = exporter.getData(since=None, until=UNTIL, parallelCrawl=True)
+                requests = server.stats()['requests']
+                time.sleep(0.2)
+                self.assertEqual(server.stats()['requests'], requests)
+            self.assertTrue(ErrorCode.IS_FAILED(retDict['retCode']))
+            self.assertLess(server.stats()['endpoints'].get('me/statuses', 0), len(server.apiItems['statuses']) / server.pageSize)
+            self.assertLessEqual(workerThreads(), threadCount)
+        finally:
+            server.stop()
+            shutil.rmtree(tmpFolder, ignore_errors=True)
+
+    def test_GetData_GivenParallelCrawlFailedDuringRetryWait_StopWaiting(self):
+        from SnsManager import ErrorCode
+        from SnsManager.facebook import FbExporter
+        from SnsManager.RetryPolicy import RetryPolicy
+
+        server = FakeGraphServer(feedSize=500, pageSize=10, latency=0.02, failApis=['statuses']).start()
+
+        class RetryFirstFailure(RetryPolicy):
+            """
+            Retry only the first failure, of statuses, after a long wait, feed fails meanwhile and gives up which cancels the run
+            """
+            def __init__(self):
+                super(RetryFirstFailure, self).__init__(maxRetries=1, baseDelay=5.0, maxDelay=5.0, maxTotalDelay=None, jitter=0)
+                self._retried = threading.Event()
+
+            def shouldRetry(self, errorCode, retryCount):
+                if self._retried.is_set():
+                    return False
+                self._retried.set()
+                return True
+
+            def wait(self, *args, **kwargs):
+                server.failApis.add('feed')
+                return super(RetryFirstFailure, self).wait(*args, **kwargs)
+
+        tmpFolder = tempfile.mkdtemp()
+        try:
+            with FbExporter(accessToken='token', graphUri=server.graphUri, tmpFolder=tmpFolder, retryPolicy=RetryFirstFailure()) as exporter:
+                startTime = time.time()
+                retDict = exporter.getData(since=None, until=UNTIL, parallelCrawl=True)
+                wallTime = time.time() - startTime
+            self.assertTrue(ErrorCode.IS_FAILED(retDict['retCode']))
+            self.assertLess(wallTime, 2.0)
+        finally:
+            server.stop()
+            shutil.rmtree(tmpFolder, ignore_errors=True)
+
+if __name__ == '__main__':
+    if '--shape' in sys.argv:
+        print json.dumps(run(SHAPES[sys.argv[sys.argv.index('--shape') + 1]]))
+        sys.stdout.flush()
+        # Python 2 daemon threads may raise while the interpreter is torn down
+        os._exit(0)
+
+    print '%-16s %8s %8s %9s %9s %10s %10s %8s' % ('shape', 'records', 'photos', 'requests', 'wall s', 'bytes KB', 'peak MB', 'errors')
+    for shape in sorted(SHAPES):
+        result = runIsolated(shape)
+        print '%-16s %8d %8d %9d %9.2f %10.1f %10.1f %8d' % (
+            shape,
+            result['count'],
+            result['photos'],
+            result['requests'],
+            result['wallTime'],
+            result['bytes'] / 1024.0,
+            result['peakRss'] / 1024.0,
+            result['injectedErrors'],
+        )
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    bench_FbParsers.py - Microbenchmark of FbExporter parsers with recorded Graph API fixtures
+
+    Items of tests/fixtures/fb_<api>.json are fed through the parser each of them is routed to,
+    with Graph API lookups answered from tests/fixtures/fb_objects.json and photo downloads stubbed,
+    so only the parsing work is measured.
+
+    Throughput is stored relative to a reference workload measured in the same run,
+    so that the baseline is comparable across machines.
+    Run it directly to print items per second, or with --update-baseline to record a new baseline
+    from the median of BASELINE_RUNS runs.
+"""
+import sys, os.path
+# Hack for import module in grandparent folder
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+import gc
+import json
+import time
+import threading
+import collections
+import timeit
+import urlparse
+import subprocess
+import unittest
+from SnsManager.facebook import FbExporter
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+BASELINE_PATH = os.path.join(FIXTURES_DIR, 'fb_parsers_baseline.json')
+MY_ID = '100001'
+# Non-feed APIs and the parser of their items
+API_PARSERS = [
+    ('statuses', '_dataParserStatus'),
+    ('checkins', '_dataParserCheckin'),
+    ('links', '_dataParserLink'),
+    ('notes', '_dataParserNote'),
+]
+# Fail when throughput is lower than baseline by more than this fraction, BENCH_MAX_REGRESSION overrides it
+MAX_REGRESSION = float(os.environ.get('BENCH_MAX_REGRESSION', 0.3))
+# Seconds of one measurement, the best of REPEAT measurements is taken
+MIN_TIME = 0.2
+REPEAT = 3
+# Runs of bench() a baseline is the median of
+BASELINE_RUNS = 3
+
+def loadFixture(name):
+    with open(os.path.join(FIXTURES_DIR, name)) as fp:
+        return json.load(fp)
+
+class FixtureResponse(object):
+    def __init__(self, status, data):
+        self.status = status
+        self.data = data
+        self.headers = {}
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def read(self, *args):
+        data, self.data = self.data, ''
+        return data
+
+    def release_conn(self):
+        pass
+
+    def close(self):
+        pass
+
+class FixtureHttpClient(object):
+    """
+    Stand-in of HttpClient which answers Graph API requests from fb_objects.json
+    """
+    def __init__(self, fixture, latency=0):
+        self._objects = fixture['objects']
+        self._albumPhotos = fixture['albumPhotos']
+        self._tagPage = fixture['tagPage']
+        self._latency = latency
+        self.requests = 0
+        # Requests of every Graph path, sub-requests of batches included
+        self.paths = collections.Counter()
+
+    def setHostPoolSize(self, host, poolSize):
+        pass
+
+    def urlopen(self, method, url, body=None, **kwargs):
+        self.requests += 1
+        if self._latency:
+            time.sleep(self._latency)
+        if method == 'POST':
+            batch = json.loads(urlparse.parse_qs(body)['batch'][0])
+            return FixtureResponse(200, json.dumps([
+                dict(zip(('code', 'body'), self._get(request['relative_url']))) for request in batch
+            ]))
+        return FixtureResponse(*self._get(url))
+
+    request = urlopen
+
+    def _get(self, url):
+        splitted = urlparse.urlsplit(url)
+        query = dict((k, v[0]) for k, v in urlparse.parse_qs(splitted.query).iteritems())
+        parts = splitted.path.strip('/').split('/')
+        self.paths[splitted.path.strip('/')] += 1
+        if parts[-1] == 'photos' and parts[0] in self._albumPhotos:
+            offset = int(query.get('offset', 0))
+            photoIds = self._albumPhotos[parts[0]][offset:offset + int(query.get('limit', 25))]
+            return 200, json.dumps({'data': [self._objects[photoId] for photoId in photoIds]})
+        if parts[-1] in ('tags', 'with_tags'):
+            return 200, json.dumps(self._tagPage)
+        if parts[0] in self._objects:
+            return 200, json.dumps(self._objects[parts[0]])
+        return 400, json.dumps({'error': {'message': 'Unsupported get request.', 'type': 'GraphMethodException', 'code': 100}})
+
+    def stats(self):
+        return {}
+
+    def clear(self):
+        pass
+
+class FixturePhotoStore(object):
+    """
+    Stand-in of PhotoStore which regards every photo as stored
+    """
+    def fetch(self, fileUri, download):
+        return os.path.join('/fixtures/photos', os.path.basename(urlparse.urlsplit(fileUri).path))
+
+def makeExporter(latency=0):
+    exporter = FbExporter(accessToken='token', myId=MY_ID, myName='Alice Chen', photoStore=FixturePhotoStore())
+    exporter._httpConn = FixtureHttpClient(loadFixture('fb_objects.json'), latency)
+    # getData() sets it for every run
+    exporter._setFbPhotoSizeType(exporter.FB_PHOTO_SIZE_TYPE_MAXIMUM)
+    return exporter
+
+def makeCases(exporter):
+    """
+    List of (name, function of items, items) to measure
+    """
+    def parserCase(handler, parserName, isFeedApi):
+        parser = getattr(handler, parserName)
+        def run(items):
+            records = [record for record in (parser(data, isFeedApi) for data in items) if record]
+            exporter._resolvePhotos(records)
+            return records
+        return run
+
+    feedPage = loadFixture('fb_feed.json')
+    feedHandler = exporter.FbApiHandlerFeed(outerObj=exporter, data=feedPage)
+    groups = {}
+    for data in feedPage['data']:
+        parser = feedHandler._dataParserFactory(data)
+        if parser:
+            groups.setdefault(parser.__name__, []).append(data)
+
+    cases = [('feed/_dataParserFactory', lambda items: [feedHandler._dataParserFactory(data) for data in items], feedPage['data'])]
+    for parserName in sorted(groups):
+        cases.append(('feed/{0}'.format(parserName), parserCase(feedHandler, parserName, True), groups[parserName]))
+    for api, parserName in API_PARSERS:
+        page = loadFixture('fb_{0}.json'.format(api))
+        handler = exporter._apiHandlerFactory(api)(outerObj=exporter, data=page)
+        cases.append(('{0}/{1}'.format(api, parserName), parserCase(handler, parserName, False), page['data']))
+    # The whole page, including classification and batched lookups of _preparePage()
+    cases.append(('feed/parse', lambda items: exporter.FbApiHandlerFeed(outerObj=exporter, data=feedPage).parse()[0], feedPage['data']))
+    return cases
+
+def reference(items):
+    """
+    Reference workload which throughput of parsers is relative to
+    """
+    return [json.loads(json.dumps(data)) for data in items]
+
+def measure(func, items):
+    """
+    Items per second, the best of REPEAT measurements after a warm-up call which fills lookup caches
+
+    Garbage collection is disabled while measuring as timeit does,
+    otherwise its cost depends on objects left by whatever ran before in the process.
+    """
+    func(items)
+    best = 0.0
+    gcEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in xrange(REPEAT):
+            rounds = 0
+            startTime = timeit.default_timer()
+            while True:
+                func(items)
+                rounds += 1
+                elapsed = timeit.default_timer() - startTime
+                if elapsed >= MIN_TIME:
+                    break
+            best = max(best, rounds * len(items) / elapsed)
+    finally:
+        if gcEnabled:
+            gc.enable()
+    return best
+
+def bench():
+    """
+    Throughput of every case
+
+    Out:
+        {
+            'reference': 12000.0,                       # items per second of reference()
+            'parsers': {
+                'feed/_dataParserStatus': {
+                    'itemsPerSec': 30000.0,
+                    'relative': 2.5,                    # itemsPerSec / reference measured right before it
+                }, ...
+            },
+        }
+    """
+    referenceItems = loadFixture('fb_feed.json')['data']
+    referenceIps = []
+    parsers = {}
+    with makeExporter() as exporter:
+        for name, func, items in makeCases(exporter):
+            # Measure the reference next to every case, so that both see the same machine load
+            referenceIps.append(measure(reference, referenceItems))
+            itemsPerSec = measure(func, items)
+            parsers[name] = {
+                'itemsPerSec': itemsPerSec,
+                'relative': itemsPerSec / referenceIps[-1],
+            }
+    return {'reference': median(referenceIps), 'parsers': parsers}
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def benchIsolated():
+    """
+    bench() in a new interpreter, which is not slowed down by threads and objects left by other tests
+    """
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--json'])
+    return json.loads(output.strip().splitlines()[-1])
+
+def loadBaseline():
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH) as fp:
+        return json.load(fp)
+
+def saveBaseline(results):
+    """
+    Save the median relative throughput of every case in results of bench()
+    """
+    baseline = dict((name, round(median([result['parsers'][name]['relative'] for result in results]), 4)) for name in results[0]['parsers'])
+    with open(BASELINE_PATH, 'w') as fp:
+        json.dump(baseline, fp, indent=4, sort_keys=True, separators=(',', ': '))
+        fp.write('\n')
+
+class BenchFbParsers(unittest.TestCase):
+    def test_Parsers_GivenFixtures_ReturnRecords(self):
+        with makeExporter() as exporter:
+            for name, func, items in makeCases(exporter):
+                records = func(items)
+                self.assertTrue(records, name)
+                if name.endswith('/_dataParserFactory'):
+                    continue
+                for record in records:
+                    self.assertTrue(record['id'].startswith(MY_ID + '_'), name)
+                    self.assertTrue(all(photo.startswith('/fixtures/photos/') for photo in record['photos']), name)
+
+    def test_GraphObjects_GivenConcurrentParsers_RetrievedOnce(self):
+        with makeExporter(latency=0.01) as exporter:
+            cases = dict((name, (func, items)) for name, func, items in makeCases(exporter))
+            threads = []
+            for name in ['feed/_dataParserTagPhoto', 'feed/_dataParserPhoto', 'feed/_dataParserCheckin', 'checkins/_dataParserCheckin'] * 2:
+                func, items = cases[name]
+                threads.append(threading.Thread(target=func, args=(items,)))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        objectPaths = dict((path, count) for path, count in exporter._httpConn.paths.iteritems() if '/' not in path)
+        self.assertTrue(objectPaths)
+        self.assertEqual([path for path, count in objectPaths.iteritems() if count > 1], [])
+        self.assertGreater(exporter.getGraphObjectStats()['waits'], 0)
+
+    def test_Throughput_GivenBaseline_NoRegression(self):
+        baseline = loadBaseline()
+        if not baseline:
+            self.skipTest('No baseline, run bench_FbParsers.py --update-baseline')
+        result = benchIsolated()
+        regressions = []
+        for name, relative in sorted(baseline.iteritems()):
+            if name not in result['parsers']:
+                continue
+            current = result['parsers'][name]['relative']
+            if current < relative * (1 - MAX_REGRESSION):
+                regressions.append('{0}: {1:.1f}% of baseline'.format(name, current / relative * 100))
+        self.assertEqual(regressions, [])
+
+if __name__ == '__main__':
+    if '--json' in sys.argv:
+        print json.dumps(bench())
+        sys.stdout.flush()
+        # Python 2 daemon threads may raise while the interpreter is torn down
+        os._exit(0)
+
+    result = bench()
+    baseline = loadBaseline()
+    print '%-36s %12s %10s %10s' % ('parser', 'items/sec', 'relative', 'baseline')
+    print '%-36s %12.0f %10.3f %10s' % ('(reference)', result['reference'], 1.0, '-')
+    for name, value in sorted(result['parsers'].iteritems()):
+        print '%-36s %12.0f %10.3f %10s' % (
+            name,
+            value['itemsPerSec'],
+            value['relative'],
+            '%.0f%%' % (value['relative'] / baseline[name] * 100) if name in baseline else '-',
+        )
+    if '--update-baseline' in sys.argv:
+        saveBaseline([result] + [bench() for i in xrange(BASELINE_RUNS - 1)])
+        print 'Baseline saved to {0}'.format(BASELINE_PATH)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    bench_ImportTime.py - Cold-start import cost of every provider, each measured in a fresh interpreter
+"""
+import sys, os.path
+# Hack for import module in grandparent folder
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+import json
+import subprocess
+import unittest
+
+PROVIDERS = [
+    ('SnsManager', 'ErrorCode'),
+    ('SnsManager.facebook', 'FbExporter'),
+    ('SnsManager.instagram', 'InstaExporter'),
+    ('SnsManager.twitter', 'TwitterExporter'),
+    ('SnsManager.foursquare', 'FourSquareExporter'),
+    ('SnsManager.google', 'GoogleBase'),
+]
+# Dependencies which should only be loaded when an exporter is used
+HEAVY_MODULES = ['lxml', 'dateutil', 'urllib3', 'tweepy', 'instagram', 'foursquare', 'apiclient', 'oauth2client', 'httplib2', 'libgreader']
+
+_SCRIPT = """
+import sys, time, json
+startTime = time.time()
+import {package}
+packageTime = time.time() - startTime
+packageModules = sorted(name for name in {heavyModules!r} if name in sys.modules)
+startTime = time.time()
+try:
+    getattr({package}, '{export}')
+    exportError = None
+except ImportError as e:
+    exportError = str(e)
+exportTime = time.time() - startTime
+print json.dumps({{
+    'packageTime': packageTime,
+    'exportTime': exportTime,
+    'exportError': exportError,
+    'packageModules': packageModules,
+    'exportModules': sorted(name for name in {heavyModules!r} if name in sys.modules),
+}})
+"""
+
+def measure(package, export):
+    """
+    Import package then its export in a new interpreter, return timings and loaded heavy modules
+    """
+    rootDir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+    script = _SCRIPT.format(package=package, export=export, heavyModules=HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=rootDir)
+    return json.loads(output.strip().splitlines()[-1])
+
+class BenchImportTime(unittest.TestCase):
+    def test_ImportPackage_GivenEveryProvider_NoHeavyModules(self):
+        for package, export in PROVIDERS:
+            result = measure(package, export)
+            self.assertEqual(result['packageModules'], [], package)
+
+    def test_ImportExport_GivenFacebook_NoLxml(self):
+        result = measure('SnsManager.facebook', 'FbExporter')
+        self.assertIsNone(result['exportError'])
+        self.assertNotIn('lxml', result['exportModules'])
+
+if __name__ == '__main__':
+    print '%-24s %12s %12s  %s' % ('package', 'package ms', 'export ms', 'heavy modules loaded by export')
+    for package, export in PROVIDERS:
+        result = measure(package, export)
+        print '%-24s %12.1f %12.1f  %s' % (
+            package,
+            result['packageTime'] * 1000,
+            result['exportTime'] * 1000,
+            result['exportError'] or ', '.join(result['exportModules']) or '-',
+        )
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    bench_PhotoStore.py - Concurrent PhotoStore.fetch of the same and of different URLs
+"""
+import sys, os.path
+# Hack for import module in grandparent folder
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from SnsManager.PhotoStore import PhotoStore
+
+# Fetches of other URLs while one download hangs, enough that some of them shared a lock stripe with it
+OTHER_URLS = 300
+
+def fakeDownload(fileUri, filePath):
+    with open(filePath, 'wb') as fp:
+        fp.write(fileUri)
+    return True
+
+class BenchPhotoStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = PhotoStore(folder=self.folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_Fetch_GivenSameUrlConcurrently_DownloadOnce(self):
+        downloads = []
+        def slowDownload(fileUri, filePath):
+            downloads.append(fileUri)
+            time.sleep(0.1)
+            return fakeDownload(fileUri, filePath)
+
+        paths = []
+        threads = [threading.Thread(target=lambda: paths.append(self.store.fetch('http://cdn/1_n.jpg', slowDownload))) for i in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(downloads), 1)
+        self.assertEqual(len(set(paths)), 1)
+        self.assertTrue(os.path.isfile(paths[0]))
+        self.assertEqual(self.store.stats(), {'hits': 3, 'misses': 1, 'duplicates': 0})
+
+    def test_Fetch_GivenDownloadHanging_OtherUrlsGoOn(self):
+        started = threading.Event()
+        release = threading.Event()
+        def hangingDownload(fileUri, filePath):
+            started.set()
+            release.wait()
+            return fakeDownload(fileUri, filePath)
+
+        thread = threading.Thread(target=self.store.fetch, args=('http://cdn/hanging_n.jpg', hangingDownload))
+        thread.start()
+        try:
+            started.wait()
+            fetched = []
+            worker = threading.Thread(target=lambda: fetched.extend(self.store.fetch('http://cdn/{0}_n.jpg'.format(i), fakeDownload) for i in xrange(OTHER_URLS)))
+            worker.daemon = True
+            worker.start()
+            worker.join(5.0)
+            self.assertEqual(len(fetched), OTHER_URLS)
+        finally:
+            release.set()
+            thread.join()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    bench_TimeCodec.py - Microbenchmark of TimeCodec.parseTime against dateutil
+"""
+import sys, os.path
+# Hack for import module in grandparent folder
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+import timeit
+import unittest
+from dateutil import parser as dateParser
+from SnsManager.TimeCodec import parseTime
+
+SAMPLES = [
+    '2012-08-21T09:03:44+0000',
+    '2012-08-21T17:03:44+0800',
+    '2012-08-21T09:03:44Z',
+    '2012-08-21T09:03:44.123456-0330',
+]
+ROUNDS = 20000
+# Both parsers are timed in turns this many times and the fastest of each is compared, so a load spike hits both
+REPEATS = 5
+# Timing assertions are skipped if BENCH_SKIP_TIMING is set, e.g. on shared CI machines
+SKIP_TIMING = bool(os.environ.get('BENCH_SKIP_TIMING', ''))
+
+class BenchTimeCodec(unittest.TestCase):
+    def test_ParseTime_GivenGraphFormat_EqualDateutil(self):
+        for sample in SAMPLES:
+            self.assertEqual(parseTime(sample), dateParser.parse(sample))
+            self.assertEqual(parseTime(sample).utcoffset(), dateParser.parse(sample).utcoffset())
+
+    def test_ParseTime_GivenOtherFormat_FallbackDateutil(self):
+        sample = 'Tue, 21 Aug 2012 09:03:44 +0000'
+        self.assertEqual(parseTime(sample), dateParser.parse(sample))
+
+    def test_ParseTime_GivenGraphFormat_FasterThanDateutil(self):
+        if SKIP_TIMING:
+            self.skipTest('BENCH_SKIP_TIMING is set')
+        fastTime, dateutilTime = bench(ROUNDS // 100)
+        self.assertLess(fastTime, dateutilTime)
+
+def bench(rounds=ROUNDS):
+    """
+    Seconds of rounds calls of parseTime and dateutil on SAMPLES, the fastest of REPEATS turns each
+    """
+    fastTimes = []
+    dateutilTimes = []
+    for i in xrange(REPEATS):
+        fastTimes.append(timeit.timeit(lambda: [parseTime(sample) for sample in SAMPLES], number=rounds))
+        dateutilTimes.append(timeit.timeit(lambda: [dateParser.parse(sample) for sample in SAMPLES], number=rounds))
+    return min(fastTimes), min(dateutilTimes)
+
+if __name__ == '__main__':
+    fastTime, dateutilTime = bench(ROUNDS // REPEATS)
+    count = ROUNDS // REPEATS * len(SAMPLES)
+    print 'parseTime          %8.2f us/call' % (fastTime / count * 1e6)
+    print 'dateutil.parse     %8.2f us/call' % (dateutilTime / count * 1e6)
+    print 'speedup            %8.1fx' % (dateutilTime / fastTime)